@@ -0,0 +1,621 @@
+"""Streamlit-free analysis core shared by the web app and the command line.
+
+Prompt templates, LLM calls and the analysis pipeline live here. Nothing in
+this module touches ``st.session_state``: the caller passes in conversation
+history, the follow-up context mode and a progress indicator, and LLM errors
+are raised instead of being rendered.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+
+from dotenv import load_dotenv
+
+from log_pipeline import submit as submit_log
+from metrics import span
+from single_flight import single_flight, fingerprint
+from scheduler import is_timeout, is_unreachable, INTERACTIVE, BULK
+from model_router import router, INITIAL_ANALYSIS, FOLLOW_UP, GENERAL_QUESTION
+# LangChain and the HTTP stack are imported lazily by llm_client on the first LLM call
+from llm_client import DEFAULT_TEMPERATURE
+from llm_backends import get_backends, get_backend, NO_BACKEND_MESSAGE
+from response_cache import get_response_cache, make_cache_key
+from chunking import estimate_tokens, outline, CHARS_PER_TOKEN
+from retrieval import relevant_snippets
+from static_analysis import build_index, summarize, compact_source, code_hash
+from map_reduce import (
+    prompt_budget, needs_map_reduce, map_analysis, map_question, REDUCE_ANALYSIS_PROMPT, REDUCE_QUESTION_PROMPT
+)
+from incremental import (
+    diff_units, unit_notes, change_prompt_kwargs, worth_incremental, CHANGE_ANALYSIS_PROMPT
+)
+
+
+load_dotenv()
+# Coalesce identical concurrent LLM requests across sessions into one upstream call
+SINGLE_FLIGHT = os.getenv('SINGLE_FLIGHT', '1') == '1'
+
+logger = logging.getLogger('CodeWizard')
+
+
+def log_event(event_type: str, content: str, metadata: dict = None):
+    """Structured logging function for all events"""
+    try:
+        submit_log({
+            'event_type': event_type,
+            'content': content,
+            'timestamp': datetime.now().isoformat(),
+            'metadata': metadata or {}
+        })
+    except Exception as e:
+        logger.error(f"Logging error: {str(e)}")
+
+
+# Shared by single-snippet and batch analysis so both hit the same cache entries
+INITIAL_ANALYSIS_PROMPT = """
+                As a coding expert, analyze this code:
+                
+                ```
+                {code}
+                ```
+                
+                Provide a detailed yet engaging analysis including:
+                1. 🎯 Overview of what the code does
+                2. 🔍 Key components and their functionality
+                3. 💡 Notable programming concepts used
+                4. ⚡ Performance considerations
+                5. 🛡️ Security considerations if applicable
+                6. ✨ Potential improvements and best practices
+                
+                Make your explanation clear, engaging, and actionable, using emojis and formatting to enhance readability.
+                """
+
+# Used instead of the raw code once the code passes COMPACT_PROMPT_TOKENS
+COMPACT_ANALYSIS_PROMPT = """
+                As a coding expert, analyze this code.
+                
+                Structure of the code:
+                {structure}
+                
+                Code (comments and blank lines removed):
+                ```
+                {code}
+                ```
+                
+                Provide a detailed yet engaging analysis including:
+                1. 🎯 Overview of what the code does
+                2. 🔍 Key components and their functionality
+                3. 💡 Notable programming concepts used
+                4. ⚡ Performance considerations
+                5. 🛡️ Security considerations if applicable
+                6. ✨ Potential improvements and best practices
+                
+                Make your explanation clear, engaging, and actionable, using emojis and formatting to enhance readability.
+                """
+COMPACT_PROMPT_TOKENS = int(os.getenv('COMPACT_PROMPT_TOKENS', '4000'))
+
+# Sectioned mode: each section of an initial analysis is its own request, all of them running concurrently
+ANALYSIS_SECTIONS = [
+    ('overview', '🎯 Overview', "what the code does, its purpose, inputs and outputs"),
+    ('components', '🔍 Key components', "the main functions and classes, what each does and how they fit together"),
+    ('concepts', '💡 Programming concepts', "notable programming concepts, patterns and language features used"),
+    ('performance', '⚡ Performance', "performance characteristics, bottlenecks and algorithmic complexity"),
+    ('security', '🛡️ Security', "security concerns such as input validation, injection and secret handling "
+                               "(say so briefly if there are none)"),
+    ('improvements', '✨ Improvements', "concrete improvements and best practices, most important first"),
+]
+SECTION_PROMPT = """
+                As a coding expert, you are writing one section of an analysis of this code:
+                {structure}
+                ```
+                {code}
+                ```
+                
+                Write only the "{title}" section, covering {focus}.
+                Start with the heading "### {title}". Keep it focused and actionable, using emojis and formatting to enhance readability.
+                """
+# Sections still running after this many seconds are reported as timed out and don't hold up the rest
+SECTION_TIMEOUT = float(os.getenv('SECTION_TIMEOUT', '90'))
+# Threads for analyze_code_async (batch analysis); callers bound their own concurrency
+ASYNC_ANALYSIS_WORKERS = int(os.getenv('ASYNC_ANALYSIS_WORKERS', '32'))
+
+# Follow-up prompt for the "Relevant snippets" context mode
+RETRIEVAL_QUESTION_PROMPT = """
+            Question about the code.
+            
+            Outline of the whole file:
+            {outline}
+            
+            Most relevant parts of the code:
+            ```
+            {snippets}
+            ```
+            
+            Question: {query}
+            
+            Previous context:
+            {context}
+            
+            Provide a focused, clear answer with relevant code references and examples where applicable.
+            Use emojis and formatting to make the explanation more engaging.
+            """
+# Below this size the whole file is cheaper than retrieval and gives the best answers
+RETRIEVAL_MIN_TOKENS = int(os.getenv('RETRIEVAL_MIN_TOKENS', '1500'))
+
+FOLLOW_UP_PROMPT = """
+                Question about the code:
+                ```
+                {code}
+                ```
+            
+                Question: {query}
+            
+                Previous context:
+                {context}
+            
+                Provide a focused, clear answer with relevant code references and examples where applicable.
+                Use emojis and formatting to make the explanation more engaging.
+                """
+
+GENERAL_QUESTION_PROMPT = (
+    "Answer this programming question:\nQuestion: {query}\n\n"
+    "Provide a clear, comprehensive answer with examples where applicable.\n"
+    "Use emojis and formatting to make the explanation engaging."
+)
+
+# Number of previous messages sent along with a follow-up question
+CONTEXT_MESSAGES = 3
+
+
+def require_backend():
+    if not get_backends():
+        raise RuntimeError(NO_BACKEND_MESSAGE)
+
+
+def _fall_back(model, start: float, error: Exception, can_fall_back: bool, task: str) -> bool:
+    """Record a failed attempt; True when the next candidate model should be tried"""
+    timeout = is_timeout(error)
+    unreachable = is_unreachable(error)
+    router.record(model.name, (time.perf_counter() - start) * 1000, ok=False, timeout=timeout)
+    if not (can_fall_back and (timeout or unreachable)):
+        return False
+    router.record_fallback()
+    log_event("model_fallback", f"{model.name} {'timed out' if timeout else 'is unreachable'}, trying the next model",
+              {"task": task, "model": model.name, "backend": model.backend})
+    return True
+
+
+def _routed_invoke(prompt_template: str, kwargs: dict, task: str, priority: int, prompt_tokens: int, served: dict):
+    """Invoke the best model for the task, moving on to the next candidate when it times out"""
+    candidates = router.route(task, prompt_tokens)
+    timeout = router.policy(task).timeout_s
+    for i, model in enumerate(candidates):
+        last = i == len(candidates) - 1
+        backend = get_backend(model.backend)
+        chain = backend.chain(prompt_template, model.name, model.temperature, backend.request_timeout(timeout))
+        start = time.perf_counter()
+        try:
+            # Timeouts are not retried on the same model while another one is left to try
+            content = backend.run(lambda: chain.invoke(kwargs).content, priority, prompt_tokens,
+                                  retry_timeouts=last)
+        except Exception as e:
+            if _fall_back(model, start, e, not last, task):
+                continue
+            raise
+        router.record(model.name, (time.perf_counter() - start) * 1000, ok=True)
+        served['model'] = model.name
+        return content
+
+
+def _routed_stream(prompt_template: str, kwargs: dict, task: str, priority: int, prompt_tokens: int, served: dict):
+    """Stream from the best model for the task; falls back only if nothing was received yet"""
+    candidates = router.route(task, prompt_tokens)
+    timeout = router.policy(task).timeout_s
+    for i, model in enumerate(candidates):
+        last = i == len(candidates) - 1
+        backend = get_backend(model.backend)
+        chain = backend.chain(prompt_template, model.name, model.temperature, backend.request_timeout(timeout))
+        start = time.perf_counter()
+        started = False
+        try:
+            for content in backend.stream(
+                lambda: (chunk.content for chunk in chain.stream(kwargs) if chunk.content),
+                priority, prompt_tokens, retry_timeouts=last
+            ):
+                started = True
+                served['model'] = model.name
+                yield content
+        except Exception as e:
+            if _fall_back(model, start, e, not last and not started, task):
+                continue
+            raise
+        router.record(model.name, (time.perf_counter() - start) * 1000, ok=True)
+        return
+
+
+def stream_llm_response(start_stream, prompt_tokens: int, flight_key: str = None, served: dict = None):
+    """Yield response tokens from ``start_stream()`` as they arrive; the generator returns the full text"""
+    start = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    served = served if served is not None else {}
+
+    # The span marks a stream that fails part-way with ``error``, like a failed llm_invoke
+    with span("llm_stream", prompt_tokens=prompt_tokens) as s:
+        try:
+            chunks = single_flight.stream(flight_key, start_stream) if flight_key else start_stream()
+            for content in chunks:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                parts.append(content)
+                yield content
+        finally:
+            response_chars = sum(len(part) for part in parts)
+            s.set(
+                ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None,
+                chunks=len(parts),
+                model=served.get('model'),
+                response_chars=response_chars,
+                response_tokens=response_chars // CHARS_PER_TOKEN + 1
+            )
+    return "".join(parts)
+
+
+def iter_text(text: str):
+    """Wrap an already available response so it can be consumed like a stream"""
+    yield text
+    return text
+
+
+def get_llm_response(prompt_template: str, stream: bool = False, priority: int = INTERACTIVE,
+                     task: str = FOLLOW_UP, served: dict = None, **kwargs):
+    """Get response from LLM using the new LangChain syntax.
+
+    With stream=True a generator of text chunks is returned instead of the full string.
+    Requests go through the shared scheduler; pass priority=BULK for work nobody is waiting on interactively.
+    The model, and with it the backend, is picked by the router for ``task`` (see model_router). Its name
+    is put in ``served['model']`` once known (after the stream ends for streams); a request coalesced into
+    an identical one in flight leaves it unset.
+    """
+    require_backend()
+
+    with span("prompt_build", task=task) as s:
+        prompt_chars = len(prompt_template) + sum(len(str(value)) for value in kwargs.values())
+        s.set(prompt_chars=prompt_chars, prompt_tokens=prompt_chars // CHARS_PER_TOKEN + 1)
+    prompt_tokens = s.attrs["prompt_tokens"]
+    # Keyed by task rather than model: any model the router picks can serve identical requests
+    flight_key = fingerprint(prompt_template, task, DEFAULT_TEMPERATURE, kwargs) if SINGLE_FLIGHT else None
+    served = served if served is not None else {}
+    if stream:
+        return stream_llm_response(
+            lambda: _routed_stream(prompt_template, kwargs, task, priority, prompt_tokens, served),
+            prompt_tokens, flight_key, served
+        )
+
+    with span("llm_invoke", task=task, prompt_tokens=prompt_tokens) as s:
+        def invoke():
+            return _routed_invoke(prompt_template, kwargs, task, priority, prompt_tokens, served)
+        content = single_flight.do(flight_key, invoke) if flight_key else invoke()
+        s.set(model=served.get('model'), response_chars=len(content), response_tokens=estimate_tokens(content))
+    return content
+
+
+def routed_model(task: str, prompt_tokens: int) -> str:
+    """The model a request for ``task`` would be routed to now.
+
+    Responses are cached under the model that served them and looked up under this one, so an answer from a
+    fallback or local model is never handed out as the primary model's.
+    """
+    return router.route(task, prompt_tokens)[0].name
+
+
+def _cache_key(code: str, prompt_template: str, variant, model: str) -> str:
+    return make_cache_key(code, prompt_template, variant, model, DEFAULT_TEMPERATURE)
+
+
+def _store(cache, code: str, prompt_template: str, variant, served: dict):
+    """Callback caching a response under the model that served it"""
+    def store(response):
+        if response and served.get('model'):
+            cache.set(_cache_key(code, prompt_template, variant, served['model']), response)
+    return store
+
+
+def _cache_stream(stream, store):
+    """Pass a response stream through and hand the full text to ``store`` once it completes"""
+    response = yield from stream
+    store(response)
+    return response
+
+
+def _initial_prompt_tokens(code: str) -> int:
+    # Larger code is compacted or map-reduced, and those prompts stay under the map-reduce limit
+    return min(estimate_tokens(INITIAL_ANALYSIS_PROMPT + code), prompt_budget())
+
+
+def _invoker(task: str):
+    """An ``invoke`` for map_reduce.invoke_all: one routed call returning its text and the model that served it"""
+    def invoke(prompt_template: str, kwargs: dict, priority: int):
+        served = {}
+        text = get_llm_response(prompt_template, priority=priority, task=task, served=served, **kwargs)
+        return text, served.get('model')
+    return invoke
+
+
+def _map_reduce_response(reduce_template: str, stream: bool, priority: int, task: str, progress, map_step, *args,
+                         served: dict = None):
+    """Run a map step over code chunks in parallel, then reduce the partial results with the LLM"""
+    start = time.perf_counter()
+    with progress("🧩 Large file detected, analyzing it in parts..."):
+        reduce_kwargs = map_step(*args)
+    log_event("map_reduce", "Map step finished", {
+        "map_ms": round((time.perf_counter() - start) * 1000, 1),
+        "notes_length": len(reduce_kwargs["notes"])
+    })
+    return get_llm_response(reduce_template, stream=stream, priority=priority, task=task, served=served,
+                            **reduce_kwargs)
+
+
+def _initial_analysis(code: str, stream: bool, progress, served: dict):
+    """Single-prompt analysis, or map-reduce when the code exceeds the model context"""
+    if needs_map_reduce(code):
+        return _map_reduce_response(REDUCE_ANALYSIS_PROMPT, stream, BULK, INITIAL_ANALYSIS, progress,
+                                    map_analysis, code, _invoker(INITIAL_ANALYSIS), served=served)
+    index = build_index(code)
+    if index is not None and estimate_tokens(code) > COMPACT_PROMPT_TOKENS:
+        compact = compact_source(code)
+        log_event("compact_prompt", "Sending structural summary with compacted code", {
+            "code_length": len(code),
+            "compact_length": len(compact)
+        })
+        return get_llm_response(COMPACT_ANALYSIS_PROMPT, stream=stream, priority=BULK, task=INITIAL_ANALYSIS,
+                                served=served, structure=summarize(index), code=compact)
+    return get_llm_response(INITIAL_ANALYSIS_PROMPT, stream=stream, priority=BULK, task=INITIAL_ANALYSIS,
+                            served=served, code=code)
+
+
+def _incremental_analysis(code: str, previous_code: str, previous_analysis: str, stream: bool, use_cache: bool,
+                          progress):
+    """Re-analyze only the units changed since ``previous_code``; None when a full analysis is the better choice"""
+    diff = diff_units(previous_code, code)
+    if use_cache and diff.unchanged and not (diff.changed_units or diff.removed):
+        log_event("incremental_analysis", "Resubmitted code is unchanged, reusing the previous analysis",
+                  {"code_length": len(code)})
+        return iter_text(previous_analysis) if stream else previous_analysis
+    if not worth_incremental(diff, code, previous_analysis):
+        return None
+
+    cache = get_response_cache()
+    variant = code_hash(previous_code)
+    model = routed_model(INITIAL_ANALYSIS, estimate_tokens(CHANGE_ANALYSIS_PROMPT + previous_analysis))
+    response = cache.get(_cache_key(code, CHANGE_ANALYSIS_PROMPT, variant, model)) if use_cache else None
+    if response:
+        return iter_text(response) if stream else response
+
+    start = time.perf_counter()
+    with progress("🔄 Analyzing what changed..."):
+        notes, analyzed = unit_notes(diff.changed_units, code, _invoker(INITIAL_ANALYSIS), use_cache)
+    kwargs = change_prompt_kwargs(diff, notes, previous_analysis)
+    log_event("incremental_analysis", "Analyzing only the changed units", {
+        "units_added": len(diff.added),
+        "units_modified": len(diff.modified),
+        "units_removed": len(diff.removed),
+        "units_unchanged": len(diff.unchanged),
+        "units_analyzed": analyzed,
+        "changed_ratio": round(diff.changed_ratio(), 3),
+        "prompt_tokens": estimate_tokens(CHANGE_ANALYSIS_PROMPT + "".join(kwargs.values())),
+        "full_prompt_tokens": estimate_tokens(INITIAL_ANALYSIS_PROMPT + code),
+        "map_ms": round((time.perf_counter() - start) * 1000, 1)
+    })
+    served = {}
+    store = _store(cache, code, CHANGE_ANALYSIS_PROMPT, variant, served)
+    response = get_llm_response(CHANGE_ANALYSIS_PROMPT, stream=stream, priority=BULK, task=INITIAL_ANALYSIS,
+                                served=served, **kwargs)
+    if stream and response is not None:
+        return _cache_stream(response, store)
+    store(response)
+    return response
+
+
+@dataclass
+class SectionResult:
+    key: str
+    title: str
+    text: str = None
+    error: str = None
+    elapsed_ms: float = 0.0
+    cached: bool = False
+
+
+def iter_analysis_sections(code: str, use_cache: bool = True, timeout: float = SECTION_TIMEOUT):
+    """Generate the sections of an initial analysis concurrently and yield a SectionResult for each as it completes.
+
+    Wall-clock time is that of the slowest section instead of one long generation. A section that fails or is
+    still running after ``timeout`` seconds is yielded with an error; one still running is cached when it
+    finishes, for the next attempt. With use_cache=False sections are neither looked up nor stored.
+    Code too large for one prompt should use ``analyze_code`` (map-reduce).
+    """
+    require_backend()
+    index = build_index(code)
+    if index is not None and estimate_tokens(code) > COMPACT_PROMPT_TOKENS:
+        # Every section carries the code, so large files send the compacted form
+        code_kwargs = {
+            'structure': f"\nStructure of the code:\n{summarize(index)}\n\nCode (comments and blank lines removed):",
+            'code': compact_source(code)
+        }
+    else:
+        code_kwargs = {'structure': '', 'code': code}
+
+    cache = get_response_cache()
+    model = routed_model(INITIAL_ANALYSIS,
+                         estimate_tokens(SECTION_PROMPT + code_kwargs['structure'] + code_kwargs['code']))
+    start = time.perf_counter()
+    results = []
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=len(ANALYSIS_SECTIONS), thread_name_prefix='section')
+
+    def cache_result(future, store):
+        if not future.cancelled() and future.exception() is None:
+            store(future.result())
+
+    try:
+        for key, title, focus in ANALYSIS_SECTIONS:
+            cached = cache.get(_cache_key(code, SECTION_PROMPT, key, model)) if use_cache else None
+            if cached:
+                results.append(SectionResult(key, title, cached, cached=True))
+                continue
+            served = {}
+            future = executor.submit(get_llm_response, SECTION_PROMPT, priority=BULK, task=INITIAL_ANALYSIS,
+                                     served=served, title=title, focus=focus, **code_kwargs)
+            store = _store(cache, code, SECTION_PROMPT, key, served) if use_cache else (lambda response: None)
+            pending[future] = (key, title, store)
+        # Every request is in flight before the cached sections are handed out
+        yield from list(results)
+
+        try:
+            for future in as_completed(list(pending), timeout=max(0.0, timeout - (time.perf_counter() - start))):
+                key, title, store = pending.pop(future)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                try:
+                    results.append(SectionResult(key, title, future.result(), elapsed_ms=elapsed_ms))
+                    store(results[-1].text)
+                except Exception as e:
+                    results.append(SectionResult(key, title, error=str(e), elapsed_ms=elapsed_ms))
+                yield results[-1]
+        except FuturesTimeout:
+            for future, (key, title, store) in pending.items():
+                future.add_done_callback(lambda f, store=store: cache_result(f, store))
+                results.append(SectionResult(key, title, error=f"timed out after {timeout:g}s",
+                                             elapsed_ms=timeout * 1000))
+                yield results[-1]
+    finally:
+        # Late sections finish in the background instead of blocking the caller
+        executor.shutdown(wait=False, cancel_futures=True)
+        log_event("sectioned_analysis", "Sectioned analysis finished", {
+            "code_length": len(code),
+            "sections": len(results),
+            "cached": sum(1 for r in results if r.cached),
+            "failed": sum(1 for r in results if r.error),
+            "slowest_ms": round(max((r.elapsed_ms for r in results), default=0.0), 1),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+
+
+def assemble_sections(results: list) -> str:
+    """The sections in their usual order as one analysis, with a note in place of any that failed"""
+    by_key = {result.key: result for result in results}
+    parts = []
+    for key, title, _ in ANALYSIS_SECTIONS:
+        result = by_key.get(key)
+        if result is not None:
+            parts.append(result.text or f"### {title}\n\n_⚠️ This section could not be generated ({result.error})._")
+    return "\n\n".join(parts)
+
+
+def resolve_context_mode(code: str, requested: str = "snippets") -> str:
+    """How much of the code a follow-up sends: "snippets", "map_reduce" or "full" """
+    if requested == "snippets" and estimate_tokens(code) > RETRIEVAL_MIN_TOKENS:
+        return "snippets"
+    if needs_map_reduce(code):
+        return "map_reduce"
+    return "full"
+
+
+def format_context(history: list, messages: int = CONTEXT_MESSAGES) -> str:
+    """The last few chat messages as prompt context"""
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in (history or [])[-messages:])
+
+
+def cached_initial_analysis(code: str, query: str = None):
+    """The cached initial analysis of ``code`` by the model it would be routed to now, or None"""
+    model = routed_model(INITIAL_ANALYSIS, _initial_prompt_tokens(code))
+    return get_response_cache().get(_cache_key(code, INITIAL_ANALYSIS_PROMPT, query, model))
+
+
+_async_executor = None
+_async_executor_lock = threading.Lock()
+
+
+def _get_async_executor() -> ThreadPoolExecutor:
+    # Not the loop's default executor: the scheduler waits for request slots on that one, and analyses
+    # blocked on their map step must not take every thread it needs
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(max_workers=ASYNC_ANALYSIS_WORKERS, thread_name_prefix='analysis')
+    return _async_executor
+
+
+async def analyze_code_async(code: str, use_cache: bool = True) -> str:
+    """Initial analysis for event-loop callers; the blocking pipeline runs on a worker thread"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_async_executor(), partial(analyze_code, code, use_cache=use_cache)
+    )
+
+
+def analyze_code(code: str, query: str = None, is_initial_analysis: bool = True,
+                 use_cache: bool = True, stream: bool = False, history: list = None,
+                 context_mode: str = "snippets", progress=None, previous_code: str = None,
+                 previous_analysis: str = None, priority: int = INTERACTIVE):
+    """Analyze code using the Groq LLM.
+
+    Set use_cache=False to bypass the response cache, and stream=True to get a
+    generator of text chunks instead of the full response. Follow-up questions
+    use ``history`` (a list of {"role", "content"} messages) as context.
+    ``progress(message)`` is an optional context manager shown during slow steps.
+    An initial analysis of resubmitted code passes the earlier ``previous_code``
+    and its ``previous_analysis`` so only the changed functions and classes are
+    re-analyzed (see incremental). Follow-ups nobody is waiting for yet (such as
+    prefetched answers) pass priority=BULK.
+    """
+    progress = progress or (lambda message: nullcontext())
+    with span("analyze_code", code_chars=len(code), code_tokens=estimate_tokens(code),
+              initial=is_initial_analysis, stream=stream):
+        if is_initial_analysis:
+            response = cached_initial_analysis(code, query) if use_cache else None
+            if response:
+                log_event("cache_hit", "Initial analysis served from cache", {"code_length": len(code)})
+                return iter_text(response) if stream else response
+
+            if previous_code and previous_analysis:
+                response = _incremental_analysis(code, previous_code, previous_analysis, stream, use_cache, progress)
+                if response is not None:
+                    return response
+            served = {}
+            response = _initial_analysis(code, stream, progress, served)
+            if not use_cache:
+                return response
+            store = _store(get_response_cache(), code, INITIAL_ANALYSIS_PROMPT, query, served)
+            if stream and response is not None:
+                return _cache_stream(response, store)
+            store(response)
+            return response
+
+        context = format_context(history)
+        context_mode = resolve_context_mode(code, context_mode)
+        if context_mode == "snippets":
+            # Send only the most relevant units plus an outline instead of the whole file
+            index = build_index(code)
+            return get_llm_response(
+                RETRIEVAL_QUESTION_PROMPT,
+                stream=stream,
+                priority=priority,
+                outline=summarize(index) if index else outline(code),
+                snippets=relevant_snippets(code, query) or "(no part of the code matched the question directly)",
+                query=query,
+                context=context
+            )
+        if context_mode == "map_reduce":
+            return _map_reduce_response(
+                REDUCE_QUESTION_PROMPT, stream, priority, FOLLOW_UP, progress, map_question, code, query, context,
+                _invoker(FOLLOW_UP)
+            )
+        return get_llm_response(FOLLOW_UP_PROMPT, stream=stream, priority=priority, code=code, query=query,
+                                context=context)
@@ -0,0 +1,320 @@
+"""Async HTTP API for initial analyses and follow-up questions.
+
+Serves the same pipeline and prompt templates as the Streamlit page (from
+``analysis_core``) as plain request/response endpoints, so other tools can
+use Code Wizard without a browser session or script reruns. The LLM calls
+are blocking and run on worker threads. A semaphore bounds how many run at
+once, and requests that cannot get a slot within ``API_QUEUE_TIMEOUT`` are
+rejected with 503. Each request has a deadline. When it passes, the client
+gets a 504, or an error event if it is streaming. A worker thread cannot be
+interrupted, so the request keeps its slot until the thread returns, and an
+abandoned stream is closed then. The semaphore therefore bounds the work
+that is really in flight upstream.
+
+    python api_server.py --port 8000
+    GROQ_API_BASE=http://127.0.0.1:8765 python api_server.py   # against benchmarks/fake_groq_server.py
+
+    POST /v1/analyze  {"code": "...", "stream": false, "use_cache": true, "timeout": 60,
+                       "previous_code": "...", "previous_analysis": "..."}
+    POST /v1/ask      {"code": "...", "question": "...", "history": [{"role": "user", "content": "..."}],
+                       "context_mode": "snippets", "stream": false}
+    GET  /healthz, GET /metrics
+
+Streaming responses are server-sent events: ``data: {"delta": "..."}`` per
+chunk, then ``event: done`` (or ``event: error``) with a JSON payload.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import analysis_core as core
+from llm_backends import backend_stats, backend_gauges
+from metrics import record_span, register_gauges, render_prometheus
+from static_analysis import build_index, answer_structural_question
+
+
+API_HOST = os.getenv('API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('API_PORT', '8000'))
+API_MAX_CONCURRENCY = int(os.getenv('API_MAX_CONCURRENCY', '16'))
+API_QUEUE_TIMEOUT = float(os.getenv('API_QUEUE_TIMEOUT', '10'))
+API_REQUEST_TIMEOUT = float(os.getenv('API_REQUEST_TIMEOUT', '120'))  # also the cap for per-request timeouts
+API_MAX_CODE_CHARS = int(os.getenv('API_MAX_CODE_CHARS', str(1024 * 1024)))
+API_TOKEN = os.getenv('API_TOKEN')  # when set, requests need "Authorization: Bearer <token>"
+
+CONTEXT_MODES = ("snippets", "full")
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+class _Limiter:
+    """Bounded concurrency for LLM work, shared by every request on the server's event loop"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = None
+        self.stats = {'active': 0, 'waiting': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+
+    async def acquire(self, timeout: float):
+        if self._semaphore is None:
+            # Created lazily so it belongs to the loop the server runs on
+            self._semaphore = asyncio.Semaphore(max(1, self.limit))
+        self.stats['waiting'] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            raise ApiError(503, "Server busy, try again later", {'Retry-After': str(int(timeout) or 1)})
+        finally:
+            self.stats['waiting'] -= 1
+        self.stats['active'] += 1
+
+    def release(self, outcome: str = 'completed'):
+        self.stats['active'] -= 1
+        self.stats[outcome] += 1
+        self._semaphore.release()
+
+
+limiter = _Limiter(API_MAX_CONCURRENCY)
+
+
+def _error(e: ApiError) -> JSONResponse:
+    return JSONResponse({'error': e.message}, status_code=e.status, headers=e.headers)
+
+
+async def _read_body(request: Request) -> dict:
+    if API_TOKEN and request.headers.get('authorization') != f"Bearer {API_TOKEN}":
+        raise ApiError(401, "Missing or invalid API token")
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Request body must be a JSON object")
+    code = body.get('code', '')
+    if not isinstance(code, str):
+        raise ApiError(400, "'code' must be a string")
+    if len(code) > API_MAX_CODE_CHARS:
+        raise ApiError(413, f"'code' is longer than {API_MAX_CODE_CHARS} characters")
+    try:
+        timeout = float(body.get('timeout') or API_REQUEST_TIMEOUT)
+    except (TypeError, ValueError):
+        raise ApiError(400, "'timeout' must be a number of seconds")
+    body['timeout'] = max(1.0, min(timeout, API_REQUEST_TIMEOUT))
+    return body
+
+
+async def _settle(pending, outcome: str, stream=None):
+    """Release a slot once the worker thread of an abandoned request is done, closing its stream"""
+    try:
+        if pending is not None:
+            await asyncio.wait([pending])
+            if stream is None and not pending.cancelled() and pending.exception() is None:
+                stream = pending.result()  # a stream that only started after the deadline
+        if hasattr(stream, 'close'):
+            # Ends the upstream request instead of leaving it open until garbage collection
+            await run_in_threadpool(stream.close)
+    except Exception:
+        pass
+    finally:
+        limiter.release(outcome)
+
+
+def _sse(event: str, payload: dict) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _stream_events(start, deadline: float, name: str, extra: dict):
+    """Server-sent events for a blocking stream; ``start()`` returns a generator of text chunks"""
+    # The slot is taken inside the generator: a body that is never iterated must not hold one
+    try:
+        await limiter.acquire(min(API_QUEUE_TIMEOUT, max(0.0, deadline - time.monotonic())))
+    except ApiError as e:
+        yield _sse('error', {'error': e.message, 'status': e.status})
+        return
+    started = time.perf_counter()
+    outcome = 'completed'
+    chunks = 0
+    end = object()
+    pending = stream = None
+    finished = False
+    try:
+        # Shielded: a deadline abandons the worker thread's result but must not lose track of the thread
+        pending = asyncio.ensure_future(run_in_threadpool(start))
+        stream = await asyncio.wait_for(asyncio.shield(pending), max(0.0, deadline - time.monotonic()))
+        if isinstance(stream, str):
+            stream = core.iter_text(stream)
+        while True:
+            pending = asyncio.ensure_future(run_in_threadpool(next, stream, end))
+            chunk = await asyncio.wait_for(asyncio.shield(pending), max(0.0, deadline - time.monotonic()))
+            if chunk is end:
+                break
+            chunks += 1
+            yield _sse(None, {'delta': chunk})
+        finished = True
+        yield _sse('done', dict(extra, elapsed_ms=round((time.perf_counter() - started) * 1000, 1)))
+    except asyncio.TimeoutError:
+        outcome = 'timeouts'
+        yield _sse('error', {'error': "Request timed out"})
+    except Exception as e:
+        outcome = 'errors'
+        yield _sse('error', {'error': f"Error in LLM processing: {str(e)}"})
+    finally:
+        if finished:
+            limiter.release(outcome)
+        else:
+            # Timed out, failed or the client went away: the slot is freed when the thread is
+            asyncio.ensure_future(_settle(pending, outcome, stream))
+        record_span(name, (time.perf_counter() - started) * 1000, stream=True, chunks=chunks, outcome=outcome)
+
+
+async def _run(name: str, start, stream: bool, timeout: float, result_key: str, extra: dict):
+    """Run ``start(stream)`` on a worker thread within a concurrency slot and the request deadline"""
+    deadline = time.monotonic() + timeout
+    if stream:
+        return StreamingResponse(_stream_events(lambda: start(True), deadline, name, extra),
+                                 media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    await limiter.acquire(min(API_QUEUE_TIMEOUT, timeout))
+    started = time.perf_counter()
+    outcome = 'completed'
+    work = asyncio.ensure_future(run_in_threadpool(start, False))
+    try:
+        result = await asyncio.wait_for(asyncio.shield(work), max(0.0, deadline - time.monotonic()))
+        if not result:
+            raise RuntimeError("Empty response from the LLM")
+    except asyncio.TimeoutError:
+        outcome = 'timeouts'
+        raise ApiError(504, "Request timed out")
+    except Exception as e:
+        outcome = 'errors'
+        raise ApiError(502, f"Error in LLM processing: {str(e)}")
+    finally:
+        if work.done():
+            limiter.release(outcome)
+        else:
+            asyncio.ensure_future(_settle(work, outcome))
+        record_span(name, (time.perf_counter() - started) * 1000, stream=False, outcome=outcome)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return JSONResponse(dict(extra, **{result_key: result, 'elapsed_ms': elapsed_ms}))
+
+
+async def analyze(request: Request):
+    """Initial analysis of a piece of code"""
+    try:
+        body = await _read_body(request)
+        code = body.get('code', '')
+        if not code.strip():
+            raise ApiError(400, "'code' is required")
+        use_cache = bool(body.get('use_cache', True))
+        # An earlier version and its analysis let only the changed functions and classes be re-analyzed
+        previous_code = body.get('previous_code')
+        previous_analysis = body.get('previous_analysis')
+        if not all(isinstance(value, (str, type(None))) for value in (previous_code, previous_analysis)):
+            raise ApiError(400, "'previous_code' and 'previous_analysis' must be strings")
+        if previous_code and len(previous_code) > API_MAX_CODE_CHARS:
+            raise ApiError(413, f"'previous_code' is longer than {API_MAX_CODE_CHARS} characters")
+
+        def start(stream: bool):
+            return core.analyze_code(code, is_initial_analysis=True, use_cache=use_cache, stream=stream,
+                                     previous_code=previous_code, previous_analysis=previous_analysis)
+
+        return await _run('api_analyze', start, bool(body.get('stream')), body['timeout'], 'analysis', {})
+    except ApiError as e:
+        return _error(e)
+
+
+async def ask(request: Request):
+    """Follow-up question about the code, or a general programming question when no code is given"""
+    try:
+        body = await _read_body(request)
+        code = body.get('code', '')
+        question = body.get('question')
+        if not isinstance(question, str) or not question.strip():
+            raise ApiError(400, "'question' is required")
+        history = body.get('history') or []
+        if not isinstance(history, list) or not all(
+                isinstance(m, dict) and isinstance(m.get('role'), str) and isinstance(m.get('content'), str)
+                for m in history):
+            raise ApiError(400, "'history' must be a list of {\"role\", \"content\"} messages")
+        requested_mode = body.get('context_mode', 'snippets')
+        if requested_mode not in CONTEXT_MODES:
+            raise ApiError(400, f"'context_mode' must be one of {', '.join(CONTEXT_MODES)}")
+        stream = bool(body.get('stream'))
+
+        if not code.strip():
+            def start(stream: bool):
+                return core.get_llm_response(core.GENERAL_QUESTION_PROMPT, stream=stream,
+                                             task=core.GENERAL_QUESTION, query=question)
+            return await _run('api_ask', start, stream, body['timeout'], 'answer', {'context_mode': None})
+
+        # Structural questions are answered from the local index with no LLM call
+        local_answer = answer_structural_question(question, build_index(code))
+        if local_answer:
+            if stream:
+                return StreamingResponse(iter([_sse(None, {'delta': local_answer}),
+                                               _sse('done', {'context_mode': 'local'})]),
+                                         media_type='text/event-stream')
+            return JSONResponse({'answer': local_answer, 'context_mode': 'local', 'elapsed_ms': 0.0})
+
+        context_mode = core.resolve_context_mode(code, requested_mode)
+
+        def start(stream: bool):
+            return core.analyze_code(code, question, is_initial_analysis=False, stream=stream,
+                                     history=history, context_mode=context_mode)
+
+        return await _run('api_ask', start, stream, body['timeout'], 'answer',
+                          {'context_mode': context_mode})
+    except ApiError as e:
+        return _error(e)
+
+
+async def healthz(request: Request):
+    backends = {name: stats['healthy'] for name, stats in backend_stats().items()}
+    return JSONResponse({'status': 'ok', 'llm_configured': bool(backends), 'backends': backends, **limiter.stats})
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(render_prometheus(), media_type='text/plain; version=0.0.4')
+
+
+def create_app() -> Starlette:
+    register_gauges("api", lambda: dict(limiter.stats))
+    register_gauges("backends", backend_gauges)
+    return Starlette(routes=[
+        Route('/v1/analyze', analyze, methods=['POST']),
+        Route('/v1/ask', ask, methods=['POST']),
+        Route('/healthz', healthz, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+    ])
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
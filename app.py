@@ -1,56 +1,43 @@
 import os
-import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
+from startup_profile import import_timer, mark, report as startup_report
+with import_timer('streamlit'):
+    import streamlit as st
 from datetime import datetime
 import time
-from dotenv import load_dotenv
+with import_timer('dotenv'):
+    from dotenv import load_dotenv
 import logging
-import json
-from logging.handlers import RotatingFileHandler
-
-
-# Create logs directory if it doesn't exist
-os.makedirs('logs', exist_ok=True)
-
-# Configure file handler with rotation
-file_handler = RotatingFileHandler(
-    'logs/code_wizard.log',
-    maxBytes=1024 * 1024,  # 1MB
-    backupCount=5
+from log_pipeline import PipelineHandler, submit as submit_log, get_log_writer
+from metrics import span, record_span, register_gauges, start_metrics_server
+from single_flight import single_flight
+from scheduler import scheduler, INTERACTIVE, BULK
+from model_router import router, FOLLOW_UP, GENERAL_QUESTION
+from llm_client import get_pool_stats, warm_up
+from llm_backends import get_backends, backend_stats, backend_gauges, NO_BACKEND_MESSAGE
+from response_cache import get_response_cache
+from session_memory import SessionHistory, memory_report
+from session_store import get_session_store, new_session_id
+from prefetch import SessionPrefetch, prefetch_stats
+from static_analysis import build_index, answer_structural_question
+import analysis_core as core
+from analysis_core import log_event, GENERAL_QUESTION_PROMPT
+from batch_analysis import (
+    collect_from_directory, collect_from_zip, iter_batch_analysis, build_rollup, resolve_server_directory,
+    BATCH_CONCURRENCY, BATCH_SERVER_ROOT, MAX_ARCHIVE_BYTES, SOURCE_EXTENSIONS
 )
+from ingest import read_upload, code_page, line_count, IngestError, UPLOAD_MAX_BYTES, UPLOAD_MAX_LINES
 
-# Configure logging with both console and file output
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        file_handler,
-        logging.StreamHandler()
-    ]
-)
 
-logger = logging.getLogger('CodeWizard')
-
-def log_event(event_type: str, content: str, metadata: dict = None):
-    """Structured logging function for all events"""
-    try:
-        log_data = {
-            'event_type': event_type,
-            'content': content,
-            'timestamp': datetime.now().isoformat(),
-            'metadata': metadata or {}
-        }
-        logger.info(json.dumps(log_data))
-    except Exception as e:
-        logger.error(f"Logging error: {str(e)}")
+# Route all logging through the background writer; file and console output,
+# JSON serialization and rotation (logs/code_wizard.log, 1MB x 5) happen off
+# the script thread. basicConfig is a no-op on reruns.
+logging.basicConfig(level=logging.INFO, handlers=[PipelineHandler()])
 
+logger = logging.getLogger('CodeWizard')
 
-# Load environment variables
+# Load environment variables (analysis_core has already read the LLM settings)
 load_dotenv()
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+LLM_WARM_UP = os.getenv('LLM_WARM_UP', '1') == '1'
 
 # Page configuration
 st.set_page_config(
@@ -417,20 +404,47 @@ def log_user_action(action_type: str, details: dict = None):
         "session_id": st.session_state.get("session_id", "unknown"),
         "details": details or {}
     }
-    logging.info(json.dumps(log_data))
+    submit_log(log_data)
+
+def request_rerun():
+    """st.rerun() that records when it was requested so the rerun cost shows up as a span"""
+    st.session_state.rerun_requested_at = time.perf_counter()
+    st.rerun()
+
+# UI fields saved with the session so a resumed session picks up where it left off
+PERSISTED_STATE = ('user_name', 'code_submitted', 'questions_asked', 'code_analyses', 'latest_analysis_index')
+
+def save_session_state(*fields):
+    """Write the given UI fields through to the session store"""
+    get_session_store().update_state(
+        st.session_state.session_id, **{field: st.session_state[field] for field in fields}
+    )
+
+def resume_session():
+    """Reload the session named in the URL (``?session=<id>``) from the store, without calling the LLM"""
+    session_id = st.query_params.get("session")
+    data = get_session_store().load(session_id) if session_id else None
+    if data is None:
+        return False
+    st.session_state.session_id = session_id
+    st.session_state.history = SessionHistory.restore(data, get_session_store())
+    for field in PERSISTED_STATE:
+        if field in data['state']:
+            st.session_state[field] = data['state'][field]
+    log_event("session_resumed", "Session resumed", {"session_id": session_id, "messages": data['message_count']})
+    return True
 
 def init_session_state():
     """Initialize all session state variables"""
-    if 'session_id' not in st.session_state:
-        st.session_state.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    if 'session_id' not in st.session_state and not resume_session():
+        st.session_state.session_id = new_session_id()
+        get_session_store().create(st.session_state.session_id)
+        st.query_params["session"] = st.session_state.session_id
+    if 'history' not in st.session_state:
+        # Messages and the current code, stored once and capped in memory; every turn is written through
+        st.session_state.history = SessionHistory(st.session_state.session_id, store=get_session_store())
     if 'code_submitted' not in st.session_state:
         st.session_state.code_submitted = False
-    if 'current_code' not in st.session_state:
-        st.session_state.current_code = ""
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
     if 'is_code_context' not in st.session_state:
         st.session_state.is_code_context = True
     if 'user_name' not in st.session_state:
@@ -441,6 +455,25 @@ def init_session_state():
         st.session_state.questions_asked = 0
     if 'code_analyses' not in st.session_state:
         st.session_state.code_analyses = 0
+    if 'latest_analysis_index' not in st.session_state:
+        # Position of the latest initial analysis in the history, the baseline for re-analyzing edited code
+        st.session_state.latest_analysis_index = None
+    if 'stream_responses' not in st.session_state:
+        st.session_state.stream_responses = True
+    if 'sectioned_analysis' not in st.session_state:
+        st.session_state.sectioned_analysis = False
+    if 'prefetch_followups' not in st.session_state:
+        st.session_state.prefetch_followups = False
+    if 'prefetch' not in st.session_state:
+        st.session_state.prefetch = SessionPrefetch()
+    if 'followup_context_mode' not in st.session_state:
+        st.session_state.followup_context_mode = "snippets"
+    if 'history_pages_loaded' not in st.session_state:
+        st.session_state.history_pages_loaded = 0
+    if 'batch_results' not in st.session_state:
+        st.session_state.batch_results = []
+    if 'batch_rollup' not in st.session_state:
+        st.session_state.batch_rollup = None
 
 def show_welcome_screen():
     """Display the welcome screen and handle user name input."""
@@ -462,10 +495,11 @@ def show_welcome_screen():
             if submitted:
                 if len(name.strip()) >= 2:
                     st.session_state.user_name = name
+                    save_session_state('user_name')
                     log_event("login", f"User logged in: {name}")
                     st.success(f"Welcome aboard, {name}! 🌟")
                     time.sleep(1)
-                    st.rerun()
+                    request_rerun()
                 else:
                     log_event("login_failed", "Invalid name attempt", {"name_length": len(name.strip())})
                     st.warning("🪄 Please enter a valid name (at least 2 characters)")
@@ -476,157 +510,416 @@ def show_welcome_screen():
 
 
 
-def get_llm_response(prompt_template: str, **kwargs) -> str:
-    """Get response from LLM using the new LangChain syntax"""
-    if not GROQ_API_KEY:
-        st.error("⚠️ GROQ_API_KEY not found. Please set it in your environment variables.")
+def _report_llm_error(e: Exception, action: str):
+    """Log a failed request (it counts towards the error rate) and show it in the UI"""
+    log_user_action("error", {
+        "error_type": str(type(e).__name__),
+        "error_message": str(e),
+        "action": action
+    })
+    st.error(f"Error in LLM processing: {str(e)}")
+
+def _report_stream_errors(stream, action: str):
+    """Report an error raised while streaming like any failed request; the generator then returns None"""
+    try:
+        return (yield from stream)
+    except Exception as e:
+        _report_llm_error(e, action)
+        return None
+
+def _require_backend():
+    if not get_backends():
+        st.error(f"⚠️ {NO_BACKEND_MESSAGE}")
         st.stop()
-    
+
+def get_llm_response(prompt_template: str, stream: bool = False, priority: int = INTERACTIVE,
+                     task: str = FOLLOW_UP, **kwargs):
+    """analysis_core.get_llm_response with errors shown in the UI instead of raised"""
+    _require_backend()
     try:
-        llm = ChatGroq(
-            groq_api_key=GROQ_API_KEY,
-            model_name="mixtral-8x7b-32768",
-            temperature=0.7
-        )
-        
-        prompt = ChatPromptTemplate.from_template(prompt_template)
-        chain = prompt | llm  # New syntax replacing LLMChain
-        
-        response = chain.invoke(kwargs)
-        return response.content
+        response = core.get_llm_response(prompt_template, stream=stream, priority=priority, task=task, **kwargs)
     except Exception as e:
-        st.error(f"Error in LLM processing: {str(e)}")
+        _report_llm_error(e, "general_question")
         return None
+    return _report_stream_errors(response, "general_question") if stream else response
 
-def analyze_code(code: str, query: str = None, is_initial_analysis: bool = True) -> str:
-    """Analyze code using the Groq LLM."""
+def latest_analysis():
+    """The latest initial analysis in this session's history, or None"""
+    index = st.session_state.latest_analysis_index
+    if index is None or index >= len(st.session_state.history):
+        return None
+    return st.session_state.history.messages(index, index + 1)[0]["content"]
+
+def analyze_code(code: str, query: str = None, is_initial_analysis: bool = True,
+                 use_cache: bool = True, stream: bool = False, previous_code: str = None):
+    """Analyze code with this session's history and settings.
+
+    Set use_cache=False to bypass the response cache, and stream=True to get a
+    generator of text chunks instead of the full response. Pass the code that
+    was analyzed before as ``previous_code`` to re-analyze only what changed.
+    """
+    _require_backend()
+    context_mode = None
+    if not is_initial_analysis:
+        context_mode = core.resolve_context_mode(code, st.session_state.get("followup_context_mode", "snippets"))
     try:
+        response = core.analyze_code(
+            code, query, is_initial_analysis, use_cache, stream,
+            # The question itself is already the last message
+            history=st.session_state.history.recent(core.CONTEXT_MESSAGES + 1)[:-1],
+            context_mode=context_mode,
+            progress=st.spinner,
+            previous_code=previous_code,
+            previous_analysis=latest_analysis() if previous_code else None
+        )
+        if stream and response is not None:
+            response = _report_stream_errors(response, "code_analysis")
+    except Exception as e:
+        _report_llm_error(e, "code_analysis")
         response = None
-        if is_initial_analysis:
-            prompt_template = """
-                As a coding expert, analyze this code:
-                
-                ```
-                {code}
-                ```
-                
-                Provide a detailed yet engaging analysis including:
-                1. 🎯 Overview of what the code does
-                2. 🔍 Key components and their functionality
-                3. 💡 Notable programming concepts used
-                4. ⚡ Performance considerations
-                5. 🛡️ Security considerations if applicable
-                6. ✨ Potential improvements and best practices
-                
-                Make your explanation clear, engaging, and actionable, using emojis and formatting to enhance readability.
-                """
-            return get_llm_response(prompt_template, code=code)
-        
-        else:
-            context = "\n".join([f"{msg['role']}: {msg['content']}" 
-                               for msg in st.session_state.conversation_history[-3:]])
-            
-            prompt_template = """
-            Question about the code:
-            ```
-            {code}
-            ```
-            
-            Question: {query}
-            
-            Previous context:
-            {context}
-            
-            Provide a focused, clear answer with relevant code references and examples where applicable.
-            Use emojis and formatting to make the explanation more engaging.
-            """
-            response = get_llm_response(prompt_template, code=code, query=query, context=context)
-            
-            # Log the analysis request
-            log_user_action(
-                "code_analysis" if is_initial_analysis else "follow_up_question",
-                {
-                    "code_length": len(code),
-                    "query": query if query else "initial_analysis",
-                    "success": bool(response)
-                }
-            )
-            return response
+
+    if not is_initial_analysis:
+        # Log the analysis request
+        log_user_action(
+            "follow_up_question",
+            {
+                "code_length": len(code),
+                "query": query,
+                "context_mode": context_mode,
+                "success": bool(response)
+            }
+        )
+    return response
+
+def render_response(response) -> str:
+    """Render a response, streaming it token by token when it is a generator, and return the full text"""
+    if response is None:
+        return None
+    if isinstance(response, str):
+        st.markdown(response)
+        return response
+    return st.write_stream(response) or None
+
+def render_sectioned_analysis(code: str, use_cache: bool = True) -> str:
+    """Generate the analysis sections concurrently, rendering each one as soon as it is ready"""
+    _require_backend()
+    placeholders = {}
+    for key, title, _ in core.ANALYSIS_SECTIONS:
+        placeholders[key] = st.empty()
+        placeholders[key].caption(f"⏳ {title}...")
+    results = []
+    try:
+        for result in core.iter_analysis_sections(code, use_cache):
+            results.append(result)
+            if result.text:
+                placeholders[result.key].markdown(result.text)
+            else:
+                placeholders[result.key].warning(f"{result.title}: {result.error}")
     except Exception as e:
-        log_user_action("error", {
-            "error_type": str(type(e).__name__),
-            "error_message": str(e),
-            "action": "code_analysis"
+        _report_llm_error(e, "sectioned_analysis")
+    if not any(result.text for result in results):
+        return None
+    return core.assemble_sections(results)
+
+def start_prefetch(code: str, analysis: str):
+    """Answer the likely follow-up questions in the background (see prefetch)"""
+    context_mode = core.resolve_context_mode(code, st.session_state.followup_context_mode)
+    if context_mode == "map_reduce":
+        return  # far too expensive to spend on guesses
+    history = [{"role": "assistant", "content": analysis}]
+
+    def answer(question):
+        return core.analyze_code(code, question, is_initial_analysis=False, history=history,
+                                 context_mode=context_mode, priority=BULK)
+
+    scheduled = st.session_state.prefetch.start(code, analysis, answer)
+    log_event("prefetch_started", "Prefetching likely follow-ups", {"questions": scheduled, "code_length": len(code)})
+
+def render_batch_result(result):
+    """Render one file of a batch analysis"""
+    label = f"📄 {result.path}" + (" ♻️" if result.cached else f" ({result.elapsed_ms / 1000:.1f}s)")
+    with st.expander(label, expanded=False):
+        if result.error:
+            st.error(f"Analysis failed: {result.error}")
+        else:
+            st.markdown(result.analysis)
+
+def _upload_size_mb(max_bytes: int) -> int:
+    """A per-uploader limit in whole MB, as st.file_uploader takes it"""
+    return max(1, -(-max_bytes // (1024 * 1024)))
+
+def render_batch_analysis_section():
+    """Render the repository / multi-file analysis section"""
+    uploaded = st.file_uploader("Upload a zip of your repository", type=["zip"],
+                                max_upload_size=_upload_size_mb(MAX_ARCHIVE_BYTES))
+    # Only directories under an allowlisted root: the web app must not read arbitrary paths on the host
+    directory = st.text_input(
+        f"...or a directory under {BATCH_SERVER_ROOT} on the server",
+        placeholder="project"
+    ) if BATCH_SERVER_ROOT else ""
+    concurrency = st.slider("Concurrent requests", 1, 32, BATCH_CONCURRENCY)
+
+    if st.button("🔍 Analyze Repository", type="primary", use_container_width=True):
+        _require_backend()
+        try:
+            server_directory = resolve_server_directory(directory)
+            if uploaded is not None and uploaded.size > MAX_ARCHIVE_BYTES:
+                st.warning(f"🪄 {uploaded.name} is larger than {MAX_ARCHIVE_BYTES // (1024 * 1024)} MB")
+                return
+            if uploaded is not None:
+                sources = collect_from_zip(uploaded.getvalue())
+            elif server_directory:
+                sources = collect_from_directory(server_directory, confine=True)
+            elif directory.strip():
+                st.warning(f"🪄 {directory.strip()} is not a directory under {BATCH_SERVER_ROOT}")
+                return
+            else:
+                st.warning("🪄 Please upload a zip file" + (" or enter a directory" if BATCH_SERVER_ROOT else ""))
+                return
+        except Exception as e:
+            log_event("error", f"Error collecting batch sources: {str(e)}")
+            st.error(f"Could not read the repository: {str(e)}")
+            return
+
+        if not sources:
+            st.warning("🪄 No source files found")
+            return
+
+        log_user_action("submit_batch", {"files": len(sources), "concurrency": concurrency})
+        st.session_state.batch_results = []
+        st.session_state.batch_rollup = None
+        progress = st.progress(0.0, text=f"Analyzing {len(sources)} files...")
+        start = time.perf_counter()
+        for result in iter_batch_analysis(sources, concurrency):
+            st.session_state.batch_results.append(result)
+            render_batch_result(result)
+            done = len(st.session_state.batch_results)
+            progress.progress(done / len(sources), text=f"Analyzed {done}/{len(sources)} files")
+
+        results = st.session_state.batch_results
+        log_event("batch_analysis", "Batch analysis finished", {
+            "files": len(results),
+            "errors": sum(1 for r in results if r.error),
+            "cached": sum(1 for r in results if r.cached),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
         })
-        raise e
+        with st.spinner("🧩 Building repository summary..."):
+            try:
+                st.session_state.batch_rollup = build_rollup(results)
+            except Exception as e:
+                st.error(f"Error in LLM processing: {str(e)}")
+        st.session_state.code_analyses += 1
+        save_session_state('code_analyses')
+        request_rerun()
+
+    if st.session_state.batch_rollup:
+        st.markdown("### 🧩 Repository Summary")
+        st.markdown(st.session_state.batch_rollup)
+    if st.session_state.batch_results:
+        st.markdown(f"### 📚 File Analyses ({len(st.session_state.batch_results)})")
+        for result in sorted(st.session_state.batch_results, key=lambda r: r.path):
+            render_batch_result(result)
+
+# Code longer than this is shown a page at a time, so reruns don't re-highlight all of it
+CODE_PAGE_LINES = int(os.getenv('CODE_PAGE_LINES', '400'))
+# Larger code is not round-tripped through the browser to pre-fill the text box
+TEXT_AREA_MAX_CHARS = int(os.getenv('TEXT_AREA_MAX_CHARS', '100000'))
+
+def ingest_upload(uploaded) -> str:
+    """Read an uploaded source file, or show why it can't be used and return None"""
+    uploaded.seek(0)
+    try:
+        source = read_upload(uploaded, uploaded.name)
+    except IngestError as e:
+        log_user_action("upload_rejected", {"file": uploaded.name, "reason": str(e)})
+        st.error(f"⚠️ {e}")
+        return None
+    log_user_action("upload_code", {
+        "file": source.name,
+        "bytes": source.size_bytes,
+        "lines": source.lines,
+        "encoding": source.encoding,
+        "duplicate": source.duplicate
+    })
+    return source.code
+
+def render_code_view(code: str):
+    """Show the code, paged when it is long"""
+    total = line_count(code)
+    if total <= CODE_PAGE_LINES:
+        st.code(code, language="python")
+        return
+    pages = (total - 1) // CODE_PAGE_LINES + 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key="code_view_page")
+    text, first, last = code_page(code, page - 1, CODE_PAGE_LINES)
+    st.caption(f"Lines {first}-{last} of {total}")
+    st.code(text, language="python")
 
 def render_code_analysis_section():
     """Render the code analysis section of the app"""
     st.markdown("### 📝 Let's analyze your code!")
+    mode = st.radio(
+        "Analysis mode",
+        ["Single snippet", "Repository"],
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+    if mode == "Repository":
+        render_batch_analysis_section()
+        return
+
+    # Start from the current code so an edit can be re-analyzed incrementally
+    current_code = st.session_state.history.code
     code_input = st.text_area(
         "Enter your code",
+        value=current_code if len(current_code) <= TEXT_AREA_MAX_CHARS else "",
         height=300,
         placeholder="Paste your code here and let's make it better together! 🚀",
         label_visibility="collapsed"
     )
+    uploaded = st.file_uploader(
+        "...or upload a source file (used instead of the text box)",
+        type=sorted(ext.lstrip('.') for ext in SOURCE_EXTENSIONS | {'.txt'}),
+        help=f"Up to {UPLOAD_MAX_BYTES // 1024} KB and {UPLOAD_MAX_LINES} lines",
+        max_upload_size=_upload_size_mb(UPLOAD_MAX_BYTES)
+    )
     
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        if st.button("🔍 Analyze Code", type="primary", use_container_width=True) and code_input.strip():
-            log_user_action("submit_code", {"code_length": len(code_input)})
-            st.session_state.current_code = code_input
-            with st.spinner("🤖 Analyzing your code..."):
-                explanation = analyze_code(code_input, is_initial_analysis=True)
-                if explanation:
-                    st.session_state.code_submitted = True
-                    st.session_state.messages.extend([
-                        {"role": "user", "content": "Please analyze this code."},
-                        {"role": "assistant", "content": explanation}
-                    ])
-                    st.session_state.conversation_history.extend(st.session_state.messages[-2:])
-                    st.session_state.code_analyses += 1
-                    st.rerun()
+        skip_cache = st.checkbox(
+            "♻️ Fresh analysis",
+            value=False,
+            help="Bypass the response cache for this analysis"
+        )
+        analyze = st.button("🔍 Analyze Code", type="primary", use_container_width=True)
+        if analyze and uploaded is not None:
+            code_input = ingest_upload(uploaded) or ""
+        if analyze and code_input.strip():
+            log_user_action("submit_code", {"code_length": len(code_input), "skip_cache": skip_cache})
+            previous_code = st.session_state.history.code or None
+            st.session_state.history.code = code_input
+            if st.session_state.sectioned_analysis and not core.needs_map_reduce(code_input):
+                with st.chat_message("assistant"):
+                    explanation = render_sectioned_analysis(code_input, use_cache=not skip_cache)
+            elif st.session_state.stream_responses:
+                with st.chat_message("assistant"):
+                    explanation = render_response(analyze_code(
+                        code_input, is_initial_analysis=True, use_cache=not skip_cache, stream=True,
+                        previous_code=previous_code
+                    ))
+            else:
+                with st.spinner("🤖 Analyzing your code..."):
+                    explanation = analyze_code(code_input, is_initial_analysis=True, use_cache=not skip_cache,
+                                               previous_code=previous_code)
+            if explanation:
+                st.session_state.code_submitted = True
+                st.session_state.history.append(
+                    "user", "Please analyze the updated code." if previous_code else "Please analyze this code."
+                )
+                st.session_state.latest_analysis_index = len(st.session_state.history)
+                st.session_state.history.append("assistant", explanation)
+                st.session_state.code_analyses += 1
+                save_session_state('code_submitted', 'code_analyses', 'latest_analysis_index')
+                if st.session_state.prefetch_followups:
+                    start_prefetch(code_input, explanation)
+                request_rerun()
+            elif previous_code:
+                # Keep the baseline the latest analysis describes
+                st.session_state.history.code = previous_code
+
+# Messages are shown in pages of this size; only the latest page(s) are rendered by default
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '20'))
+ROLE_LABELS = {"user": "🧑 You", "assistant": "🪄 Code Wizard"}
+
+def _page_markdown(messages: list) -> str:
+    return "\n\n---\n\n".join(
+        f"**{ROLE_LABELS.get(message['role'], message['role'])}**\n\n{message['content']}"
+        for message in messages
+    )
+
+def _history_page_markdown(start: int) -> str:
+    """Markdown for one full page of past messages, cached by the session history since they never change"""
+    return st.session_state.history.rendered_page(start, CHAT_PAGE_SIZE, _page_markdown)
+
+def _load_older_messages():
+    st.session_state.history_pages_loaded += 1
+
+def render_history():
+    """Render the latest messages, with older pages loaded on demand"""
+    history = st.session_state.history
+    # Pages are aligned to the start of the conversation so a finished page never changes
+    recent_start = max(0, (len(history) - CHAT_PAGE_SIZE) // CHAT_PAGE_SIZE * CHAT_PAGE_SIZE)
+    older_start = max(0, recent_start - st.session_state.history_pages_loaded * CHAT_PAGE_SIZE)
+
+    if older_start > 0:
+        st.button(
+            f"⬆️ Load older messages ({older_start} hidden)",
+            on_click=_load_older_messages,
+            use_container_width=True
+        )
+    for start in range(older_start, recent_start, CHAT_PAGE_SIZE):
+        with st.container(border=True):
+            st.markdown(_history_page_markdown(start))
+    for message in history.messages(recent_start):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
 def render_chat_interface():
     """Render the chat interface section"""
     with st.expander("📄 View Current Code", expanded=False):
-        st.code(st.session_state.current_code, language="python")
+        render_code_view(st.session_state.history.code)
         if st.button("📝 Submit New Code"):
             st.session_state.code_submitted = False
-            st.rerun()
+            save_session_state('code_submitted')
+            request_rerun()
     
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    with span("render_history", messages=len(st.session_state.history)):
+        render_history()
 
     
     if prompt := st.chat_input("💭 Ask me anything about the code..."):
         log_user_action("chat_message", {"message": prompt})
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.history.append("user", prompt)
         st.session_state.questions_asked += 1
+        save_session_state('questions_asked')
+        stream = st.session_state.stream_responses
         
-        with st.spinner("🤔 Thinking..."):
-            response = analyze_code(
-                st.session_state.current_code, 
+        def ask():
+            if st.session_state.is_code_context:
+                # Structural questions are answered from the local index with no LLM call
+                local_answer = answer_structural_question(prompt, build_index(st.session_state.history.code))
+                if local_answer:
+                    log_event("local_answer", "Answered structural question locally", {"query": prompt})
+                    return local_answer
+                if st.session_state.prefetch_followups:
+                    prefetched = st.session_state.prefetch.lookup(prompt, st.session_state.history.code)
+                    if prefetched:
+                        log_event("prefetch_hit", "Answered follow-up from prefetch", {"query": prompt})
+                        return prefetched
+            return analyze_code(
+                st.session_state.history.code,
                 prompt, 
-                is_initial_analysis=False
+                is_initial_analysis=False,
+                stream=stream
             ) if st.session_state.is_code_context else get_llm_response(
-                "Answer this programming question:\nQuestion: {query}\n\n"
-                "Provide a clear, comprehensive answer with examples where applicable.\n"
-                "Use emojis and formatting to make the explanation engaging.",
+                GENERAL_QUESTION_PROMPT,
+                stream=stream,
+                task=GENERAL_QUESTION,
                 query=prompt
             )
+        
+        if stream:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                response = render_response(ask())
+        else:
+            with st.spinner("🤔 Thinking..."):
+                response = ask()
             
-            if response:
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                st.session_state.conversation_history.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                st.rerun()
+        if response:
+            st.session_state.history.append("assistant", response)
+            request_rerun()
 
 def render_sidebar():
     """Render the sidebar section"""
@@ -637,19 +930,146 @@ def render_sidebar():
             value=st.session_state.is_code_context,
             help="Toggle between code-specific and general programming questions"
         )
+        st.session_state.stream_responses = st.checkbox(
+            "Stream responses",
+            value=st.session_state.stream_responses,
+            help="Show answers token by token as they are generated"
+        )
+        st.session_state.sectioned_analysis = st.checkbox(
+            "Parallel analysis sections",
+            value=st.session_state.sectioned_analysis,
+            help="Generate each section of a code analysis as its own concurrent request and show it as soon as it is ready"
+        )
+        st.session_state.prefetch_followups = st.checkbox(
+            "Prefetch likely follow-ups",
+            value=st.session_state.prefetch_followups,
+            help="After an analysis, answer the most likely follow-up questions in the background "
+                 "(uses extra tokens, within a budget)"
+        )
+        context_modes = {"snippets": "Relevant snippets", "full": "Full code"}
+        st.session_state.followup_context_mode = st.selectbox(
+            "Follow-up context",
+            list(context_modes),
+            index=list(context_modes).index(st.session_state.followup_context_mode),
+            format_func=context_modes.get,
+            help="Send only the code most relevant to each question, or the whole file"
+        )
     
-        if st.button("🗑️ Clear Chat") and st.session_state.messages:
+        if st.button("🗑️ Clear Chat") and len(st.session_state.history):
             log_user_action("clear_chat")
-            st.session_state.messages = []
+            st.session_state.history.clear()
+            st.session_state.prefetch.discard()
             st.session_state.code_submitted = False
-            st.session_state.current_code = ""
-            st.session_state.conversation_history = []
+            st.session_state.latest_analysis_index = None
+            save_session_state('code_submitted', 'latest_analysis_index')
+            st.session_state.history_pages_loaded = 0
             st.success("✨ Chat cleared!")
-            st.rerun()
+            request_rerun()
+
+        with st.expander("📊 Connection Pool", expanded=False):
+            stats = get_pool_stats()
+            st.caption(f"Pool size: {stats['pool_size']}")
+            st.caption(f"Requests: {stats['requests']}")
+            st.caption(f"Connections opened: {stats['connections_opened']}")
+            st.caption(f"Connections reused: {stats['connections_reused']}")
+            st.caption(f"TLS handshakes: {stats['tls_handshakes']}")
+            st.caption(f"Chains created / reused: {stats['chains_created']} / {stats['chain_reuses']}")
+            flights = single_flight.stats()
+            st.caption(f"Coalesced requests: {flights['coalesced']} (upstream: {flights['leaders']})")
+
+        with st.expander("🚦 Request Scheduler", expanded=False):
+            stats = scheduler.stats()
+            st.caption(f"Queued (interactive / bulk): {stats['queue_depth_interactive']} / {stats['queue_depth_bulk']}")
+            st.caption(f"Admitted: {stats['admitted']} (throttled: {stats['throttled']})")
+            st.caption(f"Retries: {stats['retries']} (rate limited: {stats['rate_limited']})")
+            st.caption(f"Failed after retries: {stats['failures']}")
+
+        with st.expander("🧭 Model Routing", expanded=False):
+            for name, stats in router.stats().items():
+                latency = f"{stats['latency_ms']:.0f} ms" if stats['latency_ms'] is not None else "n/a"
+                cooling = " ⏸️" if stats['cooling_down'] else ""
+                st.caption(f"{name}{cooling}: {stats['requests']} calls, {latency}, "
+                           f"{stats['errors']} errors ({stats['timeouts']} timeouts)")
+            for name, stats in backend_stats().items():
+                health = "✅" if stats['healthy'] else "❌"
+                st.caption(f"{health} {name} backend: {stats['in_flight']}/{stats['concurrency'] or '∞'} in flight, "
+                           f"{stats['requests']} requests, {stats['failures']} failures "
+                           f"({stats['unreachable']} unreachable)")
+
+        with st.expander("🔮 Follow-up Prefetch", expanded=False):
+            session = st.session_state.prefetch.stats
+            stats = prefetch_stats()
+            st.caption(f"This session: {session['hits']} hits, {session['misses']} misses, "
+                       f"{session['tokens_spent']} tokens spent, {session['tokens_used']} used")
+            for question in st.session_state.prefetch.pending():
+                st.caption(f"Prefetched: {question}")
+            st.caption(f"Hit rate (all sessions): {stats['hit_rate']:.0%}")
+            st.caption(f"Wasted tokens (all sessions): {stats['tokens_wasted']}")
+
+        with st.expander("🗄️ Response Cache", expanded=False):
+            stats = get_response_cache().stats()
+            st.caption(f"Hit rate: {stats['hit_rate']:.0%}")
+            st.caption(f"Hits (memory / disk): {stats['memory_hits']} / {stats['disk_hits']}")
+            st.caption(f"Misses: {stats['misses']}")
+            st.caption(f"Evictions (memory / disk): {stats['memory_evictions']} / {stats['disk_evictions']}")
+            st.caption(f"Entries (memory / disk): {stats['memory_entries']} / {stats['disk_entries']}")
+
+        with st.expander("📝 Log Pipeline", expanded=False):
+            stats = get_log_writer().stats()
+            st.caption(f"Queued: {stats['queued']}")
+            st.caption(f"Written: {stats['written']} in {stats['batches']} batches")
+            st.caption(f"Dropped: {stats['dropped']}")
+            st.caption(f"Rotations: {stats['rotations']}")
+
+        with st.expander("🧠 Session Memory", expanded=False):
+            stats = st.session_state.history.stats()
+            report = memory_report()
+            st.caption(f"This session: {stats['memory_bytes'] / 1024:.0f} KB in memory, "
+                       f"{stats['spilled_messages']} of {stats['messages']} messages on disk")
+            st.caption(f"All sessions: {report['total_bytes'] / 1024 / 1024:.1f} MB "
+                       f"across {report['sessions']} sessions")
+            st.caption(f"Largest session: {report['max_session_bytes'] / 1024:.0f} KB")
+            store_stats = get_session_store().stats()
+            st.caption(f"Stored: {store_stats['stored_sessions']} sessions, "
+                       f"{store_stats['stored_messages']} messages")
+            st.caption("Resume link: add `?session=<id>` to the URL")
+            st.code(st.session_state.session_id, language=None)
+
+        with st.expander("🚀 Startup Profile", expanded=False):
+            profile = startup_report()
+            for name, ms in profile["imports_ms"].items():
+                st.caption(f"import {name}: {ms:.0f} ms")
+            for name, ms in profile["marks_ms"].items():
+                st.caption(f"{name}: {ms:.0f} ms")
+
+def record_first_paint():
+    """Log the startup profile after the first full render, then preload the LLM stack"""
+    if mark('first_paint'):
+        log_event("startup_profile", "First paint completed", startup_report())
+    if LLM_WARM_UP:
+        warm_up()
+
+def start_metrics():
+    """Expose pool, cache, scheduler, routing and log pipeline stats next to the span histograms"""
+    register_gauges("pool", get_pool_stats)
+    register_gauges("cache", lambda: get_response_cache().stats())
+    register_gauges("log", lambda: get_log_writer().stats())
+    register_gauges("single_flight", single_flight.stats)
+    register_gauges("scheduler", scheduler.stats)
+    register_gauges("router", router.gauges)
+    register_gauges("backends", backend_gauges)
+    register_gauges("sessions", memory_report)
+    register_gauges("session_store", lambda: get_session_store().stats())
+    register_gauges("prefetch", prefetch_stats)
+    start_metrics_server()
 
 def main():
     """Main application logic."""
     init_session_state()
+    start_metrics()
+    requested_at = st.session_state.pop("rerun_requested_at", None)
+    if requested_at is not None:
+        record_span("rerun", (time.perf_counter() - requested_at) * 1000)
     
     if not st.session_state.user_name:
         show_welcome_screen()
@@ -663,11 +1083,14 @@ def main():
     
     
     if not st.session_state.code_submitted:
-        render_code_analysis_section()
+        with span("render_code_analysis_section"):
+            render_code_analysis_section()
     else:
-        render_chat_interface()
+        with span("render_chat_interface", messages=len(st.session_state.history)):
+            render_chat_interface()
     
     render_sidebar()
 
 if __name__ == "__main__":
     main()
+    record_first_paint()
@@ -0,0 +1,218 @@
+"""Repository / multi-file batch analysis.
+
+Files are collected from an uploaded zip archive or a local directory and
+analyzed concurrently on the shared event loop. Each file goes through the
+same initial-analysis pipeline as a single snippet (``analysis_core``), so
+large files are compacted or map-reduced and every call is routed to the
+configured backends. Results are yielded in completion order so the UI can
+render each file as soon as it is done.
+"""
+import asyncio
+import glob
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+
+from analysis_core import analyze_code_async, cached_initial_analysis, get_llm_response
+from llm_client import run_async
+from model_router import INITIAL_ANALYSIS
+from scheduler import BULK
+
+
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '500'))
+MAX_FILE_BYTES = int(os.getenv('BATCH_MAX_FILE_BYTES', str(200 * 1024)))  # 200KB
+# Largest repository zip the web app accepts; server.maxUploadSize in .streamlit/config.toml must allow it
+MAX_ARCHIVE_BYTES = int(os.getenv('BATCH_MAX_ARCHIVE_BYTES', str(50 * 1024 * 1024)))  # 50MB
+# Directory on the server the web app may analyze; unset, only uploaded archives are accepted
+BATCH_SERVER_ROOT = os.getenv('BATCH_SERVER_ROOT', '')
+
+SOURCE_EXTENSIONS = {
+    '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.go', '.rb', '.rs', '.c', '.h',
+    '.cpp', '.hpp', '.cc', '.cs', '.php', '.kt', '.swift', '.scala', '.sh', '.sql',
+}
+SKIP_DIRS = {'.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', 'venv', 'build', 'dist'}
+
+ROLLUP_PROMPT = """
+    You are reviewing a whole repository. Below are analyses of its individual files:
+
+    {file_summaries}
+
+    Provide a repository-level summary including:
+    1. 🏗️ Overall architecture and how the files fit together
+    2. 🔁 Cross-cutting patterns and duplicated logic
+    3. ⚡ The most important performance concerns
+    4. 🛡️ The most important security concerns
+    5. ✨ A prioritized list of improvements
+
+    Use emojis and formatting to make the summary engaging.
+    """
+ROLLUP_CHARS_PER_FILE = 1500
+ROLLUP_MAX_CHARS = 60000
+
+
+@dataclass
+class SourceFile:
+    path: str
+    code: str
+
+
+@dataclass
+class FileResult:
+    path: str
+    analysis: str = None
+    error: str = None
+    elapsed_ms: float = 0.0
+    cached: bool = False
+
+
+def _is_source(path: str) -> bool:
+    parts = path.replace('\\', '/').split('/')
+    if any(part in SKIP_DIRS for part in parts[:-1]):
+        return False
+    return os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS
+
+
+def _decode(data: bytes):
+    if b'\x00' in data[:8192]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def collect_from_zip(data: bytes, max_files: int = MAX_FILES, max_file_bytes: int = MAX_FILE_BYTES) -> list:
+    """Collect source files from an in-memory zip archive"""
+    sources = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.file_size > max_file_bytes or not _is_source(info.filename):
+                continue
+            code = _decode(archive.read(info))
+            if code and code.strip():
+                sources.append(SourceFile(info.filename, code))
+            if len(sources) >= max_files:
+                break
+    return sources
+
+
+def _within(path: str, root: str) -> bool:
+    return os.path.commonpath([os.path.realpath(path), root]) == root
+
+
+def resolve_server_directory(path: str, root: str = BATCH_SERVER_ROOT):
+    """``path`` resolved inside the allowed ``root``, or None if it is outside it, missing or no root is set"""
+    if not root or not path.strip():
+        return None
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path.strip()))
+    return resolved if _within(resolved, root) and os.path.isdir(resolved) else None
+
+
+def collect_from_directory(root: str, max_files: int = MAX_FILES, max_file_bytes: int = MAX_FILE_BYTES,
+                           confine: bool = False) -> list:
+    """Collect source files from a local directory tree; ``confine`` skips symlinks leading out of it"""
+    sources = []
+    real_root = os.path.realpath(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, root)
+            if not _is_source(rel_path) or (confine and not _within(path, real_root)):
+                continue
+            if os.path.getsize(path) > max_file_bytes:
+                continue
+            with open(path, 'rb') as f:
+                code = _decode(f.read())
+            if code and code.strip():
+                sources.append(SourceFile(rel_path, code))
+            if len(sources) >= max_files:
+                return sources
+    return sources
+
+
+def collect_from_paths(patterns: list, max_files: int = MAX_FILES, max_file_bytes: int = MAX_FILE_BYTES) -> list:
+    """Collect files named by paths or glob patterns; directories are walked for source files"""
+    sources, seen = [], set()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            if os.path.isdir(path):
+                found = [SourceFile(os.path.join(path, s.path), s.code)
+                         for s in collect_from_directory(path, max_files, max_file_bytes)]
+            elif os.path.isfile(path) and os.path.getsize(path) <= max_file_bytes:
+                with open(path, 'rb') as f:
+                    code = _decode(f.read())
+                found = [SourceFile(path, code)] if code and code.strip() else []
+            else:
+                found = []
+            for source in found:
+                if source.path not in seen:
+                    seen.add(source.path)
+                    sources.append(source)
+                if len(sources) >= max_files:
+                    return sources
+    return sources
+
+
+async def _analyze_file(source: SourceFile, semaphore: asyncio.Semaphore, use_cache: bool) -> FileResult:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            analysis = await analyze_code_async(source.code, use_cache=use_cache)
+            if not analysis:
+                raise RuntimeError("Empty response from the LLM")
+        except Exception as e:
+            return FileResult(source.path, error=str(e), elapsed_ms=(time.perf_counter() - start) * 1000)
+    return FileResult(source.path, analysis=analysis, elapsed_ms=(time.perf_counter() - start) * 1000)
+
+
+def iter_batch_analysis(sources: list, concurrency: int = BATCH_CONCURRENCY, use_cache: bool = True):
+    """Analyze files concurrently and yield a FileResult for each as it completes.
+
+    Cached analyses are yielded first without an LLM call.
+    """
+    pending = []
+    for source in sources:
+        cached = cached_initial_analysis(source.code) if use_cache else None
+        if cached:
+            yield FileResult(source.path, analysis=cached, cached=True)
+        else:
+            pending.append(source)
+
+    if not pending:
+        return
+
+    # The semaphore has to be created on the loop that awaits it
+    async def make_semaphore():
+        return asyncio.Semaphore(max(1, concurrency))
+    semaphore = run_async(make_semaphore()).result()
+
+    futures = [run_async(_analyze_file(source, semaphore, use_cache)) for source in pending]
+    for future in as_completed(futures):
+        yield future.result()
+
+
+def build_rollup(results: list) -> str:
+    """Summarize per-file analyses into a repository-level report"""
+    analyzed = sorted((r for r in results if r.analysis), key=lambda r: r.path)
+    summaries = []
+    total = 0
+    for result in analyzed:
+        summary = f"### {result.path}\n{result.analysis[:ROLLUP_CHARS_PER_FILE]}"
+        if total + len(summary) > ROLLUP_MAX_CHARS:
+            summaries.append(f"... {len(analyzed) - len(summaries)} more files omitted")
+            break
+        summaries.append(summary)
+        total += len(summary)
+    if not summaries:
+        return None
+    failed = sorted(r.path for r in results if not r.analysis)
+    if failed:
+        summaries.append(f"{len(failed)} files could not be analyzed: " + ", ".join(failed[:20])
+                         + (", ..." if len(failed) > 20 else ""))
+    return get_llm_response(ROLLUP_PROMPT, priority=BULK, task=INITIAL_ANALYSIS, file_summaries="\n\n".join(summaries))
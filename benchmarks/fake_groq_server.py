@@ -0,0 +1,164 @@
+"""Local stand-in for the Groq chat-completions API.
+
+Speaks the OpenAI-compatible ``/openai/v1/chat/completions`` protocol the
+Groq SDK uses, both plain JSON and server-sent-event streaming, with
+configurable latency, token rate and error injection. Point the app at it
+with ``GROQ_API_BASE=http://127.0.0.1:<port>``.
+
+    python benchmarks/fake_groq_server.py --port 8765 --latency-ms 300 --tokens-per-sec 200
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqConfig:
+    def __init__(self, latency_ms: float = 200.0, tokens_per_sec: float = 0.0, response_tokens: int = 200,
+                 error_rate: float = 0.0, error_status: int = 500, retry_after: float = 1.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec  # 0 means no per-token delay
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'streamed': 0}
+
+
+def _completion_text(prompt: str, tokens: int) -> str:
+    words = ["analysis", "of", "the", "code", "shows", "a", "function", "with", "clear", "structure"]
+    return f"Fake answer ({len(prompt)} prompt chars): " + " ".join(words[i % len(words)] for i in range(tokens))
+
+
+def make_handler(config: FakeGroqConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/models'):
+                self._send_json(200, {'object': 'list', 'data': [{'id': 'fake', 'object': 'model'}]})
+            else:
+                self._send_json(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            with config.lock:
+                config.stats['requests'] += 1
+                fail = config.random.random() < config.error_rate
+                if fail:
+                    config.stats['errors'] += 1
+
+            time.sleep(config.latency_ms / 1000)
+            if fail:
+                headers = {'Retry-After': str(config.retry_after)} if config.error_status == 429 else {}
+                self._send_json(config.error_status, {'error': {'message': 'injected error', 'type': 'fake'}}, headers)
+                return
+
+            prompt = "\n".join(str(m.get('content', '')) for m in request.get('messages', []))
+            text = _completion_text(prompt, config.response_tokens)
+            model = request.get('model', 'fake')
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            usage = {
+                'prompt_tokens': len(prompt) // 4 + 1,
+                'completion_tokens': config.response_tokens,
+                'total_tokens': len(prompt) // 4 + 1 + config.response_tokens,
+            }
+
+            if not request.get('stream'):
+                if config.tokens_per_sec:
+                    time.sleep(config.response_tokens / config.tokens_per_sec)
+                self._send_json(200, {
+                    'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                 'finish_reason': 'stop'}],
+                    'usage': usage,
+                })
+                return
+
+            with config.lock:
+                config.stats['streamed'] += 1
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            pieces = text.split(' ')
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': piece + (' ' if i < len(pieces) - 1 else '')},
+                                 'finish_reason': None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                if config.tokens_per_sec:
+                    time.sleep(1 / config.tokens_per_sec)
+            final = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'x_groq': {'usage': usage},
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(config: FakeGroqConfig = None, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), make_handler(config or FakeGroqConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-groq', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='delay before the first byte')
+    parser.add_argument('--tokens-per-sec', type=float, default=0.0, help='generation rate, 0 for instant')
+    parser.add_argument('--response-tokens', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(args.latency_ms, args.tokens_per_sec, args.response_tokens,
+                            args.error_rate, args.error_status, args.retry_after, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    server.daemon_threads = True
+    print(f"Fake Groq server listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Offline benchmark suite for Code Wizard.
+
+Starts the fake Groq server in a separate process, points the app at it and
+drives ``get_llm_response`` and ``analyze_code`` (from ``analysis_core``),
+the HTTP API and the full chat flow (through Streamlit's ``AppTest`` harness)
+under N concurrent simulated sessions.
+Reports p50/p95/p99 latency, throughput and the change in resident memory per
+scenario (per session for the chat flow), and writes the results as JSON so
+runs can be compared.
+
+    python benchmarks/run_benchmarks.py --sessions 8 --requests 5 --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, 'app.py')
+
+SAMPLE_CODE = '''
+def fibonacci(n):
+    """Return the n-th Fibonacci number"""
+    if n < 2:
+        return n
+    return fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class Cache:
+    def __init__(self):
+        self.items = {{}}
+
+    def get(self, key):
+        return self.items.get(key)
+
+# run {marker}
+'''
+
+FOLLOW_UPS = [
+    "How can I optimize fibonacci?",
+    "Are there any security issues?",
+    "Explain the Cache class",
+]
+
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return round(ordered[min(rank, len(ordered)) - 1], 1)
+
+
+def summarize(latencies: list, errors: int, wall_seconds: float, extra: dict = None) -> dict:
+    result = {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+    }
+    result.update(extra or {})
+    return result
+
+
+def rss_kb():
+    """Current resident set size of this process in KB (not the peak), or None where /proc is unavailable"""
+    gc.collect()
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def rss_delta_kb(before, after):
+    return after - before if before is not None and after is not None else None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake_server(args) -> subprocess.Popen:
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, 'fake_groq_server.py'),
+        '--port', str(args.port),
+        '--latency-ms', str(args.latency_ms),
+        '--tokens-per-sec', str(args.tokens_per_sec),
+        '--response-tokens', str(args.response_tokens),
+        '--error-rate', str(args.error_rate),
+        '--error-status', str(args.error_status),
+    ]
+    if args.seed is not None:
+        cmd += ['--seed', str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # wait for the "listening" line
+    return proc
+
+
+def configure_environment(args, workdir: str):
+    """Point the app at the fake server and keep its cache and logs out of the repo"""
+    os.environ.update({
+        'GROQ_API_KEY': 'bench-key',
+        'GROQ_API_BASE': f"http://127.0.0.1:{args.port}",
+        'CODE_WIZARD_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'LOG_PATH': os.path.join(workdir, 'logs', 'code_wizard.log'),
+        'LOG_ECHO': '0',
+        'LLM_WARM_UP': '0',
+        'GROQ_POOL_SIZE': str(max(args.sessions, 1)),
+        # Measure the app, not the request budget; retries still apply
+        'LLM_RPM': os.getenv('LLM_RPM', '0'),
+        'LLM_TPM': os.getenv('LLM_TPM', '0'),
+    })
+    sys.path.insert(0, REPO_DIR)
+
+
+def run_concurrently(sessions: int, requests: int, call) -> tuple:
+    """Run ``call(session, i)`` requests times in each of N sessions; returns latencies, extras, errors, wall time"""
+    def session_worker(session: int):
+        latencies, extras, errors = [], [], 0
+        for i in range(requests):
+            start = time.perf_counter()
+            try:
+                ok, extra = call(session, i)
+            except Exception:
+                ok, extra = False, None
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+                if extra is not None:
+                    extras.append(extra)
+            else:
+                errors += 1
+        return latencies, extras, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(session_worker, range(sessions)))
+    wall = time.perf_counter() - start
+    latencies = [lat for r in results for lat in r[0]]
+    extras = [e for r in results for e in r[1]]
+    errors = sum(r[2] for r in results)
+    return latencies, extras, errors, wall
+
+
+def bench_get_llm_response(core, args) -> dict:
+    def call(session, i):
+        return bool(core.get_llm_response("Answer briefly: {query}", query=f"q {session} {i}")), None
+
+    latencies, _, errors, wall = run_concurrently(args.sessions, args.requests, call)
+    return summarize(latencies, errors, wall)
+
+
+def bench_analyze_code(core, args, stream: bool) -> dict:
+    def call(session, i):
+        code = SAMPLE_CODE.format(marker=uuid.uuid4().hex)
+        start = time.perf_counter()
+        response = core.analyze_code(code, is_initial_analysis=True, use_cache=False, stream=stream)
+        if not stream:
+            return bool(response), None
+        ttft = None
+        text = []
+        for piece in response or []:
+            if ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+            text.append(piece)
+        return bool(text), ttft
+
+    latencies, ttfts, errors, wall = run_concurrently(args.sessions, args.requests, call)
+    extra = {'ttft_p50_ms': percentile(ttfts, 50), 'ttft_p95_ms': percentile(ttfts, 95)} if stream else {}
+    return summarize(latencies, errors, wall, extra)
+
+
+def bench_api(args, stream: bool) -> dict:
+    """Initial analyses through api_server over HTTP, end to end"""
+    import httpx
+    import uvicorn
+    import api_server
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, name='bench-api', daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout)
+
+    def call(session, i):
+        body = {'code': SAMPLE_CODE.format(marker=uuid.uuid4().hex), 'use_cache': False, 'stream': stream}
+        if not stream:
+            return client.post('/v1/analyze', json=body).status_code == 200, None
+        start = time.perf_counter()
+        ttft, ok = None, False
+        with client.stream('POST', '/v1/analyze', json=body) as response:
+            for line in response.iter_lines():
+                if ttft is None and line.startswith('data: {"delta"'):
+                    ttft = (time.perf_counter() - start) * 1000
+                ok = ok or line == 'event: done'
+        return ok, ttft
+
+    try:
+        latencies, ttfts, errors, wall = run_concurrently(args.sessions, args.requests, call)
+    finally:
+        client.close()
+        server.should_exit = True
+    extra = {'ttft_p50_ms': percentile(ttfts, 50), 'ttft_p95_ms': percentile(ttfts, 95)} if stream else {}
+    return summarize(latencies, errors, wall, extra)
+
+
+def join_script_threads(timeout: float):
+    """Wait for AppTest script threads still finishing a run"""
+    for thread in threading.enumerate():
+        if thread.name.startswith('ScriptRunner') and thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+def chat_session(session: int, args, barrier, results):
+    """One simulated chat session: log in, submit code, ask follow-ups; runs in its own process"""
+    from streamlit.testing.v1 import AppTest
+    from llm_client import load_modules
+
+    latencies, errors = [], 0
+    # A throwaway run imports the app, so the baseline leaves out memory every session shares
+    load_modules()
+    AppTest.from_file(APP_PATH, default_timeout=args.timeout).run()
+    join_script_threads(args.timeout)
+    rss_before = rss_kb()
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    barrier.wait()
+    started = time.time()
+    # One analysis plus (requests - 1) follow-ups
+    for i in range(max(args.requests, 1)):
+        try:
+            if i == 0:
+                at.run()
+                at.text_input[0].input(f"bench{session}")
+                at.button[0].click().run()
+                at.sidebar.checkbox[1].set_value(args.stream).run()
+                at.text_area[0].input(SAMPLE_CODE.format(marker=uuid.uuid4().hex))
+                start = time.perf_counter()
+                next(b for b in at.button if 'Analyze' in b.label).click().run()
+            else:
+                start = time.perf_counter()
+                at.chat_input[0].set_value(FOLLOW_UPS[(i - 1) % len(FOLLOW_UPS)]).run()
+            ok = not at.exception and at.session_state.history.recent(1)[0]['role'] == 'assistant'
+        except Exception:
+            ok = False
+        if ok:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+    finished = time.time()
+    join_script_threads(args.timeout)
+    results.put((latencies, errors, started, finished, rss_delta_kb(rss_before, rss_kb())))
+
+
+def bench_chat_flow(args) -> dict:
+    """Full UI flow through AppTest, each session in its own process.
+
+    AppTest installs a process-wide mock Runtime for every run and removes it when the run ends, so
+    concurrent runs in one process pull it out from under each other's script threads.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.sessions)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=chat_session, args=(session, args, barrier, results), name=f"bench-chat-{session}")
+             for session in range(args.sessions)]
+    for proc in procs:
+        proc.start()
+    sessions = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    latencies = [lat for s in sessions for lat in s[0]]
+    errors = sum(s[1] for s in sessions)
+    wall = max(s[3] for s in sessions) - min(s[2] for s in sessions)
+    rss = [s[4] for s in sessions if s[4] is not None]
+    return summarize(latencies, errors, wall, {
+        'rss_per_session_kb': round(sum(rss) / len(rss), 1) if rss else None,
+    })
+
+
+def measure_rss(bench, *args, **kwargs) -> dict:
+    """Run a scenario in this process and add the change in resident memory it caused"""
+    before = rss_kb()
+    result = bench(*args, **kwargs)
+    result['rss_delta_kb'] = rss_delta_kb(before, rss_kb())
+    return result
+
+
+def compare(current: dict, previous: dict):
+    """Print per-metric percentage changes against a previous results file"""
+    print(f"\nComparison with {previous.get('timestamp', 'previous run')}:")
+    for name, metrics in current['scenarios'].items():
+        old = previous.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'ttft_p50_ms', 'rss_delta_kb',
+                    'rss_per_session_kb'):
+            if metrics.get(key) is not None and old.get(key):
+                delta = (metrics[key] - old[key]) / old[key] * 100
+                changes.append(f"{key} {old[key]} -> {metrics[key]} ({delta:+.1f}%)")
+        print(f"  {name}: " + "; ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sessions', type=int, default=4, help='concurrent simulated sessions')
+    parser.add_argument('--requests', type=int, default=5, help='requests per session')
+    parser.add_argument('--scenarios', default='llm,analyze,analyze_stream,api,api_stream,chat')
+    parser.add_argument('--stream', action='store_true', help='stream responses in the chat scenario')
+    parser.add_argument('--latency-ms', type=float, default=200.0)
+    parser.add_argument('--tokens-per-sec', type=float, default=0.0)
+    parser.add_argument('--response-tokens', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=60.0, help='AppTest timeout per rerun in seconds')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    workdir = tempfile.mkdtemp(prefix='code-wizard-bench-')
+    configure_environment(args, workdir)
+    server = start_fake_server(args)
+    try:
+        import analysis_core as core
+        from llm_client import load_modules
+        load_modules()  # keep the one-off lazy import out of the first measurement
+
+        scenarios = {}
+        selected = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+        if 'llm' in selected:
+            scenarios['get_llm_response'] = measure_rss(bench_get_llm_response, core, args)
+        if 'analyze' in selected:
+            scenarios['analyze_code'] = measure_rss(bench_analyze_code, core, args, stream=False)
+        if 'analyze_stream' in selected:
+            scenarios['analyze_code_stream'] = measure_rss(bench_analyze_code, core, args, stream=True)
+        if 'api' in selected:
+            scenarios['api_analyze'] = measure_rss(bench_api, args, stream=False)
+        if 'api_stream' in selected:
+            scenarios['api_analyze_stream'] = measure_rss(bench_api, args, stream=True)
+        if 'chat' in selected:
+            scenarios['chat_flow'] = bench_chat_flow(args)
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'port')},
+        'scenarios': scenarios,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
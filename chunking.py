@@ -0,0 +1,184 @@
+"""AST-aware splitting of source code into units and token-bounded chunks.
+
+Python source is split at top-level function and class boundaries (classes
+that are too large are split further into their methods). Code that does not
+parse as Python falls back to splitting at blank lines.
+"""
+import ast
+from dataclasses import dataclass, field
+
+
+# Rough characters-per-token ratio for code with the Mixtral tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting prompts"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class CodeUnit:
+    name: str
+    kind: str  # 'function', 'class', 'method', 'module' or 'block'
+    start_line: int
+    end_line: int
+    source: str
+    docstring: str = None
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.source)
+
+
+@dataclass
+class Chunk:
+    start_line: int
+    end_line: int
+    source: str
+    names: list = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.source)
+
+
+def _node_start(node) -> int:
+    decorators = getattr(node, 'decorator_list', None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _slice(lines: list, start: int, end: int) -> str:
+    return "\n".join(lines[start - 1:end])
+
+
+def _docstring(node):
+    try:
+        return ast.get_docstring(node)
+    except TypeError:
+        return None
+
+
+def _split_blocks(lines: list, start: int, end: int) -> list:
+    """Split a line range into blocks at blank lines"""
+    units = []
+    block_start = None
+    for lineno in range(start, end + 1):
+        if lines[lineno - 1].strip():
+            if block_start is None:
+                block_start = lineno
+        elif block_start is not None:
+            units.append(CodeUnit(f"lines {block_start}-{lineno - 1}", 'block', block_start, lineno - 1,
+                                  _slice(lines, block_start, lineno - 1)))
+            block_start = None
+    if block_start is not None:
+        units.append(CodeUnit(f"lines {block_start}-{end}", 'block', block_start, end,
+                              _slice(lines, block_start, end)))
+    return units
+
+
+def split_units(code: str, max_tokens: int = None) -> list:
+    """Split code into function/class/module-level units in source order.
+
+    Classes larger than ``max_tokens`` are split into their methods, with the
+    class header and attributes kept as a separate unit.
+    """
+    lines = code.splitlines()
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return _split_blocks(lines, 1, len(lines))
+
+    units = []
+    pending_start = None
+
+    def flush_module_code(end: int):
+        nonlocal pending_start
+        if pending_start is not None and pending_start <= end:
+            source = _slice(lines, pending_start, end)
+            if source.strip():
+                units.append(CodeUnit(f"module lines {pending_start}-{end}", 'module',
+                                      pending_start, end, source))
+        pending_start = None
+
+    for node in tree.body:
+        start, end = _node_start(node), node.end_lineno
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            flush_module_code(start - 1)
+            source = _slice(lines, start, end)
+            if (isinstance(node, ast.ClassDef) and max_tokens
+                    and estimate_tokens(source) > max_tokens):
+                units.extend(_split_class(node, lines))
+            else:
+                kind = 'class' if isinstance(node, ast.ClassDef) else 'function'
+                units.append(CodeUnit(node.name, kind, start, end, source, _docstring(node)))
+        elif pending_start is None:
+            pending_start = start
+    flush_module_code(len(lines))
+    return units
+
+
+def _split_class(node: ast.ClassDef, lines: list) -> list:
+    units = []
+    header_end = node.end_lineno
+    methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    if methods:
+        header_end = _node_start(methods[0]) - 1
+    units.append(CodeUnit(node.name, 'class', _node_start(node), header_end,
+                          _slice(lines, _node_start(node), header_end), _docstring(node)))
+    for method in methods:
+        start = _node_start(method)
+        units.append(CodeUnit(f"{node.name}.{method.name}", 'method', start, method.end_lineno,
+                              _slice(lines, start, method.end_lineno), _docstring(method)))
+    return units
+
+
+def _split_oversized(unit: CodeUnit, max_tokens: int) -> list:
+    """Hard-split a unit that is still over budget by line count"""
+    lines = unit.source.splitlines()
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces, current, size, start = [], [], 0, unit.start_line
+    for offset, line in enumerate(lines):
+        if current and size + len(line) + 1 > max_chars:
+            pieces.append(Chunk(start, start + len(current) - 1, "\n".join(current), [unit.name]))
+            start = unit.start_line + offset
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append(Chunk(start, start + len(current) - 1, "\n".join(current), [unit.name]))
+    return pieces
+
+
+def chunk_code(code: str, max_tokens: int) -> list:
+    """Pack consecutive units into chunks of at most ``max_tokens`` estimated tokens"""
+    chunks = []
+    current = None
+    for unit in split_units(code, max_tokens):
+        if unit.tokens > max_tokens:
+            if current:
+                chunks.append(current)
+                current = None
+            chunks.extend(_split_oversized(unit, max_tokens))
+            continue
+        if current and estimate_tokens(current.source + "\n" + unit.source) > max_tokens:
+            chunks.append(current)
+            current = None
+        if current is None:
+            current = Chunk(unit.start_line, unit.end_line, unit.source, [unit.name])
+        else:
+            current.source += "\n" + unit.source
+            current.end_line = unit.end_line
+            current.names.append(unit.name)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def outline(code: str) -> str:
+    """One line per top-level unit, used to give chunk prompts whole-file context"""
+    return "\n".join(
+        f"- {unit.kind} {unit.name} (lines {unit.start_line}-{unit.end_line})"
+        for unit in split_units(code)
+        if unit.kind not in ('module', 'block')
+    )
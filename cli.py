@@ -0,0 +1,138 @@
+"""Headless batch analysis for CI and scheduled jobs.
+
+Analyzes files given as paths, directories or glob patterns across worker
+processes, each running several analyses on threads, and appends one JSON
+line per file to the output. Files whose content is unchanged since a
+successful run in the same output file are skipped, so an interrupted or
+partially failed run can simply be started again.
+
+    python cli.py 'src/**/*.py' setup.py --output analysis.jsonl --processes 4 --threads 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from batch_analysis import collect_from_paths, BATCH_CONCURRENCY, MAX_FILES, MAX_FILE_BYTES
+from llm_backends import get_backends, NO_BACKEND_MESSAGE
+from static_analysis import code_hash
+
+
+DEFAULT_OUTPUT = 'analysis_results.jsonl'
+
+
+def load_completed(output_path: str) -> dict:
+    """Content hashes of the files already analyzed successfully, by path"""
+    completed = {}
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if record.get('status') == 'ok':
+                completed[record['path']] = record['sha256']
+            else:
+                completed.pop(record.get('path'), None)
+    return completed
+
+
+def _init_worker(processes: int):
+    """Split the request budgets between the worker processes"""
+    from scheduler import scheduler, LLM_RPM, LLM_TPM
+    scheduler.set_limits(LLM_RPM / processes, LLM_TPM / processes)
+
+
+def _analyze_one(path: str, code: str, use_cache: bool) -> dict:
+    import analysis_core
+    record = {'path': path, 'sha256': code_hash(code), 'status': 'ok', 'analysis': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        record['analysis'] = analysis_core.analyze_code(code, use_cache=use_cache)
+        if not record['analysis']:
+            raise RuntimeError("Empty response from the LLM")
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {str(e)}")
+    record['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    record['timestamp'] = datetime.now().isoformat()
+    return record
+
+
+def analyze_chunk(files: list, threads: int, use_cache: bool = True) -> list:
+    """Analyze (path, code) pairs on a thread pool; runs inside a worker process"""
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        return list(pool.map(lambda item: _analyze_one(item[0], item[1], use_cache), files))
+
+
+def run(patterns: list, output_path: str = DEFAULT_OUTPUT, processes: int = 1, threads: int = BATCH_CONCURRENCY,
+        use_cache: bool = True, resume: bool = True, max_files: int = MAX_FILES,
+        max_file_bytes: int = MAX_FILE_BYTES, echo=print) -> dict:
+    """Analyze every matched file not already done and append the results to ``output_path``"""
+    sources = collect_from_paths(patterns, max_files, max_file_bytes)
+    completed = load_completed(output_path) if resume else {}
+    todo = [(s.path, s.code) for s in sources if completed.get(s.path) != code_hash(s.code)]
+    summary = {'matched': len(sources), 'skipped': len(sources) - len(todo), 'ok': 0, 'errors': 0}
+    echo(f"{len(sources)} files matched, {summary['skipped']} already done, {len(todo)} to analyze")
+    if not todo:
+        return summary
+
+    # Small chunks keep progress (and what a rerun can skip) close to what has finished
+    chunks = [todo[i:i + threads] for i in range(0, len(todo), threads)]
+    if processes > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=processes,
+            # Fresh interpreters, so no worker inherits the parent's background threads
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(processes,)
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with executor, open(output_path, 'a', encoding='utf-8') as out:
+        futures = [executor.submit(analyze_chunk, chunk, threads, use_cache) for chunk in chunks]
+        for future in as_completed(futures):
+            for record in future.result():
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                summary['ok' if record['status'] == 'ok' else 'errors'] += 1
+                echo(f"[{summary['ok'] + summary['errors']}/{len(todo)}] {record['status']:5} "
+                     f"{record['path']} ({record['elapsed_ms'] / 1000:.1f}s)")
+            out.flush()
+    summary['elapsed_s'] = round(time.perf_counter() - start, 1)
+    return summary
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('paths', nargs='+', help='files, directories or glob patterns (quote ** patterns)')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT, help='JSONL file results are appended to')
+    parser.add_argument('--processes', '-p', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--threads', '-t', type=int, default=BATCH_CONCURRENCY, help='concurrent analyses per process')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the response cache')
+    parser.add_argument('--no-resume', action='store_true', help='analyze files even if already in the output')
+    parser.add_argument('--max-files', type=int, default=MAX_FILES)
+    parser.add_argument('--max-file-bytes', type=int, default=MAX_FILE_BYTES)
+    args = parser.parse_args(argv)
+
+    if not get_backends():
+        print(NO_BACKEND_MESSAGE, file=sys.stderr)
+        return 2
+
+    summary = run(args.paths, args.output, max(1, args.processes), max(1, args.threads),
+                  use_cache=not args.no_cache, resume=not args.no_resume,
+                  max_files=args.max_files, max_file_bytes=args.max_file_bytes,
+                  echo=lambda message: print(message, file=sys.stderr))
+    print(json.dumps(summary))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Incremental re-analysis of resubmitted code.
+
+A resubmission is diffed against the previous code at function and class
+granularity (the units from ``chunking.split_units``). Only added and
+modified units go to the LLM, and each unit's notes are cached by the unit's
+own content, so a unit that is edited and then reverted costs nothing. A
+final prompt combines the previous analysis, the diff and the notes on the
+changed units into an updated analysis that starts with what changed.
+Unchanged units are already covered by the previous analysis and are not
+sent again. When most of the file changed, a full analysis is used instead.
+"""
+import difflib
+import os
+from dataclasses import dataclass, field
+
+from chunking import split_units, estimate_tokens, outline
+from llm_client import DEFAULT_TEMPERATURE
+from map_reduce import invoke_all, CHUNK_TOKENS, MAP_CONCURRENCY, OUTLINE_MAX_CHARS
+from model_router import router, INITIAL_ANALYSIS
+from response_cache import get_response_cache, make_cache_key, normalize_code
+from scheduler import BULK
+from static_analysis import build_index, summarize
+
+
+# Above this share of the new code's tokens in changed units, a full analysis is cheaper and better
+INCREMENTAL_MAX_CHANGED_RATIO = float(os.getenv('INCREMENTAL_MAX_CHANGED_RATIO', '0.5'))
+PREVIOUS_ANALYSIS_MAX_CHARS = 12000
+CHANGES_MAX_CHARS = 8000
+
+UNIT_ANALYSIS_PROMPT = """
+    You are analyzing one {kind} of a larger file: {name}
+
+    Outline of the whole file:
+    {outline}
+
+    ```
+    {code}
+    ```
+
+    Concisely describe for this {kind} only:
+    - What it does
+    - Performance and security concerns
+    - Potential improvements
+    """
+
+CHANGE_ANALYSIS_PROMPT = """
+    As a coding expert, you analyzed an earlier version of some code:
+
+    {previous_analysis}
+
+    The code has since been edited. The changes:
+
+    {changes}
+
+    Notes on each added or modified part:
+
+    {notes}
+
+    Provide an updated analysis, starting with:
+    🔄 What changed: a short summary of the edits and their effect, including any new or fixed issues
+
+    Then update each section of the earlier analysis, keeping what still holds for unchanged code:
+    1. 🎯 Overview of what the code does
+    2. 🔍 Key components and their functionality
+    3. 💡 Notable programming concepts used
+    4. ⚡ Performance considerations
+    5. 🛡️ Security considerations if applicable
+    6. ✨ Potential improvements and best practices
+
+    Make your explanation clear, engaging, and actionable, using emojis and formatting to enhance readability.
+    """
+
+
+@dataclass
+class UnitDiff:
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    modified: list = field(default_factory=list)  # (old unit, new unit) pairs
+    unchanged: list = field(default_factory=list)
+
+    @property
+    def changed_units(self) -> list:
+        """Units of the new code that need analyzing"""
+        return self.added + [new for _, new in self.modified]
+
+    def changed_ratio(self) -> float:
+        total = sum(unit.tokens for unit in self.changed_units + self.unchanged)
+        return sum(unit.tokens for unit in self.changed_units) / total if total else 0.0
+
+
+def _unit_key(unit) -> tuple:
+    # Module-level code and blocks are named after their line numbers, which shift with any edit above them
+    if unit.kind in ('module', 'block'):
+        return unit.kind, normalize_code(unit.source)
+    return unit.kind, unit.name
+
+
+def diff_units(old_code: str, new_code: str, max_tokens: int = CHUNK_TOKENS) -> UnitDiff:
+    """Match the units of two versions of a file by name and compare their source"""
+    old_units = {_unit_key(unit): unit for unit in split_units(old_code, max_tokens)}
+    diff = UnitDiff()
+    for unit in split_units(new_code, max_tokens):
+        previous = old_units.pop(_unit_key(unit), None)
+        if previous is None:
+            diff.added.append(unit)
+        elif normalize_code(previous.source) == normalize_code(unit.source):
+            diff.unchanged.append(unit)
+        else:
+            diff.modified.append((previous, unit))
+    diff.removed = list(old_units.values())
+    return diff
+
+
+def format_changes(diff: UnitDiff, max_chars: int = CHANGES_MAX_CHARS) -> str:
+    """The diff as prompt text: removed names, added sources and unified diffs of modified units"""
+    parts = [f"Removed {unit.kind} {unit.name}" for unit in diff.removed]
+    parts.extend(f"Added {unit.kind} {unit.name}:\n```\n{unit.source}\n```" for unit in diff.added)
+    for old, new in diff.modified:
+        lines = difflib.unified_diff(old.source.splitlines(), new.source.splitlines(),
+                                     'before', 'after', n=2, lineterm='')
+        parts.append(f"Modified {new.kind} {new.name}:\n```diff\n" + "\n".join(lines) + "\n```")
+    text = "\n\n".join(parts)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n... (remaining changes truncated)"
+
+
+def _notes_key(unit, model: str) -> str:
+    return make_cache_key(unit.source, UNIT_ANALYSIS_PROMPT, unit.name, model, DEFAULT_TEMPERATURE)
+
+
+def unit_notes(units: list, code: str, invoke, use_cache: bool = True,
+               concurrency: int = MAP_CONCURRENCY) -> tuple:
+    """Notes on each unit, from the response cache when that exact unit was analyzed before.
+
+    ``invoke`` makes the LLM calls (see map_reduce.invoke_all); notes are cached under the model that
+    served them. Returns the notes and the number of units that needed an LLM call.
+    """
+    cache = get_response_cache()
+    index = build_index(code)
+    file_outline = (summarize(index) if index else outline(code))[:OUTLINE_MAX_CHARS]
+    inputs = [{'kind': unit.kind, 'name': unit.name, 'outline': file_outline, 'code': unit.source}
+              for unit in units]
+    notes = [None] * len(units)
+    if use_cache:
+        for i, unit in enumerate(units):
+            # Looked up under the model the unit would be routed to now
+            tokens = estimate_tokens(UNIT_ANALYSIS_PROMPT + file_outline + unit.source)
+            notes[i] = cache.get(_notes_key(unit, router.route(INITIAL_ANALYSIS, tokens)[0].name))
+    missing = [i for i, note in enumerate(notes) if not note]
+    if missing:
+        results = invoke_all(UNIT_ANALYSIS_PROMPT, [inputs[i] for i in missing], invoke, concurrency, BULK)
+        for i, (note, model) in zip(missing, results):
+            if note and model:
+                cache.set(_notes_key(units[i], model), note)
+            notes[i] = note
+    return [f"{unit.kind} {unit.name}:\n{note}" for unit, note in zip(units, notes)], len(missing)
+
+
+def change_prompt_kwargs(diff: UnitDiff, notes: list, previous_analysis: str) -> dict:
+    """Kwargs for CHANGE_ANALYSIS_PROMPT"""
+    if len(previous_analysis) > PREVIOUS_ANALYSIS_MAX_CHARS:
+        previous_analysis = previous_analysis[:PREVIOUS_ANALYSIS_MAX_CHARS] + "\n..."
+    return {
+        'previous_analysis': previous_analysis,
+        'changes': format_changes(diff) or "(no structural changes)",
+        'notes': "\n\n".join(notes) or "(only removals)",
+    }
+
+
+def worth_incremental(diff: UnitDiff, code: str, previous_analysis: str) -> bool:
+    """False when so much changed, or the file is so small, that a full analysis is the better choice"""
+    if not diff.unchanged or diff.changed_ratio() > INCREMENTAL_MAX_CHANGED_RATIO:
+        return False
+    # Changed units are sent twice (unit prompt and diff) and the previous analysis rides along
+    changed_tokens = sum(unit.tokens for unit in diff.changed_units)
+    previous_tokens = estimate_tokens(previous_analysis[:PREVIOUS_ANALYSIS_MAX_CHARS])
+    return 2 * changed_tokens + previous_tokens < estimate_tokens(code)
@@ -0,0 +1,156 @@
+"""Ingestion of uploaded source files.
+
+Uploads whose reported size is over the byte cap are rejected before any
+read; the rest are read in fixed-size chunks, stopping as soon as a file goes
+over the byte or line cap, so an oversized upload is never decoded. The
+source uploader's own limit in the app matches the byte cap, since Streamlit
+buffers an upload in full before the app sees it. The encoding is detected from a byte order mark, then by
+trying UTF-8 with a Latin-1 fallback. Binary content is rejected. Decoded
+sources are deduplicated by content hash, so uploading the same file again,
+from any session, reuses the same string. This module also provides the line
+paging used to display large sources a page at a time.
+"""
+import codecs
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(2 * 1024 * 1024)))  # 2MB
+UPLOAD_MAX_LINES = int(os.getenv('UPLOAD_MAX_LINES', '50000'))
+READ_CHUNK_BYTES = 64 * 1024
+BINARY_SNIFF_BYTES = 8192
+INGEST_CACHE_SIZE = 32
+
+# Byte order marks, longest first so UTF-32 isn't mistaken for UTF-16
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# Control bytes that never appear in text files (tab, newline, carriage return and form feed are allowed)
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in (9, 10, 12, 13))
+
+
+class IngestError(ValueError):
+    """An upload that cannot be used as source code; the message is shown to the user"""
+
+
+@dataclass
+class IngestedSource:
+    name: str
+    code: str
+    sha256: str
+    encoding: str
+    size_bytes: int
+    lines: int
+    duplicate: bool = False
+
+
+_ingested = OrderedDict()  # sha256 -> IngestedSource
+_ingested_lock = threading.Lock()
+
+
+def _format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.0f} KB" if size >= 1024 else f"{size} bytes"
+
+
+def _bom_encoding(data: bytes):
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding
+    return None
+
+
+def detect_encoding(data: bytes) -> str:
+    """The encoding named by a byte order mark, else UTF-8 if the data decodes as UTF-8, else Latin-1"""
+    bom_encoding = _bom_encoding(data)
+    if bom_encoding:
+        return bom_encoding
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def looks_binary(sample: bytes) -> bool:
+    """NUL bytes or lots of control characters in the first bytes of a file without a UTF-16/32 BOM"""
+    if not sample:
+        return False
+    if b'\x00' in sample:
+        return True
+    return len(sample.translate(None, _CONTROL_BYTES)) < len(sample) * 0.9
+
+
+def read_upload(fileobj, name: str, max_bytes: int = UPLOAD_MAX_BYTES,
+                max_lines: int = UPLOAD_MAX_LINES) -> IngestedSource:
+    """Read and decode an uploaded file, enforcing the size and line caps while reading"""
+    if getattr(fileobj, 'size', 0) > max_bytes:
+        raise IngestError(f"{name} is larger than {_format_size(max_bytes)}")
+    chunks, size, lines = [], 0, 0
+    digest = hashlib.sha256()
+    while True:
+        chunk = fileobj.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        # UTF-16 and UTF-32 text is full of NUL bytes, so only files without a BOM are sniffed
+        if not chunks and not _bom_encoding(chunk) and looks_binary(chunk[:BINARY_SNIFF_BYTES]):
+            raise IngestError(f"{name} looks like a binary file, not source code")
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+        if size > max_bytes:
+            raise IngestError(f"{name} is larger than {_format_size(max_bytes)}")
+        if lines > max_lines:
+            raise IngestError(f"{name} has more than {max_lines} lines")
+        digest.update(chunk)
+        chunks.append(chunk)
+
+    sha256 = digest.hexdigest()
+    with _ingested_lock:
+        known = _ingested.get(sha256)
+        if known is not None:
+            _ingested.move_to_end(sha256)
+            return IngestedSource(name, known.code, sha256, known.encoding, size, known.lines, duplicate=True)
+
+    data = b"".join(chunks)
+    encoding = detect_encoding(data)
+    try:
+        code = data.decode(encoding).replace('\r\n', '\n')
+    except UnicodeDecodeError:
+        raise IngestError(f"{name} is not valid {encoding} text")
+    if not code.strip():
+        raise IngestError(f"{name} is empty")
+    source = IngestedSource(name, code, sha256, encoding, size, code.count('\n') + 1)
+    with _ingested_lock:
+        _ingested[sha256] = source
+        while len(_ingested) > INGEST_CACHE_SIZE:
+            _ingested.popitem(last=False)
+    return source
+
+
+@lru_cache(maxsize=8)
+def _line_starts(code: str) -> list:
+    starts = [0]
+    position = code.find('\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = code.find('\n', position + 1)
+    return starts
+
+
+def line_count(code: str) -> int:
+    return len(_line_starts(code))
+
+
+def code_page(code: str, page: int, page_lines: int) -> tuple:
+    """Lines of page ``page`` (0-based) as (text, first line, last line); 1-based line numbers"""
+    starts = _line_starts(code)
+    first = min(max(0, page), max(0, (len(starts) - 1) // page_lines)) * page_lines
+    last = min(first + page_lines, len(starts))
+    end = starts[last] - 1 if last < len(starts) else len(code)
+    return code[starts[first]:end], first + 1, last
@@ -0,0 +1,306 @@
+"""Pluggable LLM backends.
+
+A backend is a provider that serves chat models. Groq is one. Any server
+that speaks the OpenAI chat-completions protocol is another, such as a
+llama.cpp server running on the CPU of the same host. Each backend has its
+own per-request timeout, a cap on concurrent requests and a health check.
+Health is checked lazily in the background and updated by every call's
+outcome. The model router ranks models across all configured backends and
+skips unhealthy ones. This way a local model answers small snippets without
+a network round trip, and stands in when the remote provider is slow or
+unreachable.
+
+    LOCAL_LLM_BASE_URL=http://127.0.0.1:8080/v1 LOCAL_LLM_MODEL=qwen2.5-coder-1.5b streamlit run app.py
+"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+import llm_client
+from llm_client import get_chain, load_modules, POOL_SIZE
+from scheduler import scheduler, is_unreachable, INTERACTIVE
+
+
+load_dotenv()
+GROQ = 'groq'
+LOCAL = 'local'
+
+GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+GROQ_API_BASE = os.getenv('GROQ_API_BASE', 'https://api.groq.com').rstrip('/')
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', '0'))  # 0: only the routing policy's per-task timeout applies
+GROQ_CONCURRENCY = int(os.getenv('GROQ_CONCURRENCY', str(POOL_SIZE)))
+
+LOCAL_LLM_BASE_URL = os.getenv('LOCAL_LLM_BASE_URL', '').rstrip('/')  # e.g. http://127.0.0.1:8080/v1
+LOCAL_LLM_API_KEY = os.getenv('LOCAL_LLM_API_KEY', '')
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'local')
+# Small models on a CPU have small windows, which keeps them to small snippets
+LOCAL_LLM_CONTEXT_TOKENS = int(os.getenv('LOCAL_LLM_CONTEXT_TOKENS', '4096'))
+LOCAL_LLM_TIER = os.getenv('LOCAL_LLM_TIER', 'fast')
+LOCAL_LLM_TIMEOUT = float(os.getenv('LOCAL_LLM_TIMEOUT', '20'))
+# A CPU server computes one request at a time; more only queue up on its side
+LOCAL_LLM_CONCURRENCY = int(os.getenv('LOCAL_LLM_CONCURRENCY', '1'))
+
+HEALTH_CHECK_INTERVAL = float(os.getenv('LLM_HEALTH_CHECK_INTERVAL', '30'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('LLM_HEALTH_CHECK_TIMEOUT', '3'))
+
+NO_BACKEND_MESSAGE = ("No LLM backend configured. Set GROQ_API_KEY (or LOCAL_LLM_BASE_URL for a local model) "
+                      "in your environment variables.")
+
+
+class Backend(ABC):
+    """A provider of chat models with its own timeout, concurrency cap and health"""
+
+    def __init__(self, name: str, base_url: str, timeout: float = 0, concurrency: int = 0):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout or None
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self._lock = threading.Lock()
+        self._healthy = True  # until a check or a call says otherwise
+        self._checked_at = None
+        self._checking = False
+        self._stats = {'requests': 0, 'failures': 0, 'unreachable': 0, 'in_flight': 0,
+                       'health_checks': 0, 'health_failures': 0}
+
+    def request_timeout(self, policy_timeout: float) -> float:
+        """The per-request timeout: the task's, capped by the backend's own"""
+        return min(policy_timeout, self.timeout) if self.timeout else policy_timeout
+
+    @abstractmethod
+    def chain(self, prompt_template: str, model_name: str, temperature: float, timeout: float):
+        """A ``prompt | llm`` chain: ``invoke(kwargs)`` and ``stream(kwargs)`` give messages with ``content``"""
+
+    def run(self, fn, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        """Call ``fn()`` against this backend"""
+        return self._call(fn)
+
+    def stream(self, start_stream, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        """Iterate ``start_stream()`` against this backend"""
+        return self._iterate(start_stream)
+
+    @abstractmethod
+    def _health_request(self):
+        """The URL and headers of a cheap request that succeeds while the backend is up"""
+
+    @contextmanager
+    def _slot(self):
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['in_flight'] += 1
+        try:
+            yield
+        except Exception as e:
+            self._failed(e)
+            raise
+        else:
+            self._set_health(True)
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def _call(self, fn):
+        with self._slot():
+            return fn()
+
+    def _iterate(self, start_stream):
+        with self._slot():
+            yield from start_stream()
+
+    def _failed(self, error: Exception):
+        unreachable = is_unreachable(error)
+        with self._lock:
+            self._stats['failures'] += 1
+            self._stats['unreachable'] += int(unreachable)
+        if unreachable:
+            # Routed around until the next health check finds it back
+            self._set_health(False)
+
+    def _set_health(self, healthy: bool):
+        with self._lock:
+            self._healthy = healthy
+            self._checked_at = time.monotonic()
+
+    def check_health(self) -> bool:
+        """Probe the backend now"""
+        try:
+            load_modules()
+            url, headers = self._health_request()
+            healthy = llm_client.httpx.get(url, headers=headers, timeout=HEALTH_CHECK_TIMEOUT).is_success
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._stats['health_checks'] += 1
+            self._stats['health_failures'] += int(not healthy)
+            self._checking = False
+        self._set_health(healthy)
+        return healthy
+
+    def healthy(self) -> bool:
+        """The latest known health; a stale one is refreshed in the background without waiting for it"""
+        with self._lock:
+            stale = not self._checking and (
+                self._checked_at is None or time.monotonic() - self._checked_at > HEALTH_CHECK_INTERVAL
+            )
+            if stale:
+                self._checking = True
+            healthy = self._healthy
+        if stale:
+            threading.Thread(target=self.check_health, name=f'llm-health-{self.name}', daemon=True).start()
+        return healthy
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['healthy'] = self._healthy
+        stats['concurrency'] = self.concurrency
+        return stats
+
+
+class GroqBackend(Backend):
+    """Groq through the shared LangChain chains, within the scheduler's rate-limit budgets"""
+
+    def __init__(self, api_key: str, base_url: str = GROQ_API_BASE, timeout: float = GROQ_TIMEOUT,
+                 concurrency: int = GROQ_CONCURRENCY):
+        super().__init__(GROQ, base_url, timeout, concurrency)
+        self.api_key = api_key
+
+    def chain(self, prompt_template: str, model_name: str, temperature: float, timeout: float):
+        return get_chain(prompt_template, self.api_key, model_name, temperature, timeout)
+
+    def run(self, fn, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        return scheduler.run(lambda: self._call(fn), priority, tokens, retry_timeouts=retry_timeouts)
+
+    def stream(self, start_stream, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        return scheduler.stream(lambda: self._iterate(start_stream), priority, tokens, retry_timeouts=retry_timeouts)
+
+    def _health_request(self):
+        return f"{self.base_url}/openai/v1/models", {'Authorization': f"Bearer {self.api_key}"}
+
+
+@dataclass
+class Message:
+    content: str
+
+
+class OpenAICompatibleChain:
+    """Stand-in for a LangChain ``prompt | llm`` chain against an OpenAI-compatible chat-completions endpoint"""
+
+    def __init__(self, backend: 'OpenAICompatibleBackend', prompt_template: str, model_name: str,
+                 temperature: float, timeout: float):
+        self.backend = backend
+        self.prompt_template = prompt_template
+        self.model_name = model_name
+        self.temperature = temperature
+        self.timeout = timeout
+
+    def _request(self, kwargs: dict, stream: bool) -> dict:
+        return {
+            'model': self.model_name,
+            'messages': [{'role': 'user', 'content': self.prompt_template.format(**kwargs)}],
+            'temperature': self.temperature,
+            'stream': stream,
+        }
+
+    def invoke(self, kwargs: dict) -> Message:
+        response = self.backend.http_client().post(
+            f"{self.backend.base_url}/chat/completions", json=self._request(kwargs, False),
+            headers=self.backend.headers(), timeout=self.timeout
+        )
+        response.raise_for_status()
+        return Message(response.json()['choices'][0]['message'].get('content') or "")
+
+    def stream(self, kwargs: dict):
+        with self.backend.http_client().stream(
+            'POST', f"{self.backend.base_url}/chat/completions", json=self._request(kwargs, True),
+            headers=self.backend.headers(), timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield Message(content)
+
+
+class OpenAICompatibleBackend(Backend):
+    """Any server with an OpenAI-compatible ``/chat/completions`` endpoint, e.g. llama.cpp's ``llama-server``.
+
+    Calls bypass the scheduler: its budgets are Groq's rate limits, and a local
+    server's limit is the concurrency cap.
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str = '', timeout: float = LOCAL_LLM_TIMEOUT,
+                 concurrency: int = LOCAL_LLM_CONCURRENCY):
+        super().__init__(name, base_url, timeout, concurrency)
+        self.api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def headers(self) -> dict:
+        return {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def http_client(self):
+        load_modules()
+        with self._client_lock:
+            if self._client is None:
+                connections = self.concurrency if self.concurrency > 0 else POOL_SIZE
+                self._client = llm_client.httpx.Client(limits=llm_client.httpx.Limits(
+                    max_connections=connections, max_keepalive_connections=connections
+                ))
+        return self._client
+
+    def chain(self, prompt_template: str, model_name: str, temperature: float, timeout: float):
+        return OpenAICompatibleChain(self, prompt_template, model_name, temperature, timeout)
+
+    def _health_request(self):
+        return f"{self.base_url}/models", self.headers()
+
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def get_backends() -> dict:
+    """The configured backends by name"""
+    global _backends
+    with _backends_lock:
+        if _backends is None:
+            _backends = {}
+            if GROQ_API_KEY:
+                _backends[GROQ] = GroqBackend(GROQ_API_KEY)
+            if LOCAL_LLM_BASE_URL:
+                _backends[LOCAL] = OpenAICompatibleBackend(LOCAL, LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY)
+    return _backends
+
+
+def get_backend(name: str):
+    """The backend called ``name``, or None if it isn't configured"""
+    return get_backends().get(name)
+
+
+def backend_stats() -> dict:
+    return {name: backend.stats() for name, backend in get_backends().items()}
+
+
+def backend_gauges() -> dict:
+    """Flat numeric stats for the metrics endpoint"""
+    return {
+        f"{name}_{key}": int(value) if isinstance(value, bool) else value
+        for name, stats in backend_stats().items() for key, value in stats.items()
+    }
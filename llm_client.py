@@ -0,0 +1,227 @@
+"""Process-wide LLM client and chain registry.
+
+Streamlit re-executes app.py on every interaction, but imported modules stay
+in ``sys.modules``, so the objects held here are created once per server
+process and shared by every session.
+"""
+import asyncio
+import os
+import threading
+
+from startup_profile import import_timer, mark
+
+
+DEFAULT_MODEL = "mixtral-8x7b-32768"
+DEFAULT_TEMPERATURE = 0.7
+
+# Connection pool settings
+POOL_SIZE = int(os.getenv('GROQ_POOL_SIZE', '10'))
+KEEPALIVE_EXPIRY = float(os.getenv('GROQ_KEEPALIVE_EXPIRY', '60'))
+
+# The HTTP and LangChain stack costs about a second to import, so it is
+# loaded on the first LLM call (or by warm_up()) instead of at app start.
+httpx = None
+ChatGroq = None
+ChatPromptTemplate = None
+_import_lock = threading.Lock()
+
+
+def load_modules():
+    """Import the heavy LLM dependencies once"""
+    global httpx, ChatGroq, ChatPromptTemplate
+    with _import_lock:
+        if ChatGroq is not None:
+            return
+        with import_timer('httpx'):
+            import httpx as _httpx
+        with import_timer('langchain_core.prompts'):
+            from langchain_core.prompts import ChatPromptTemplate as _ChatPromptTemplate
+        with import_timer('langchain_groq'):
+            from langchain_groq import ChatGroq as _ChatGroq
+        httpx, ChatPromptTemplate, ChatGroq = _httpx, _ChatPromptTemplate, _ChatGroq
+    mark('llm_modules_loaded')
+
+
+def warm_up():
+    """Preload the LLM dependencies on a background thread"""
+    if ChatGroq is None:
+        threading.Thread(target=load_modules, name='llm-warm-up', daemon=True).start()
+
+
+class _ConnectionCounter:
+    """Counts requests, new TCP connections and TLS handshakes via httpcore trace events.
+
+    Installed as httpx event hooks: the request hook attaches a trace callback
+    and the response hook records what happened on the way.
+    """
+
+    def __init__(self, stats: dict, lock: threading.Lock):
+        self._stats = stats
+        self._lock = lock
+
+    @staticmethod
+    def _note(events: list, name: str):
+        if name == 'connection.connect_tcp.complete':
+            events.append('connect')
+        elif name == 'connection.start_tls.complete':
+            events.append('tls')
+
+    def _record(self, events: list):
+        with self._lock:
+            self._stats['requests'] += 1
+            if 'connect' in events:
+                self._stats['connections_opened'] += 1
+            else:
+                self._stats['connections_reused'] += 1
+            if 'tls' in events:
+                self._stats['tls_handshakes'] += 1
+
+    def on_request(self, request):
+        events = request.extensions['connection_events'] = []
+        request.extensions['trace'] = lambda name, info: self._note(events, name)
+
+    def on_response(self, response):
+        self._record(response.request.extensions.get('connection_events', []))
+
+    async def on_async_request(self, request):
+        events = request.extensions['connection_events'] = []
+
+        async def trace(name, info):
+            self._note(events, name)
+
+        request.extensions['trace'] = trace
+
+    async def on_async_response(self, response):
+        self.on_response(response)
+
+
+class LLMRegistry:
+    """Creates LLM clients and prompt chains once and hands out shared instances"""
+
+    def __init__(self, pool_size: int = POOL_SIZE, keepalive_expiry: float = KEEPALIVE_EXPIRY):
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self._llms = {}
+        self._chains = {}
+        self._stats = {
+            'llm_clients_created': 0,
+            'chains_created': 0,
+            'chain_reuses': 0,
+            'requests': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'tls_handshakes': 0,
+        }
+        self._counter = _ConnectionCounter(self._stats, self._lock)
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _get_http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=self._limits(),
+                event_hooks={'request': [self._counter.on_request], 'response': [self._counter.on_response]}
+            )
+        return self._http_client
+
+    def _get_async_http_client(self):
+        # Only ever used from the background loop, see run_async()
+        if self._async_http_client is None:
+            self._async_http_client = httpx.AsyncClient(
+                limits=self._limits(),
+                event_hooks={
+                    'request': [self._counter.on_async_request],
+                    'response': [self._counter.on_async_response]
+                }
+            )
+        return self._async_http_client
+
+    def get_llm(self, api_key: str, model_name: str = DEFAULT_MODEL,
+                temperature: float = DEFAULT_TEMPERATURE, timeout: float = None):
+        """Return the shared chat model for this model/temperature/timeout combination"""
+        load_modules()
+        key = (api_key, model_name, temperature, timeout)
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = ChatGroq(
+                    groq_api_key=api_key,
+                    model_name=model_name,
+                    temperature=temperature,
+                    http_client=self._get_http_client(),
+                    http_async_client=self._get_async_http_client(),
+                    request_timeout=timeout,
+                    # Retries and backoff are owned by the shared scheduler
+                    max_retries=0
+                )
+                self._llms[key] = llm
+                self._stats['llm_clients_created'] += 1
+        return llm
+
+    def get_chain(self, prompt_template: str, api_key: str, model_name: str = DEFAULT_MODEL,
+                  temperature: float = DEFAULT_TEMPERATURE, timeout: float = None):
+        """Return the shared ``prompt | llm`` chain for a prompt template"""
+        key = (prompt_template, api_key, model_name, temperature, timeout)
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is not None:
+                self._stats['chain_reuses'] += 1
+                return chain
+        llm = self.get_llm(api_key, model_name, temperature, timeout)
+        chain = ChatPromptTemplate.from_template(prompt_template) | llm
+        with self._lock:
+            if self._chains.setdefault(key, chain) is chain:
+                self._stats['chains_created'] += 1
+            else:
+                chain = self._chains[key]
+        return chain
+
+    def stats(self) -> dict:
+        """Snapshot of the pool usage counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pool_size'] = self.pool_size
+        return stats
+
+
+registry = LLMRegistry()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='llm-async-loop', daemon=True).start()
+    return _loop
+
+
+def run_async(coro):
+    """Schedule a coroutine on the shared background event loop and return a concurrent future.
+
+    The pooled async HTTP client is bound to this loop, so every ``ainvoke``
+    against a registry chain should be run through here.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def get_chain(prompt_template: str, api_key: str, model_name: str = DEFAULT_MODEL,
+              temperature: float = DEFAULT_TEMPERATURE, timeout: float = None):
+    """Return the process-wide chain for a prompt template; ``timeout`` is the per-request timeout in seconds"""
+    return registry.get_chain(prompt_template, api_key, model_name, temperature, timeout)
+
+
+def get_pool_stats() -> dict:
+    """Return the process-wide pool usage counters"""
+    return registry.stats()
@@ -0,0 +1,330 @@
+"""Offline analytics over the structured logs.
+
+Reads the current log and its rotated backups (``logs/code_wizard.log``,
+``.1`` ... ``.N``) and folds every record into per-day aggregates. The
+aggregates cover usage, error rates, code lengths and LLM latency. The
+aggregates and a checkpoint (inode, byte offset and head fingerprint of every
+file) are saved to a state file. Each run therefore parses only the records
+written since the last one, even when files have been rotated in between.
+Latencies and code lengths are kept as log-scale histograms, so percentiles
+over months of logs need neither the raw values nor a re-read.
+
+    python log_analytics.py                  # update the state and print the last 14 days
+    python log_analytics.py --days 90 --json
+    python log_analytics.py --reset          # rebuild from the log files still on disk
+
+Both log formats are understood: JSON lines from the log pipeline and the
+older ``2024-01-01 12:00:00 [INFO] name: {json}`` lines.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+
+from log_pipeline import LOG_PATH, LOG_BACKUP_COUNT
+
+
+STATE_PATH = os.getenv('LOG_ANALYTICS_STATE', os.path.join(os.path.dirname(LOG_PATH) or '.', 'analytics_state.json'))
+STATE_VERSION = 2  # 2: failed requests counted separately from error lines
+HISTOGRAM_RATIO = 1.1  # neighbouring buckets differ by 10%, which bounds the percentile error
+HEAD_BYTES = 256  # fingerprint that tells a reused inode from the file it was checkpointed for
+CODE_LENGTH_BANDS = (100, 1000, 10000, 100000)
+
+_LEGACY_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})[,.\d]* \[(\w+)\] ([^:]+): (.*)$")
+_LLM_SPANS = ('llm_invoke', 'llm_stream')
+_ANALYSIS_ACTIONS = ('submit_code',)
+_ANALYSIS_SPANS = ('api_analyze',)
+_QUESTION_ACTIONS = ('chat_message',)
+_QUESTION_SPANS = ('api_ask',)
+# Error actions logged by the app when an analysis or question fails (``details.action``)
+_FAILED_REQUEST_ACTIONS = ('code_analysis', 'sectioned_analysis', 'general_question')
+_FAILED_OUTCOMES = ('errors', 'timeouts')
+
+
+def parse_line(line: str):
+    """A log line as a record dict, or None if it is not a record"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+    match = _LEGACY_RE.match(line)
+    if not match:
+        return None
+    day, clock, level, logger, message = match.groups()
+    try:
+        record = json.loads(message)
+    except ValueError:
+        record = None
+    if not isinstance(record, dict):
+        record = {'content': message}
+    record.setdefault('timestamp', f"{day}T{clock}")
+    record.setdefault('level', level)
+    record.setdefault('logger', logger.strip())
+    return record
+
+
+def _bucket(value: float) -> int:
+    return 0 if value < 1 else 1 + int(math.log(value) / math.log(HISTOGRAM_RATIO))
+
+
+def _bucket_value(bucket: int) -> float:
+    """Geometric middle of a bucket"""
+    return 0.5 if bucket == 0 else HISTOGRAM_RATIO ** (bucket - 0.5)
+
+
+def _observe(histogram: dict, value):
+    if isinstance(value, (int, float)) and value >= 0:
+        key = _bucket(value)
+        histogram[key] = histogram.get(key, 0) + 1
+
+
+def percentile(histogram: dict, q: float):
+    """Approximate ``q`` quantile (0-1) of the values in a histogram, or None if it is empty"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return _bucket_value(bucket)
+    return _bucket_value(max(histogram))
+
+
+def _new_day() -> dict:
+    return {
+        'records': 0, 'sessions': set(), 'users': set(), 'analyses': 0, 'questions': 0, 'errors': 0,
+        'failed_requests': 0, 'llm_calls': 0, 'llm_errors': 0, 'latency_ms': {}, 'ttft_ms': {}, 'code_chars': {},
+        'code_bands': [0] * (len(CODE_LENGTH_BANDS) + 1), 'events': {},
+    }
+
+
+def add_record(days: dict, record: dict):
+    """Fold one record into the per-day aggregates"""
+    timestamp = record.get('timestamp')
+    if not isinstance(timestamp, str) or len(timestamp) < 10:
+        return
+    day = days.setdefault(timestamp[:10], _new_day())
+    day['records'] += 1
+    event = record.get('event_type')
+    action = record.get('action')
+    metadata = record.get('metadata') if isinstance(record.get('metadata'), dict) else {}
+    details = record.get('details') if isinstance(record.get('details'), dict) else {}
+    name = record.get('span') if event == 'span' else event or action
+    if name:
+        day['events'][name] = day['events'].get(name, 0) + 1
+    if record.get('session_id'):
+        day['sessions'].add(str(record['session_id']))
+    if record.get('user'):
+        day['users'].add(str(record['user']))
+
+    if (record.get('level') in ('ERROR', 'CRITICAL') or event == 'error' or action == 'error'
+            or metadata.get('outcome') in _FAILED_OUTCOMES):
+        day['errors'] += 1
+    # Only failed analyses and questions count towards the error rate, not retries or other error lines
+    if ((action == 'error' and details.get('action') in _FAILED_REQUEST_ACTIONS)
+            or (event == 'span' and record.get('span') in _ANALYSIS_SPANS + _QUESTION_SPANS
+                and metadata.get('outcome') in _FAILED_OUTCOMES)):
+        day['failed_requests'] += 1
+    if action in _ANALYSIS_ACTIONS or (event == 'span' and record.get('span') in _ANALYSIS_SPANS):
+        day['analyses'] += 1
+    if action in _QUESTION_ACTIONS or (event == 'span' and record.get('span') in _QUESTION_SPANS):
+        day['questions'] += 1
+
+    if event != 'span':
+        return
+    if record.get('span') in _LLM_SPANS:
+        day['llm_calls'] += 1
+        if metadata.get('error'):
+            day['llm_errors'] += 1
+        else:
+            _observe(day['latency_ms'], record.get('duration_ms'))
+            _observe(day['ttft_ms'], metadata.get('ttft_ms'))
+    elif record.get('span') == 'analyze_code' and metadata.get('initial'):
+        # Every initial analysis, whether from the app, the API or the CLI, goes through this span
+        chars = metadata.get('code_chars')
+        if isinstance(chars, int):
+            _observe(day['code_chars'], chars)
+            day['code_bands'][sum(1 for band in CODE_LENGTH_BANDS if chars >= band)] += 1
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    state = {'version': STATE_VERSION, 'files': {}, 'days': {}}
+    try:
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return state
+    if saved.get('version') != STATE_VERSION:
+        return state
+    state['files'] = saved.get('files', {})
+    for day, values in saved.get('days', {}).items():
+        values['sessions'] = set(values['sessions'])
+        values['users'] = set(values['users'])
+        for key in ('latency_ms', 'ttft_ms', 'code_chars'):
+            values[key] = {int(bucket): count for bucket, count in values[key].items()}
+        state['days'][day] = values
+    return state
+
+
+def save_state(state: dict, path: str = STATE_PATH):
+    """Write the state atomically so an interrupted run never leaves a half-written checkpoint"""
+    days = {
+        day: dict(values, sessions=sorted(values['sessions']), users=sorted(values['users']))
+        for day, values in state['days'].items()
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'files': state['files'], 'days': days}, f)
+    os.replace(tmp_path, path)
+
+
+def log_files(log_path: str = LOG_PATH, backup_count: int = LOG_BACKUP_COUNT) -> list:
+    """The current log and its rotated backups that exist, oldest first"""
+    paths = [f"{log_path}.{i}" for i in range(max(backup_count, 0), 0, -1)] + [log_path]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def _head(f) -> str:
+    f.seek(0)
+    return hashlib.sha1(f.read(HEAD_BYTES)).hexdigest()
+
+
+def update(state: dict, paths: list) -> dict:
+    """Parse what was appended to ``paths`` since the checkpoint; returns per-run counters"""
+    checkpoints = state['files']
+    seen = {}
+    run = {'files': 0, 'bytes': 0, 'records': 0, 'skipped_lines': 0}
+    for path in paths:
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            continue
+        with f:
+            stat = os.fstat(f.fileno())
+            inode = f"{stat.st_dev}:{stat.st_ino}"
+            head = _head(f)
+            checkpoint = checkpoints.get(inode)
+            offset = 0
+            # A rotated file keeps its inode; a recreated or truncated one starts over
+            if checkpoint and checkpoint['offset'] <= stat.st_size and (
+                    checkpoint['head'] == head or checkpoint['offset'] < HEAD_BYTES):
+                offset = checkpoint['offset']
+            f.seek(offset)
+            if offset < stat.st_size:
+                run['files'] += 1
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # still being written; picked up next run
+                offset += len(line)
+                run['bytes'] += len(line)
+                record = parse_line(line.decode('utf-8', errors='replace'))
+                if record is None:
+                    run['skipped_lines'] += int(bool(line.strip()))
+                    continue
+                add_record(state['days'], record)
+                run['records'] += 1
+            seen[inode] = {'offset': offset, 'head': _head(f) if offset < HEAD_BYTES else head, 'path': path}
+    # Files rotated out of existence are forgotten
+    state['files'] = seen
+    return run
+
+
+def day_report(day: str, values: dict) -> dict:
+    # Failed requests were logged as attempts too, so they are already part of the total
+    requests = values['analyses'] + values['questions']
+    failed = values['failed_requests']
+    return {
+        'day': day,
+        'records': values['records'],
+        'sessions': len(values['sessions']),
+        'users': len(values['users']),
+        'analyses': values['analyses'],
+        'questions': values['questions'],
+        'errors': values['errors'],
+        'failed_requests': failed,
+        'error_rate': round(min(failed / requests, 1.0), 4) if requests else None,
+        'llm_calls': values['llm_calls'],
+        'llm_error_rate': round(values['llm_errors'] / values['llm_calls'], 4) if values['llm_calls'] else None,
+        'latency_p50_ms': _round(percentile(values['latency_ms'], 0.5)),
+        'latency_p90_ms': _round(percentile(values['latency_ms'], 0.9)),
+        'latency_p99_ms': _round(percentile(values['latency_ms'], 0.99)),
+        'ttft_p50_ms': _round(percentile(values['ttft_ms'], 0.5)),
+        'code_chars_p50': _round(percentile(values['code_chars'], 0.5)),
+        'code_chars_p90': _round(percentile(values['code_chars'], 0.9)),
+        'code_length_bands': dict(zip(_band_labels(), values['code_bands'])),
+    }
+
+
+def _round(value):
+    return round(value) if value is not None else None
+
+
+def _band_labels() -> list:
+    labels = [f"<{CODE_LENGTH_BANDS[0]}"]
+    labels.extend(f"{low}-{high - 1}" for low, high in zip(CODE_LENGTH_BANDS, CODE_LENGTH_BANDS[1:]))
+    labels.append(f">={CODE_LENGTH_BANDS[-1]}")
+    return labels
+
+
+def report(state: dict, days: int = 14) -> list:
+    """Per-day report rows for the last ``days`` days that have records"""
+    return [day_report(day, state['days'][day]) for day in sorted(state['days'])[-days:]]
+
+
+def format_report(rows: list) -> str:
+    def show(value, suffix=''):
+        return '-' if value is None else f"{value}{suffix}"
+
+    lines = [f"{'day':10} {'sessions':>8} {'analyses':>8} {'questions':>9} {'errors':>6} {'failed':>6} {'err%':>6} "
+             f"{'llm':>5} {'llm err%':>8} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'code p50':>8} {'code p90':>8}"]
+    for row in rows:
+        error_rate = show(round(row['error_rate'] * 100, 1) if row['error_rate'] is not None else None)
+        llm_error_rate = show(round(row['llm_error_rate'] * 100, 1) if row['llm_error_rate'] is not None else None)
+        lines.append(
+            f"{row['day']:10} {row['sessions']:>8} {row['analyses']:>8} {row['questions']:>9} {row['errors']:>6} "
+            f"{row['failed_requests']:>6} {error_rate:>6} {row['llm_calls']:>5} {llm_error_rate:>8} {show(row['latency_p50_ms']):>7} "
+            f"{show(row['latency_p90_ms']):>7} {show(row['latency_p99_ms']):>7} "
+            f"{show(row['code_chars_p50']):>8} {show(row['code_chars_p90']):>8}"
+        )
+    if rows:
+        lines.append("")
+        lines.append("Code length distribution (chars): " + ", ".join(
+            f"{label}: {sum(row['code_length_bands'][label] for row in rows)}" for label in _band_labels()
+        ))
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--log', default=LOG_PATH, help='current log file; rotated backups are found next to it')
+    parser.add_argument('--backups', type=int, default=LOG_BACKUP_COUNT)
+    parser.add_argument('--state', default=STATE_PATH, help='aggregates and checkpoint file')
+    parser.add_argument('--days', type=int, default=14, help='days to report')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--reset', action='store_true', help='discard the saved state and start over')
+    args = parser.parse_args(argv)
+
+    state = {'version': STATE_VERSION, 'files': {}, 'days': {}} if args.reset else load_state(args.state)
+    run = update(state, log_files(args.log, args.backups))
+    save_state(state, args.state)
+    print(f"Parsed {run['records']} new records ({run['bytes'] / 1024:.0f} KB) from {run['files']} files"
+          + (f", skipped {run['skipped_lines']} unparseable lines" if run['skipped_lines'] else ""),
+          file=sys.stderr)
+    rows = report(state, args.days)
+    print(json.dumps(rows, indent=2) if args.json else format_report(rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
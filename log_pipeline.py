@@ -0,0 +1,213 @@
+"""Non-blocking, batched structured logging.
+
+Callers only put a dict on a bounded queue. A background writer thread turns
+the records into JSON lines, writes them to disk in batches, mirrors them to
+the console and rotates the file, so slow disks never stall the Streamlit
+script thread.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime
+
+
+LOG_PATH = os.getenv('LOG_PATH', 'logs/code_wizard.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(1024 * 1024)))  # 1MB
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_OVERFLOW = os.getenv('LOG_OVERFLOW', 'drop')  # 'drop' or 'block'
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '256'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '0.5'))
+LOG_ECHO = os.getenv('LOG_ECHO', '1') == '1'
+
+_STOP = object()
+
+
+class LogWriter:
+    """Background JSON-lines writer with size-based rotation"""
+
+    def __init__(self, path: str = LOG_PATH, max_bytes: int = LOG_MAX_BYTES,
+                 backup_count: int = LOG_BACKUP_COUNT, queue_size: int = LOG_QUEUE_SIZE,
+                 overflow: str = LOG_OVERFLOW, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, echo: bool = LOG_ECHO):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"overflow must be 'drop' or 'block', not {overflow!r}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.echo = echo
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'rotations': 0, 'errors': 0}
+        self._file = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        """Enqueue a record; returns False if it was dropped because the queue is full"""
+        if self._closed:
+            return False
+        try:
+            if self.overflow == 'block':
+                self._queue.put(record)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything enqueued so far has been written"""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Flush pending records and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _rotate(self):
+        # Same naming scheme as logging.handlers.RotatingFileHandler
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            src, dst = f"{self.path}.{i}", f"{self.path}.{i + 1}"
+            if os.path.exists(src):
+                os.replace(src, dst)
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        with self._stats_lock:
+            self._stats['rotations'] += 1
+
+    def _write_batch(self, records: list):
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record, default=str, ensure_ascii=False))
+            except Exception as e:
+                lines.append(json.dumps({'level': 'ERROR', 'content': f"Logging error: {str(e)}"}))
+        try:
+            f = self._open()
+            for line in lines:
+                f.write(line + "\n")
+                if self.max_bytes and f.tell() >= self.max_bytes:
+                    f.flush()
+                    self._rotate()
+                    f = self._open()
+            f.flush()
+            if self.echo:
+                sys.stderr.write("\n".join(lines) + "\n")
+        except OSError:
+            with self._stats_lock:
+                self._stats['errors'] += 1
+            return
+        with self._stats_lock:
+            self._stats['written'] += len(lines)
+            self._stats['batches'] += 1
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, waiters, stop = [], [], False
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+
+class PipelineHandler(logging.Handler):
+    """Routes standard ``logging`` records through the background writer"""
+
+    def __init__(self, writer: LogWriter = None):
+        super().__init__()
+        self._writer = writer
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            (self._writer or get_log_writer()).submit({
+                'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+                'level': record.levelname,
+                'logger': record.name,
+                'content': record.getMessage(),
+            })
+        except Exception:
+            self.handleError(record)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> LogWriter:
+    """Return the process-wide log writer, starting it on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            atexit.register(_writer.close)
+    return _writer
+
+
+def submit(record: dict, level: str = 'INFO', logger: str = 'CodeWizard') -> bool:
+    """Enqueue a structured record; serialization and I/O happen on the writer thread"""
+    record.setdefault('timestamp', datetime.now().isoformat())
+    record.setdefault('level', level)
+    record.setdefault('logger', logger)
+    return get_log_writer().submit(record)
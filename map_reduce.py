@@ -0,0 +1,167 @@
+"""Map-reduce analysis for code larger than the model context.
+
+The code is split into AST-aware chunks, each chunk is analyzed in parallel
+(map), and the partial results are merged by a final reduce prompt. When the
+partial results are themselves too large they are collapsed in rounds first.
+Every call is made by an ``invoke`` function from the caller (analysis_core
+routes it like any other request), and prompts are sized to the largest
+context window among the configured models.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import chunk_code, estimate_tokens, outline, CHARS_PER_TOKEN
+from model_router import router
+from scheduler import BULK, INTERACTIVE
+from static_analysis import build_index, summarize
+
+
+# mixtral-8x7b-32768 has a 32k context; leave room for the prompt and the answer
+MAX_PROMPT_TOKENS = int(os.getenv('MAX_PROMPT_TOKENS', '24000'))
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '6000'))
+MAP_CONCURRENCY = int(os.getenv('MAP_CONCURRENCY', '8'))
+OUTLINE_MAX_CHARS = 4000
+NOT_RELEVANT = "NOT RELEVANT"
+
+CHUNK_ANALYSIS_PROMPT = """
+    You are analyzing part {index} of {total} of a larger file (lines {start_line}-{end_line}).
+
+    Outline of the whole file:
+    {outline}
+
+    ```
+    {code}
+    ```
+
+    Concisely describe for this part only:
+    - What it does and its key components
+    - Notable programming concepts
+    - Performance and security concerns
+    - Potential improvements
+    """
+
+CHUNK_QUESTION_PROMPT = """
+    You are looking at part {index} of {total} of a larger file (lines {start_line}-{end_line}).
+
+    ```
+    {code}
+    ```
+
+    Question about the whole file: {query}
+
+    Extract everything in this part that helps answer the question, with code references.
+    If nothing in this part is relevant, reply with exactly: NOT RELEVANT
+    """
+
+COLLAPSE_PROMPT = """
+    Merge these notes about consecutive parts of one file into a single concise set of notes.
+    Keep every concrete finding and code reference.
+
+    {notes}
+    """
+
+REDUCE_ANALYSIS_PROMPT = """
+    As a coding expert, you analyzed a large file in parts. Here are your notes on each part:
+
+    {notes}
+
+    Combine them into one detailed yet engaging analysis including:
+    1. 🎯 Overview of what the code does
+    2. 🔍 Key components and their functionality
+    3. 💡 Notable programming concepts used
+    4. ⚡ Performance considerations
+    5. 🛡️ Security considerations if applicable
+    6. ✨ Potential improvements and best practices
+
+    Make your explanation clear, engaging, and actionable, using emojis and formatting to enhance readability.
+    """
+
+REDUCE_QUESTION_PROMPT = """
+    Question about a large file: {query}
+
+    Relevant findings from each part of the file:
+    {notes}
+
+    Previous context:
+    {context}
+
+    Provide a focused, clear answer with relevant code references and examples where applicable.
+    Use emojis and formatting to make the explanation more engaging.
+    """
+
+
+def prompt_budget() -> int:
+    """Tokens of code or notes one prompt may carry: MAX_PROMPT_TOKENS, or less for small-window models"""
+    return max(min(MAX_PROMPT_TOKENS, router.max_prompt_tokens()), 256)
+
+
+def needs_map_reduce(code: str, max_tokens: int = None) -> bool:
+    """True when the code is too large to send in a single prompt"""
+    return estimate_tokens(code) > (max_tokens or prompt_budget())
+
+
+def invoke_all(prompt_template: str, inputs: list, invoke, concurrency: int, priority: int = BULK) -> list:
+    """Run one prompt over many inputs concurrently.
+
+    ``invoke(prompt_template, kwargs, priority)`` makes one call and returns its text and the name of the
+    model that served it; the (text, model) pairs are returned in input order.
+    """
+    if not inputs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(inputs))), thread_name_prefix='map') as pool:
+        return list(pool.map(lambda kwargs: invoke(prompt_template, kwargs, priority), inputs))
+
+
+def _texts(results: list) -> list:
+    return [text for text, _ in results]
+
+
+def _map(code: str, prompt_template: str, invoke, concurrency: int, priority: int, **extra) -> list:
+    budget = prompt_budget()
+    index = build_index(code)
+    # The outline rides along with every chunk, so it gets at most a quarter of a small window
+    outline_chars = min(OUTLINE_MAX_CHARS, budget * CHARS_PER_TOKEN // 4)
+    file_outline = (summarize(index) if index else outline(code))[:outline_chars]
+    chunk_tokens = min(CHUNK_TOKENS, budget - estimate_tokens(prompt_template + file_outline))
+    chunks = chunk_code(code, max(chunk_tokens, 128))
+    inputs = [
+        dict(extra, index=i + 1, total=len(chunks), start_line=chunk.start_line,
+             end_line=chunk.end_line, code=chunk.source, outline=file_outline)
+        for i, chunk in enumerate(chunks)
+    ]
+    return _texts(invoke_all(prompt_template, inputs, invoke, concurrency, priority))
+
+
+def _collapse(notes: list, invoke, concurrency: int, max_tokens: int, priority: int) -> list:
+    """Merge neighbouring notes in rounds until all of them fit in one prompt"""
+    while len(notes) > 1 and estimate_tokens("\n\n".join(notes)) > max_tokens:
+        groups, current = [], []
+        for note in notes:
+            if current and estimate_tokens("\n\n".join(current + [note])) > max_tokens // 2:
+                groups.append(current)
+                current = []
+            current.append(note)
+        groups.append(current)
+        if len(groups) == len(notes):
+            # Every note is already too large to pair up; merge two at a time
+            groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        notes = _texts(invoke_all(COLLAPSE_PROMPT, [{'notes': "\n\n".join(g)} for g in groups],
+                                  invoke, concurrency, priority))
+    return notes
+
+
+def map_analysis(code: str, invoke, concurrency: int = MAP_CONCURRENCY) -> dict:
+    """Run the map step of an initial analysis; returns kwargs for REDUCE_ANALYSIS_PROMPT"""
+    notes = _map(code, CHUNK_ANALYSIS_PROMPT, invoke, concurrency, BULK)
+    notes = _collapse(notes, invoke, concurrency, prompt_budget() - estimate_tokens(REDUCE_ANALYSIS_PROMPT), BULK)
+    return {'notes': "\n\n".join(notes)}
+
+
+def map_question(code: str, query: str, context: str, invoke, concurrency: int = MAP_CONCURRENCY) -> dict:
+    """Run the map step of a follow-up question; returns kwargs for REDUCE_QUESTION_PROMPT"""
+    notes = _map(code, CHUNK_QUESTION_PROMPT, invoke, concurrency, INTERACTIVE, query=query)
+    notes = [note for note in notes if not note.strip().upper().startswith(NOT_RELEVANT)]
+    notes = notes or ["No part of this file is directly relevant to the question."]
+    reserved = estimate_tokens(REDUCE_QUESTION_PROMPT + query + context)
+    notes = _collapse(notes, invoke, concurrency, prompt_budget() - reserved, INTERACTIVE)
+    return {'notes': "\n\n".join(notes), 'query': query, 'context': context}
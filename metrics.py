@@ -0,0 +1,167 @@
+"""Hot-path span timing, histograms and a Prometheus-text metrics endpoint.
+
+Each span records its duration (and any prompt/response token estimates)
+into per-stage histograms and writes one structured log record. The
+aggregates are served in the Prometheus text format on ``METRICS_PORT``.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from log_pipeline import submit as submit_log
+
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))  # 0 disables the endpoint
+
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Span attributes that are also aggregated into histograms
+HISTOGRAM_ATTRS = ('prompt_tokens', 'response_tokens')
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label: str = 'stage'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{label}}} {series["sum"]:.3f}')
+                lines.append(f'{self.name}_count{{{label}}} {series["count"]}')
+        return lines
+
+
+stage_duration = Histogram('code_wizard_stage_duration_ms', 'Duration of hot-path stages in milliseconds',
+                           DURATION_BUCKETS_MS)
+attr_histograms = {
+    attr: Histogram(f'code_wizard_stage_{attr}', f'Estimated {attr.replace("_", " ")} per stage', TOKEN_BUCKETS)
+    for attr in HISTOGRAM_ATTRS
+}
+
+_gauges = {}
+_gauges_lock = threading.Lock()
+
+
+def register_gauges(prefix: str, collect):
+    """Expose every numeric value of ``collect()`` as a gauge named ``code_wizard_<prefix>_<key>``"""
+    with _gauges_lock:
+        _gauges[prefix] = collect
+
+
+def record_span(name: str, duration_ms: float, **attrs):
+    """Record a finished span into the histograms and the structured log"""
+    stage_duration.observe(name, duration_ms)
+    for attr, histogram in attr_histograms.items():
+        if isinstance(attrs.get(attr), (int, float)):
+            histogram.observe(name, attrs[attr])
+    submit_log({'event_type': 'span', 'span': name, 'duration_ms': round(duration_ms, 2), 'metadata': attrs})
+
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block; attributes can be added while it runs with ``s.set(...)``"""
+    current = Span(name, attrs)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        record_span(name, (time.perf_counter() - start) * 1000, **current.attrs)
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = stage_duration.render()
+    for histogram in attr_histograms.values():
+        lines.extend(histogram.render())
+    with _gauges_lock:
+        gauges = list(_gauges.items())
+    for prefix, collect in gauges:
+        try:
+            values = collect()
+        except Exception:
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"code_wizard_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics on a background thread; safe to call on every rerun"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                submit_log({'event_type': 'error', 'content': f"Metrics endpoint not started: {str(e)}"},
+                           level='WARNING')
+                _server = False
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+    return _server or None
@@ -0,0 +1,197 @@
+"""Model registry and latency-aware routing.
+
+Each LLM call names a task (initial analysis, follow-up, general question).
+The router picks the models that fit the prompt, ranks them by the task's
+preferred tier, its latency target and each model's observed latency and
+error rate, and returns a primary model plus fallbacks. A fallback is tried
+when the primary times out or its backend is unreachable. Every call's
+outcome is recorded, so a model that gets slow or starts failing is demoted
+until it recovers. Models are served by the backends in llm_backends: only
+configured backends are routed to, unhealthy ones are demoted, and the
+candidates always include a model on a second backend when there is one.
+"""
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from llm_client import DEFAULT_MODEL, DEFAULT_TEMPERATURE
+from llm_backends import (
+    get_backend, GROQ, LOCAL, LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, LOCAL_LLM_CONTEXT_TOKENS, LOCAL_LLM_TIER
+)
+
+
+INITIAL_ANALYSIS = 'initial_analysis'
+FOLLOW_UP = 'follow_up'
+GENERAL_QUESTION = 'general_question'
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    context_tokens: int
+    tier: str  # "fast" or "quality"
+    temperature: float = DEFAULT_TEMPERATURE
+    backend: str = GROQ
+
+
+@dataclass
+class TaskPolicy:
+    tier: str
+    target_ms: float  # routing prefers models whose recent latency is under this
+    timeout_s: float  # per-attempt timeout before falling back to the next model
+
+
+def _parse_models(spec: str) -> list:
+    """``name:context_tokens:tier`` entries separated by commas"""
+    models = []
+    for entry in spec.split(','):
+        name, context_tokens, tier = entry.strip().rsplit(':', 2)
+        models.append(ModelSpec(name, int(context_tokens), tier))
+    return models
+
+
+MODELS = _parse_models(os.getenv(
+    'LLM_MODELS',
+    f"{DEFAULT_MODEL}:32768:quality,llama-3.3-70b-versatile:131072:quality,llama-3.1-8b-instant:131072:fast"
+))
+if LOCAL_LLM_BASE_URL:
+    # Listed first so it wins ties: prompts that fit its window skip the network round trip
+    MODELS.insert(0, ModelSpec(LOCAL_LLM_MODEL, LOCAL_LLM_CONTEXT_TOKENS, LOCAL_LLM_TIER, backend=LOCAL))
+
+TASK_POLICIES = {
+    INITIAL_ANALYSIS: TaskPolicy('quality', float(os.getenv('ROUTE_INITIAL_TARGET_MS', '20000')),
+                                 float(os.getenv('ROUTE_INITIAL_TIMEOUT', '60'))),
+    FOLLOW_UP: TaskPolicy('quality', float(os.getenv('ROUTE_FOLLOW_UP_TARGET_MS', '10000')),
+                          float(os.getenv('ROUTE_FOLLOW_UP_TIMEOUT', '30'))),
+    GENERAL_QUESTION: TaskPolicy('fast', float(os.getenv('ROUTE_GENERAL_TARGET_MS', '4000')),
+                                 float(os.getenv('ROUTE_GENERAL_TIMEOUT', '15'))),
+}
+
+ROUTER_MAX_FALLBACKS = int(os.getenv('ROUTER_MAX_FALLBACKS', '1'))
+# Completion budget reserved on top of the prompt when checking a model's context window
+COMPLETION_TOKENS = int(os.getenv('ROUTER_COMPLETION_TOKENS', '2048'))
+EWMA_ALPHA = 0.2
+FAILURES_BEFORE_COOLDOWN = 3
+COOLDOWN_SECONDS = float(os.getenv('ROUTER_COOLDOWN_SECONDS', '60'))
+# A demoted model gets no traffic to prove itself with, so its error rate also decays over time
+ERROR_HALF_LIFE_SECONDS = float(os.getenv('ROUTER_ERROR_HALF_LIFE_SECONDS', '120'))
+
+
+class _ModelStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency_ms = None  # EWMA of successful calls
+        self.error_rate = 0.0  # EWMA of failures, as of error_rate_at
+        self.error_rate_at = time.monotonic()
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def current_error_rate(self, now: float) -> float:
+        return self.error_rate * 0.5 ** ((now - self.error_rate_at) / ERROR_HALF_LIFE_SECONDS)
+
+
+class ModelRouter:
+    def __init__(self, models: list = None, policies: dict = None, max_fallbacks: int = ROUTER_MAX_FALLBACKS):
+        self.models = list(models or MODELS)
+        self.policies = policies or TASK_POLICIES
+        self.max_fallbacks = max_fallbacks
+        self._lock = threading.Lock()
+        self._stats = {model.name: _ModelStats() for model in self.models}
+        self._fallbacks = 0
+
+    def policy(self, task: str) -> TaskPolicy:
+        return self.policies.get(task, self.policies[FOLLOW_UP])
+
+    def _available(self) -> list:
+        return [m for m in self.models if get_backend(m.backend) is not None] or self.models
+
+    def max_prompt_tokens(self) -> int:
+        """The largest prompt a configured model takes with room left for the answer"""
+        return max(m.context_tokens for m in self._available()) - COMPLETION_TOKENS
+
+    def route(self, task: str, prompt_tokens: int) -> list:
+        """Models to try for this call, best first"""
+        policy = self.policy(task)
+        needed = prompt_tokens + COMPLETION_TOKENS
+        models = self._available()
+        # Nothing fits: the largest window gives the best chance
+        fits = [m for m in models if m.context_tokens >= needed] or [
+            max(models, key=lambda m: m.context_tokens)
+        ]
+        healthy = {m.backend: get_backend(m.backend) is None or get_backend(m.backend).healthy() for m in fits}
+        now = time.monotonic()
+        with self._lock:
+            def penalty(model):
+                stats = self._stats[model.name]
+                score = 0.0 if model.tier == policy.tier else 1.0
+                if stats.latency_ms is not None and stats.latency_ms > policy.target_ms:
+                    score += 2.0
+                score += 4.0 * stats.current_error_rate(now)
+                if stats.cooldown_until > now or not healthy[model.backend]:
+                    score += 10.0
+                return score
+
+            ranked = sorted(fits, key=penalty)  # stable, so registry order breaks ties
+        candidates = ranked[:1 + self.max_fallbacks]
+        # A slow or unreachable provider shouldn't take every candidate down with it
+        backends = {m.backend for m in candidates}
+        spare = next((m for m in ranked[len(candidates):] if m.backend not in backends and healthy[m.backend]), None)
+        return candidates + [spare] if spare else candidates
+
+    def record(self, model_name: str, latency_ms: float, ok: bool, timeout: bool = False):
+        """Feed the outcome of one call back into the routing stats"""
+        with self._lock:
+            stats = self._stats.setdefault(model_name, _ModelStats())
+            now = time.monotonic()
+            stats.requests += 1
+            error_rate = stats.current_error_rate(now)
+            stats.error_rate = error_rate + EWMA_ALPHA * ((0.0 if ok else 1.0) - error_rate)
+            stats.error_rate_at = now
+            if ok:
+                stats.consecutive_failures = 0
+                stats.latency_ms = latency_ms if stats.latency_ms is None else (
+                    stats.latency_ms + EWMA_ALPHA * (latency_ms - stats.latency_ms)
+                )
+                return
+            stats.errors += 1
+            stats.timeouts += int(timeout)
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= FAILURES_BEFORE_COOLDOWN:
+                stats.cooldown_until = now + COOLDOWN_SECONDS
+
+    def record_fallback(self):
+        with self._lock:
+            self._fallbacks += 1
+
+    def stats(self) -> dict:
+        """Per-model stats, keyed by model name"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'requests': s.requests,
+                    'errors': s.errors,
+                    'timeouts': s.timeouts,
+                    'latency_ms': round(s.latency_ms, 1) if s.latency_ms is not None else None,
+                    'error_rate': round(s.current_error_rate(now), 3),
+                    'cooling_down': s.cooldown_until > now,
+                }
+                for name, s in self._stats.items()
+            }
+
+    def gauges(self) -> dict:
+        """Flat numeric stats for the metrics endpoint"""
+        values = {'fallbacks': self._fallbacks}
+        for name, stats in self.stats().items():
+            prefix = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+            for key, value in stats.items():
+                if value is not None:
+                    values[f"{prefix}_{key}"] = int(value) if isinstance(value, bool) else value
+        return values
+
+
+router = ModelRouter()
@@ -0,0 +1,224 @@
+"""Speculative prefetch of likely follow-up answers.
+
+After an initial analysis, users tend to ask the same few follow-ups: how to
+optimize the code, whether it has security issues, how to improve it, and
+what a given function does. With prefetching switched on, these questions
+are predicted from the code structure and the analysis. They are answered
+in the background at bulk priority, within a per-session token budget. A
+chat question that matches one of them is served from the session's
+prefetch cache instead of waiting for the LLM. Process-wide counters track
+hits, misses, and tokens spent on answers nobody asked for. Only questions
+that are close to a prefetched one are served. A question that mentions
+anything beyond the intent, such as a specific code path, goes to the LLM.
+So does one whose prefetch hasn't finished yet, because bulk work may be
+held back behind interactive requests.
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import estimate_tokens
+from static_analysis import build_index, code_hash
+
+
+PREFETCH_TOKEN_BUDGET = int(os.getenv('PREFETCH_TOKEN_BUDGET', '12000'))  # per session and code, prompts + answers
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))
+PREFETCH_FUNCTIONS = 3  # functions offered for "explain function X"
+ANSWER_TOKENS_ESTIMATE = 600
+
+# (key, question that is prefetched, pattern a chat question must match to be served that answer,
+#  other words the question may use). A question is served only if every word is one of the intent's,
+# a filler word, or the pattern's, so a generic answer never stands in for a specific question.
+INTENTS = [
+    ('optimize', "How can I optimize this code for performance?",
+     re.compile(r"\b(optimi[sz]|faster|speed|performan|slow|efficien)", re.IGNORECASE),
+     {'up', 'run', 'runs', 'improve', 'better', 'bottlenecks', 'overall'}),
+    ('security', "Are there any security issues in this code?",
+     re.compile(r"\b(secur|vulnerab|exploit|unsafe|injection)", re.IGNORECASE),
+     {'issues', 'problems', 'concerns', 'risks', 'holes', 'flaws', 'safe', 'check', 'review'}),
+    ('improve', "How can I improve this code and follow best practices?",
+     re.compile(r"\b(improv|best practice|refactor|clean ?up|better)", re.IGNORECASE),
+     {'best', 'practices', 'practice', 'follow', 'clean', 'cleaner', 'up', 'quality', 'readable', 'overall',
+      'suggestions', 'ideas'}),
+]
+EXPLAIN_QUESTION = "Explain the function `{name}` in detail."
+_EXPLAIN_RE = re.compile(r"\b(explain|what does|how does|walk me through|describe)\b", re.IGNORECASE)
+_EXPLAIN_WORDS = {'explain', 'describe', 'walk', 'through', 'function', 'method', 'detail', 'detailed', 'work',
+                  'works', 'working', 'purpose', 'exactly', 'briefly'}
+_FILLER_WORDS = {
+    'a', 'an', 'the', 'this', 'that', 'these', 'my', 'our', 'your', 'it', 'its', 'code', 'program', 'script',
+    'file', 'how', 'what', 'which', 'can', 'could', 'would', 'should', 'i', 'we', 'you', 'me', 'us', 'is', 'are',
+    'there', 'any', 'some', 'do', 'does', 'make', 'to', 'in', 'of', 'for', 'and', 'or', 'be', 'more', 'most',
+    'please', 'tell', 'about', 'give', 'suggest', 'ways', 'way', 'here', 'all', 'have', 'has', 'so',
+}
+_WORD_RE = re.compile(r"[A-Za-z_]\w*(?:\.\w+)*")
+
+_stats = {'sessions': 0, 'predicted': 0, 'prefetched': 0, 'failed': 0, 'hits': 0, 'misses': 0,
+          'tokens_spent': 0, 'tokens_used': 0}
+_stats_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _record(**counts):
+    with _stats_lock:
+        for key, value in counts.items():
+            _stats[key] += value
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, PREFETCH_WORKERS), thread_name_prefix='prefetch')
+    return _executor
+
+
+def predict_questions(code: str, analysis: str = "") -> list:
+    """Likely follow-ups as (key, question) pairs, most likely first"""
+    # Topics the analysis dwells on are the ones users ask about next
+    intents = sorted(INTENTS, key=lambda intent: -len(intent[2].findall(analysis or "")))
+    questions = [(key, question) for key, question, _, _ in intents]
+    index = build_index(code)
+    if index is not None:
+        def rank(func):
+            mentioned = re.search(rf"\b{re.escape(func.name)}\b", analysis or "") is not None
+            return not mentioned, -func.complexity, func.lineno
+
+        functions = sorted(index.functions, key=rank)
+        questions.extend((f"explain:{f.qualname}", EXPLAIN_QUESTION.format(name=f.qualname))
+                         for f in functions[:PREFETCH_FUNCTIONS])
+    return questions
+
+
+def _only_words(query: str, allowed: set, pattern=None) -> bool:
+    """True when every word of ``query`` is a filler word, in ``allowed`` or matched by ``pattern``"""
+    return all(
+        word.lower() in _FILLER_WORDS or word.lower() in allowed or (pattern is not None and pattern.search(word))
+        for word in _WORD_RE.findall(query)
+    )
+
+
+def match_question(query: str, keys) -> str:
+    """The prefetch key a chat question closely matches, or None when it needs its own answer"""
+    if _EXPLAIN_RE.search(query):
+        for key in keys:
+            if key.startswith('explain:'):
+                qualname = key.split(':', 1)[1]
+                names = {qualname, qualname.split('.')[-1]}
+                mentioned = any(re.search(rf"\b{re.escape(name)}\b", query) for name in names)
+                if mentioned and _only_words(query, _EXPLAIN_WORDS | {name.lower() for name in names}):
+                    return key
+    for key, _, pattern, words in INTENTS:
+        if key in keys and pattern.search(query) and _only_words(query, words, pattern):
+            return key
+    return None
+
+
+class _Entry:
+    def __init__(self, question: str, prompt_tokens: int):
+        self.question = question
+        self.prompt_tokens = prompt_tokens  # at most: snippet mode sends only part of the code
+        self.tokens = 0  # prompt plus answer, counted once the answer is in
+        self.future = None
+
+
+class SessionPrefetch:
+    """Prefetched follow-up answers for one session's current code"""
+
+    def __init__(self, budget: int = PREFETCH_TOKEN_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._code_hash = None
+        self._entries = {}
+        self.stats = {'predicted': 0, 'prefetched': 0, 'hits': 0, 'misses': 0, 'tokens_spent': 0, 'tokens_used': 0}
+        _record(sessions=1)
+
+    def start(self, code: str, analysis: str, answer) -> int:
+        """Answer the likely follow-ups for ``code`` in the background with ``answer(question)``.
+
+        ``answer`` runs on a worker thread, so it must not touch Streamlit state. Returns the
+        number of questions scheduled within the token budget.
+        """
+        self.discard()
+        # Each question reserves its worst-case prompt plus a typical answer
+        reserve = estimate_tokens(code) + ANSWER_TOKENS_ESTIMATE
+        questions = predict_questions(code, analysis)[:max(0, self.budget // reserve)]
+        with self._lock:
+            self._code_hash = code_hash(code)
+            for key, question in questions:
+                entry = _Entry(question, estimate_tokens(code) + estimate_tokens(question))
+                entry.future = _get_executor().submit(answer, question)
+                entry.future.add_done_callback(lambda future, entry=entry: self._finished(entry, future))
+                self._entries[key] = entry
+            self.stats['predicted'] += len(questions)
+        _record(predicted=len(questions))
+        return len(questions)
+
+    def _finished(self, entry: _Entry, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None or not future.result():
+            _record(failed=1)
+            return
+        entry.tokens = entry.prompt_tokens + estimate_tokens(future.result())
+        with self._lock:
+            self.stats['prefetched'] += 1
+            self.stats['tokens_spent'] += entry.tokens
+        _record(prefetched=1, tokens_spent=entry.tokens)
+
+    def lookup(self, query: str, code: str):
+        """The prefetched answer to ``query`` about ``code``, or None; each answer is served once.
+
+        Only finished prefetches are served: one still queued or running was scheduled at bulk
+        priority and could keep an interactive question waiting, so it is cancelled instead.
+        """
+        with self._lock:
+            if self._code_hash != code_hash(code):
+                return None
+            key = match_question(query, list(self._entries))
+            entry = self._entries.pop(key, None) if key else None
+        answer = None
+        if entry is not None:
+            if not entry.future.done():
+                entry.future.cancel()
+            elif not entry.future.cancelled() and entry.future.exception() is None:
+                answer = entry.future.result()
+        # Computed here: the done callback that sets entry.tokens may not have run yet
+        tokens = entry.prompt_tokens + estimate_tokens(answer) if answer else 0
+        with self._lock:
+            if answer:
+                self.stats['hits'] += 1
+                self.stats['tokens_used'] += tokens
+            else:
+                self.stats['misses'] += 1
+        if answer:
+            _record(hits=1, tokens_used=tokens)
+        else:
+            _record(misses=1)
+        return answer
+
+    def discard(self):
+        """Drop every prefetched answer, cancelling the ones not started yet"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.future.cancel()
+            self._entries = {}
+            self._code_hash = None
+
+    def pending(self) -> list:
+        """Questions with an answer waiting to be asked for"""
+        with self._lock:
+            return [entry.question for entry in self._entries.values()]
+
+
+def prefetch_stats() -> dict:
+    """Process-wide prefetch counters, with the hit rate and the tokens not (yet) used by a hit"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats['tokens_wasted'] = stats['tokens_spent'] - stats['tokens_used']
+    return stats
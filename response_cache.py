@@ -0,0 +1,182 @@
+"""Content-addressed cache for LLM responses.
+
+Responses are keyed on a hash of the normalized code, prompt template, query,
+model name and temperature. Lookups go through an in-memory LRU bounded by a
+byte budget, then a SQLite tier on local disk that survives restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+CACHE_DIR = os.getenv('CODE_WIZARD_CACHE_DIR', 'cache')
+MEMORY_BUDGET_BYTES = int(os.getenv('CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))  # 32MB
+DISK_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 7 days
+DISK_MAX_ENTRIES = int(os.getenv('CACHE_DISK_MAX_ENTRIES', '5000'))
+
+
+def normalize_code(code: str) -> str:
+    """Normalize line endings and surrounding whitespace so trivial paste differences share a key"""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def make_cache_key(code: str, prompt_template: str, query: str = None,
+                   model_name: str = '', temperature: float = 0.0) -> str:
+    """Build the content address for one LLM request"""
+    digest = hashlib.sha256()
+    for part in (normalize_code(code or ''), prompt_template, query or '', model_name, repr(temperature)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Two-tier response cache: memory LRU in front of a SQLite store"""
+
+    def __init__(self, path: str = None, memory_budget: int = MEMORY_BUDGET_BYTES,
+                 ttl_seconds: int = DISK_TTL_SECONDS, max_disk_entries: int = DISK_MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, 'responses.sqlite3')
+        self.memory_budget = memory_budget
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._conn = None
+        # Counted once when the database is opened and kept up to date on insert and delete
+        self._disk_entries = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'expired': 0,
+        }
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+            self._conn.commit()
+            self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return self._conn
+
+    def _remember(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.memory_budget:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key).encode('utf-8'))
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode('utf-8'))
+            self._stats['memory_evictions'] += 1
+
+    def get(self, key: str):
+        """Return the cached response for ``key`` or None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._memory[key]
+
+            now = time.time()
+            db = self._db()
+            row = db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._disk_entries -= max(db.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount, 0)
+                db.commit()
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self._stats['disk_hits'] += 1
+            self._remember(key, value)
+            return value
+
+    def set(self, key: str, value: str):
+        """Store a response in both tiers"""
+        if not value:
+            return
+        with self._lock:
+            self._remember(key, value)
+            now = time.time()
+            db = self._db()
+            if db.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is None:
+                self._disk_entries += 1
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._evict_disk(db, now)
+            db.commit()
+
+    def _evict_disk(self, db: sqlite3.Connection, now: float):
+        expired = max(db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount, 0)
+        self._stats['expired'] += expired
+        self._disk_entries -= expired
+        overflow = self._disk_entries - self.max_disk_entries
+        if overflow > 0:
+            evicted = max(db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            ).rowcount, 0)
+            self._stats['disk_evictions'] += evicted
+            self._disk_entries -= evicted
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            db = self._db()
+            db.execute("DELETE FROM responses")
+            db.commit()
+            self._disk_entries = 0
+
+    def stats(self) -> dict:
+        """Snapshot of hit, miss and eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            self._db()
+            stats['disk_entries'] = self._disk_entries
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
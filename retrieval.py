@@ -0,0 +1,132 @@
+"""Lexical retrieval of relevant code snippets for follow-up questions.
+
+The submitted code is split into function/method/block units and indexed with
+BM25 over identifiers (split on snake_case and camelCase), docstrings and
+comments. Follow-up prompts then carry only the top-k snippets instead of the
+whole file.
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import replace
+
+from chunking import split_units, estimate_tokens, CHARS_PER_TOKEN
+from static_analysis import code_hash
+
+
+RETRIEVAL_UNIT_TOKENS = 400
+RETRIEVAL_CACHE_SIZE = 64
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_STOPWORDS = {
+    'the', 'a', 'an', 'is', 'are', 'of', 'to', 'in', 'and', 'or', 'for', 'on', 'it', 'this',
+    'that', 'what', 'how', 'does', 'do', 'why', 'which', 'where', 'can', 'i', 'me', 'be',
+    'with', 'self', 'return', 'def', 'if', 'else', 'none', 'true', 'false', 'code',
+}
+
+
+def tokenize_text(text: str) -> list:
+    """Split text into lowercase terms, breaking identifiers into their parts"""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        parts = [p.lower() for piece in word.split('_') for p in _CAMEL_RE.findall(piece)]
+        if lowered not in _STOPWORDS:
+            terms.append(lowered)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in _STOPWORDS and len(p) > 1)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over the units of one piece of code"""
+
+    def __init__(self, units: list, k1: float = 1.5, b: float = 0.75):
+        self.units = units
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = []
+        self._doc_lengths = []
+        doc_freq = Counter()
+        for unit in units:
+            text = unit.name + "\n" + (unit.docstring or "") + "\n" + unit.source
+            freqs = Counter(tokenize_text(text))
+            self._term_freqs.append(freqs)
+            self._doc_lengths.append(sum(freqs.values()))
+            doc_freq.update(freqs.keys())
+        self._avg_length = sum(self._doc_lengths) / len(units) if units else 0.0
+        n = len(units)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Return up to top_k (score, unit) pairs, best first"""
+        terms = tokenize_text(query)
+        scores = []
+        for freqs, length, unit in zip(self._term_freqs, self._doc_lengths, self.units):
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term)
+                if not tf:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+                score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, unit))
+        scores.sort(key=lambda item: item[0], reverse=True)
+        return scores[:top_k]
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_retrieval_index(code: str) -> BM25Index:
+    """Return the BM25 index for this code, building it once per code hash"""
+    digest = code_hash(code)
+    with _index_lock:
+        if digest in _index_cache:
+            _index_cache.move_to_end(digest)
+            return _index_cache[digest]
+    index = BM25Index(split_units(code, RETRIEVAL_UNIT_TOKENS))
+    with _index_lock:
+        _index_cache[digest] = index
+        while len(_index_cache) > RETRIEVAL_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _truncate(unit, max_tokens: int):
+    """The leading lines of ``unit`` that fit in ``max_tokens`` followed by a truncation marker, or None"""
+    marker = "# ... truncated"
+    text = unit.source[:max(max_tokens - estimate_tokens(marker) - 1, 0) * CHARS_PER_TOKEN]
+    if '\n' in text:
+        text = text[:text.rindex('\n')]
+    if not text.strip():
+        return None
+    return replace(unit, source=f"{text}\n{marker}", end_line=unit.start_line + text.count('\n'))
+
+
+def relevant_snippets(code: str, query: str, top_k: int = 5, max_tokens: int = 3000) -> str:
+    """Format the top-k units for the query as prompt-ready snippets, in source order.
+
+    Snippets stay within ``max_tokens``; a hit too large for what is left, the best one included, is cut short.
+    """
+    hits = get_retrieval_index(code).search(query, top_k)
+    selected, total = [], 0
+    for _, unit in hits:
+        if total + unit.tokens > max_tokens:
+            unit = _truncate(unit, max_tokens - total)
+            if unit is not None:
+                selected.append(unit)
+            break
+        selected.append(unit)
+        total += unit.tokens
+    if not selected:
+        return ""
+    selected.sort(key=lambda unit: unit.start_line)
+    return "\n\n".join(
+        f"# {unit.kind} {unit.name} (lines {unit.start_line}-{unit.end_line})\n{unit.source}"
+        for unit in selected
+    )
@@ -0,0 +1,229 @@
+"""Global, rate-limit-aware scheduler for upstream LLM requests.
+
+Every request from every session goes through one process-wide scheduler
+that enforces requests/min and tokens/min budgets with token buckets, serves
+interactive follow-ups before bulk analyses, and retries rate-limited or
+transient failures with jittered exponential backoff, honoring Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+LLM_RPM = float(os.getenv('LLM_RPM', '30'))  # 0 disables the limit
+LLM_TPM = float(os.getenv('LLM_TPM', '20000'))  # 0 disables the limit
+# Completion tokens charged up front per request on top of the prompt estimate
+EXPECTED_COMPLETION_TOKENS = int(os.getenv('EXPECTED_COMPLETION_TOKENS', '800'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+BACKOFF_CAP = float(os.getenv('LLM_BACKOFF_CAP', '20'))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class TokenBucket:
+    """Bucket of ``per_minute`` units refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def refill(self, now: float):
+        if self.enabled:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (requests larger than the bucket wait for a full bucket)"""
+        if not self.enabled:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.enabled:
+            self.level -= min(amount, self.capacity)
+
+
+def _status_code(error: Exception):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def retry_after_seconds(error: Exception):
+    """Read Retry-After / retry-after-ms from an HTTP error response, if any"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_timeout(error: Exception) -> bool:
+    return _status_code(error) == 408 or isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+
+def is_unreachable(error: Exception) -> bool:
+    """The request never got to a server: connection refused, DNS failure and the like"""
+    if is_timeout(error) or _status_code(error) is not None:
+        return False
+    return isinstance(error, ConnectionError) or 'Connect' in type(error).__name__
+
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or 'Timeout' in name or 'Connection' in name
+
+
+class RequestScheduler:
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._depth = {INTERACTIVE: 0, BULK: 0}
+        self._stats = {'admitted': 0, 'throttled': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0}
+
+    def acquire(self, priority: int = INTERACTIVE, tokens: int = 0):
+        """Block until this request may be sent; lower priority values go first"""
+        cost = tokens + EXPECTED_COMPLETION_TOKENS
+        entry = (priority, next(self._seq))
+        throttled = False
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._depth[priority] = self._depth.get(priority, 0) + 1
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == entry:
+                        now = time.monotonic()
+                        self.requests.refill(now)
+                        self.tokens.refill(now)
+                        timeout = max(self._paused_until - now, self.requests.wait_time(1),
+                                      self.tokens.wait_time(cost))
+                        if timeout <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(cost)
+                            self._stats['admitted'] += 1
+                            return
+                    throttled = True
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._depth[priority] -= 1
+                if throttled:
+                    self._stats['throttled'] += 1
+                self._cond.notify_all()
+
+    def set_limits(self, rpm: float = None, tpm: float = None):
+        """Replace the budgets, e.g. to split them between worker processes"""
+        with self._cond:
+            if rpm is not None:
+                self.requests = TokenBucket(rpm)
+            if tpm is not None:
+                self.tokens = TokenBucket(tpm)
+            self._cond.notify_all()
+
+    def _retry_delay(self, error: Exception, attempt: int, retry_timeouts: bool = True):
+        """Seconds to wait before retrying, or None if the error should be raised"""
+        if attempt >= self.max_retries or not is_retryable(error) or (not retry_timeouts and is_timeout(error)):
+            with self._cond:
+                self._stats['failures'] += 1
+            return None
+        backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        with self._cond:
+            self._stats['retries'] += 1
+            if _status_code(error) == 429:
+                self._stats['rate_limited'] += 1
+                # The provider's budget is shared, so pause everyone, not just this request
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + (retry_after if retry_after is not None else backoff))
+                self._cond.notify_all()
+        return max(backoff, retry_after or 0.0)
+
+    def run(self, fn, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        """Call ``fn()`` within the budgets, retrying transient failures"""
+        for attempt in itertools.count():
+            self.acquire(priority, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, retry_timeouts)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def stream(self, start_stream, priority: int = INTERACTIVE, tokens: int = 0, retry_timeouts: bool = True):
+        """Iterate ``start_stream()`` within the budgets; retries only before the first chunk"""
+        for attempt in itertools.count():
+            self.acquire(priority, tokens)
+            started = False
+            try:
+                for chunk in start_stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt, retry_timeouts)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def arun(self, make_coro, priority: int = BULK, tokens: int = 0):
+        """Async counterpart of run(); waiting for a slot happens off the event loop"""
+        loop = asyncio.get_running_loop()
+        for attempt in itertools.count():
+            await loop.run_in_executor(None, self.acquire, priority, tokens)
+            try:
+                return await make_coro()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            for priority, depth in self._depth.items():
+                stats[f"queue_depth_{PRIORITY_NAMES.get(priority, priority)}"] = depth
+            stats['paused_seconds'] = round(max(0.0, self._paused_until - time.monotonic()), 2)
+            self.requests.refill(time.monotonic())
+            self.tokens.refill(time.monotonic())
+            stats['requests_available'] = round(self.requests.level, 1)
+            stats['tokens_available'] = round(self.tokens.level, 1)
+        return stats
+
+
+scheduler = RequestScheduler()
@@ -0,0 +1,233 @@
+"""Bounded per-session chat history.
+
+Each Streamlit session keeps one ``SessionHistory``, which holds the
+submitted code and every chat message, stored once as a compact
+``(role, content)`` tuple. When a session goes over its memory cap, its
+oldest messages move to an append-only spill file on local disk. They are
+read back only when someone pages through old history. Sessions backed by
+a ``SessionStore`` write every message through to SQLite instead and read
+old ones back from there, so they need no spill file. A process-wide cap
+makes the largest sessions spill first when all sessions together go over
+budget. Spill files are deleted when their session is garbage collected.
+"""
+import json
+import os
+import sys
+import threading
+import uuid
+import weakref
+from array import array
+from collections import OrderedDict
+
+from response_cache import CACHE_DIR
+
+
+SESSION_MEMORY_BYTES = int(os.getenv('SESSION_MEMORY_BYTES', str(2 * 1024 * 1024)))  # 2MB per session
+TOTAL_MEMORY_BYTES = int(os.getenv('SESSION_TOTAL_MEMORY_BYTES', str(256 * 1024 * 1024)))  # 256MB per process
+SPILL_DIR = os.getenv('SESSION_SPILL_DIR', os.path.join(CACHE_DIR, 'sessions'))
+# The latest messages are rendered on every rerun, so they always stay in memory
+MIN_RESIDENT_MESSAGES = int(os.getenv('SESSION_MIN_RESIDENT_MESSAGES', '20'))
+PAGE_CACHE_PAGES = 4
+
+ENTRY_OVERHEAD = sys.getsizeof(('', '')) + 8  # the tuple plus its slot in the list
+
+_sessions = weakref.WeakValueDictionary()
+_sessions_lock = threading.Lock()
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SessionHistory:
+    """Chat messages and code for one session, with old messages spilled to disk past ``memory_cap``"""
+
+    def __init__(self, session_id: str, memory_cap: int = SESSION_MEMORY_BYTES, spill_dir: str = SPILL_DIR,
+                 store=None):
+        self.session_id = session_id
+        self.memory_cap = memory_cap
+        self.store = store
+        self._spill_path = os.path.join(spill_dir, f"{session_id}-{uuid.uuid4().hex[:8]}.jsonl")
+        self._lock = threading.RLock()
+        self._code = ""
+        self._messages = []  # resident tail of the conversation
+        self._message_bytes = 0
+        self._spilled = 0  # messages no longer in memory, all older than the resident ones
+        self._spilled_offsets = array('q')  # byte offset of each spilled message in the spill file
+        self._spilled_bytes = 0
+        self._pages = OrderedDict()  # rendered markdown of full history pages
+        self._page_bytes = 0
+        weakref.finalize(self, _remove_file, self._spill_path)
+        with _sessions_lock:
+            _sessions[self._spill_path] = self
+
+    @classmethod
+    def restore(cls, data: dict, store, memory_cap: int = SESSION_MEMORY_BYTES):
+        """Rebuild a session from ``store.load()``; only the latest messages are read into memory"""
+        session_id = data['session_id']
+        history = cls(session_id, memory_cap, store=store)
+        history._code = data['code']
+        count = data['message_count']
+        history._messages = store.messages(session_id, max(0, count - MIN_RESIDENT_MESSAGES), count)
+        history._spilled = count - len(history._messages)
+        history._message_bytes = sum(sys.getsizeof(content) + ENTRY_OVERHEAD for _, content in history._messages)
+        return history
+
+    @property
+    def code(self) -> str:
+        return self._code
+
+    @code.setter
+    def code(self, code: str):
+        with self._lock:
+            self._code = code or ""
+            if self.store is not None:
+                self.store.set_code(self.session_id, self._code)
+        enforce_total_cap()
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._messages)
+
+    def append(self, role: str, content: str):
+        with self._lock:
+            if self.store is not None:
+                self.store.append_message(self.session_id, role, content)
+            self._messages.append((role, content))
+            self._message_bytes += sys.getsizeof(content) + ENTRY_OVERHEAD
+            if self.memory_bytes() > self.memory_cap:
+                self.spill(self.memory_cap)
+        enforce_total_cap()
+
+    def messages(self, start: int = 0, stop: int = None) -> list:
+        """Messages ``start:stop`` as {"role", "content"} dicts, reading spilled ones back from disk"""
+        with self._lock:
+            total = len(self)
+            stop = total if stop is None else min(stop, total)
+            start = max(0, start)
+            spilled = self._spilled
+            entries = self._read_spilled(start, min(stop, spilled)) if start < spilled else []
+            entries.extend(self._messages[max(start, spilled) - spilled:max(stop, spilled) - spilled])
+        return [{"role": role, "content": content} for role, content in entries]
+
+    def _read_spilled(self, start: int, stop: int) -> list:
+        if self.store is not None:
+            return self.store.messages(self.session_id, start, stop)
+        entries = []
+        with open(self._spill_path, 'rb') as f:
+            f.seek(self._spilled_offsets[start])
+            for _ in range(stop - start):
+                entries.append(tuple(json.loads(f.readline())))
+        return entries
+
+    def recent(self, count: int) -> list:
+        return self.messages(len(self) - count)
+
+    def rendered_page(self, start: int, size: int, render) -> str:
+        """``render(messages)`` for one full page, cached since a full page never changes"""
+        key = (start, size)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                return page
+        page = render(self.messages(start, start + size))
+        with self._lock:
+            if key not in self._pages:
+                self._pages[key] = page
+                self._page_bytes += sys.getsizeof(page)
+                while len(self._pages) > PAGE_CACHE_PAGES:
+                    _, evicted = self._pages.popitem(last=False)
+                    self._page_bytes -= sys.getsizeof(evicted)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._code = ""
+            self._messages = []
+            self._message_bytes = 0
+            self._spilled = 0
+            self._spilled_offsets = array('q')
+            self._spilled_bytes = 0
+            self._pages.clear()
+            self._page_bytes = 0
+            _remove_file(self._spill_path)
+            if self.store is not None:
+                self.store.clear(self.session_id)
+
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self._code) + self._message_bytes + self._page_bytes
+                + self._spilled_offsets.itemsize * len(self._spilled_offsets))
+
+    def spill(self, target_bytes: int):
+        """Drop cached pages, then move the oldest messages to disk until memory use is under ``target_bytes``"""
+        with self._lock:
+            self._pages.clear()
+            self._page_bytes = 0
+            count = 0
+            excess = self.memory_bytes() - target_bytes
+            while excess > 0 and count < len(self._messages) - MIN_RESIDENT_MESSAGES:
+                excess -= sys.getsizeof(self._messages[count][1]) + ENTRY_OVERHEAD
+                count += 1
+            if count <= 0:
+                return
+            self._spilled += count
+            if self.store is not None:
+                # Already persisted, so there is nothing to write
+                self._message_bytes -= sum(sys.getsizeof(c) + ENTRY_OVERHEAD for _, c in self._messages[:count])
+                del self._messages[:count]
+                return
+            os.makedirs(os.path.dirname(self._spill_path), exist_ok=True)
+            with open(self._spill_path, 'ab') as f:
+                for role, content in self._messages[:count]:
+                    self._spilled_offsets.append(f.tell())
+                    line = (json.dumps([role, content], ensure_ascii=False) + "\n").encode('utf-8')
+                    f.write(line)
+                    self._spilled_bytes += len(line)
+                    self._message_bytes -= sys.getsizeof(content) + ENTRY_OVERHEAD
+            del self._messages[:count]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'messages': len(self),
+                'resident_messages': len(self._messages),
+                'spilled_messages': self._spilled,
+                'memory_bytes': self.memory_bytes(),
+                'spilled_bytes': self._spilled_bytes,
+            }
+
+
+def _live_sessions() -> list:
+    with _sessions_lock:
+        return list(_sessions.values())
+
+
+def enforce_total_cap(total_cap: int = TOTAL_MEMORY_BYTES):
+    """Spill the largest sessions first while all sessions together are over ``total_cap``"""
+    sessions = _live_sessions()
+    total = sum(s.memory_bytes() for s in sessions)
+    if total <= total_cap:
+        return
+    for session in sorted(sessions, key=lambda s: s.memory_bytes(), reverse=True):
+        before = session.memory_bytes()
+        session.spill(min(before, session.memory_cap) // 2)
+        total -= before - session.memory_bytes()
+        if total <= total_cap:
+            return
+
+
+def memory_report() -> dict:
+    """Process-wide session memory usage"""
+    stats = [s.stats() for s in _live_sessions()]
+    return {
+        'sessions': len(stats),
+        'total_bytes': sum(s['memory_bytes'] for s in stats),
+        'max_session_bytes': max((s['memory_bytes'] for s in stats), default=0),
+        'spilled_bytes': sum(s['spilled_bytes'] for s in stats),
+        'messages': sum(s['messages'] for s in stats),
+        'session_cap_bytes': SESSION_MEMORY_BYTES,
+        'total_cap_bytes': TOTAL_MEMORY_BYTES,
+    }
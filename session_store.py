@@ -0,0 +1,174 @@
+"""SQLite-backed store for resumable sessions.
+
+Holds each session's code, small UI state and chat messages (the initial
+analysis included) so a session survives browser refreshes and worker
+restarts and can be resumed without another LLM call. Every turn is one
+appended row; nothing rewrites a whole session.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from response_cache import CACHE_DIR
+
+
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(30 * 24 * 3600)))  # 30 days
+
+
+def new_session_id() -> str:
+    """Random, collision-free session id (also safe to put in a URL)"""
+    return uuid.uuid4().hex
+
+
+class SessionStore:
+    def __init__(self, path: str = None, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.path = path or os.path.join(CACHE_DIR, 'sessions.sqlite3')
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stats = {'sessions_created': 0, 'sessions_resumed': 0, 'messages_written': 0, 'expired': 0}
+        # Row counts are taken once when the database is opened and kept up to date on insert and delete
+        self._counts = {'stored_sessions': 0, 'stored_messages': 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " user_name TEXT,"
+                " code TEXT NOT NULL DEFAULT '',"
+                " state TEXT NOT NULL DEFAULT '{}',"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            # The rowid orders messages, so two tabs appending to one session never collide
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+            self._expire(self._conn)
+            self._conn.commit()
+            self._counts['stored_sessions'] = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            self._counts['stored_messages'] = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return self._conn
+
+    def _expire(self, db: sqlite3.Connection):
+        cutoff = time.time() - self.ttl_seconds
+        messages = db.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+        ).rowcount
+        sessions = db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        self._stats['expired'] += max(sessions, 0)
+        self._counts['stored_sessions'] -= max(sessions, 0)
+        self._counts['stored_messages'] -= max(messages, 0)
+
+    def _touch(self, db: sqlite3.Connection, session_id: str):
+        db.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+
+    def create(self, session_id: str, user_name: str = None):
+        with self._lock:
+            db = self._db()
+            now = time.time()
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, user_name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, user_name, now, now)
+            ).rowcount
+            db.commit()
+            self._stats['sessions_created'] += 1
+            self._counts['stored_sessions'] += max(inserted, 0)
+
+    def load(self, session_id: str):
+        """The stored session as a dict (without messages), or None"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT user_name, code, state FROM sessions WHERE session_id = ?",
+                             (session_id,)).fetchone()
+            if row is None:
+                return None
+            count = db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+            self._stats['sessions_resumed'] += 1
+        return {'session_id': session_id, 'user_name': row[0], 'code': row[1], 'state': json.loads(row[2]),
+                'message_count': count}
+
+    def append_message(self, session_id: str, role: str, content: str):
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                       (session_id, role, content, time.time()))
+            self._touch(db, session_id)
+            db.commit()
+            self._stats['messages_written'] += 1
+            self._counts['stored_messages'] += 1
+
+    def messages(self, session_id: str, start: int, stop: int) -> list:
+        """Messages ``start:stop`` of a session as (role, content) tuples"""
+        if stop <= start:
+            return []
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                (session_id, stop - start, start)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def set_code(self, session_id: str, code: str):
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE sessions SET code = ?, updated_at = ? WHERE session_id = ?",
+                       (code, time.time(), session_id))
+            db.commit()
+
+    def update_state(self, session_id: str, **fields):
+        """Merge small UI fields (user name, counters, flags) into the stored session"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            state = json.loads(row[0])
+            state.update(fields)
+            db.execute("UPDATE sessions SET state = ?, user_name = COALESCE(?, user_name), updated_at = ?"
+                       " WHERE session_id = ?",
+                       (json.dumps(state), fields.get('user_name'), time.time(), session_id))
+            db.commit()
+
+    def clear(self, session_id: str):
+        """Forget a session's code and messages but keep the session itself"""
+        with self._lock:
+            db = self._db()
+            deleted = db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,)).rowcount
+            db.execute("UPDATE sessions SET code = '', updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            db.commit()
+            self._counts['stored_messages'] -= max(deleted, 0)
+
+    def stats(self) -> dict:
+        """Counters plus stored row counts; cheap enough for every rerun and metrics scrape (no table scans)"""
+        with self._lock:
+            self._db()
+            return {**self._stats, **self._counts}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+    return _store
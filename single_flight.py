@@ -0,0 +1,130 @@
+"""Process-wide single-flight coalescing of identical in-flight LLM requests.
+
+When several sessions issue a request with the same prompt fingerprint at
+the same time, only the first one (the leader) goes upstream; the others
+wait for it and share its result. Streams are shared too: the upstream
+stream is drained by a background thread into a buffer that every waiting
+session reads from, so a session that goes away doesn't stall the rest.
+Completed requests are forgotten immediately; caching is the response
+cache's job.
+"""
+import hashlib
+import json
+import threading
+
+
+def fingerprint(prompt_template: str, model_name: str, temperature: float, kwargs: dict) -> str:
+    """Stable hash of everything that determines an LLM response"""
+    payload = json.dumps([prompt_template, model_name, temperature, sorted(kwargs.items())],
+                         default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SharedStream:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def read(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                finished, error = self.finished, self.error
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self._stats = {'leaders': 0, 'coalesced': 0, 'errors': 0, 'in_flight': 0}
+
+    def do(self, key: str, fn):
+        """Run ``fn()`` once for all concurrent callers with the same key and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stream(self, key: str, start_stream):
+        """Iterate a shared stream of text chunks; ``start_stream()`` is only called by the leader"""
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is not None:
+                self._stats['coalesced'] += 1
+            else:
+                shared = self._streams[key] = _SharedStream()
+                self._stats['leaders'] += 1
+                threading.Thread(target=self._produce, args=(key, shared, start_stream),
+                                 name='single-flight-stream', daemon=True).start()
+        return shared.read()
+
+    def _produce(self, key: str, shared: _SharedStream, start_stream):
+        try:
+            for chunk in start_stream():
+                with shared.condition:
+                    shared.chunks.append(chunk)
+                    shared.condition.notify_all()
+        except Exception as e:
+            with shared.condition:
+                shared.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with shared.condition:
+                shared.finished = True
+                shared.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls) + len(self._streams)
+        return stats
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,68 @@
+"""Cold-start profiling: per-import timings and first-paint marks.
+
+Timings are recorded once per process, the first time each import or mark
+happens. Run ``python startup_profile.py`` to measure the import cost of each
+dependency in fresh interpreters and print the results as JSON, so cold-start
+regressions can be compared between runs.
+"""
+import json
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Reference point for marks: the first time the app script imported this module
+PROCESS_START = time.perf_counter()
+
+PROFILED_MODULES = [
+    'streamlit', 'dotenv', 'httpx', 'langchain_core.prompts', 'langchain_groq',
+]
+
+_lock = threading.Lock()
+_imports = {}
+_marks = {}
+
+
+@contextmanager
+def import_timer(name: str):
+    """Time an import block; only the first (cold) measurement per name is kept"""
+    start = time.perf_counter()
+    yield
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _lock:
+        _imports.setdefault(name, round(elapsed_ms, 1))
+
+
+def mark(name: str) -> bool:
+    """Record milliseconds since process start the first time ``name`` happens"""
+    with _lock:
+        if name in _marks:
+            return False
+        _marks[name] = round((time.perf_counter() - PROCESS_START) * 1000, 1)
+        return True
+
+
+def report() -> dict:
+    """Snapshot of import timings and marks"""
+    with _lock:
+        return {'imports_ms': dict(_imports), 'marks_ms': dict(_marks)}
+
+
+def measure_cold_imports(modules: list = None) -> dict:
+    """Import each module in a fresh interpreter and return its cold import time in ms"""
+    results = {}
+    for module in modules or PROFILED_MODULES:
+        code = (
+            "import time; start = time.perf_counter(); "
+            f"import {module}; "
+            "print((time.perf_counter() - start) * 1000)"
+        )
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        results[module] = round(float(proc.stdout.strip()), 1) if proc.returncode == 0 else None
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps({'cold_imports_ms': measure_cold_imports(sys.argv[1:] or None)}, indent=2))
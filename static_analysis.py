@@ -0,0 +1,334 @@
+"""Local static pre-analysis of Python source.
+
+Builds a structural index (functions, classes, imports, cyclomatic
+complexity, line counts and call graph edges) with ``ast`` and ``tokenize``.
+Indexes are cached per code hash so reruns don't re-parse the same code. The
+index is used to shrink prompts and to answer structural questions locally
+without an LLM call.
+"""
+import ast
+import hashlib
+import io
+import re
+import threading
+import tokenize
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+INDEX_CACHE_SIZE = 64
+
+# Nodes that add a branch to the control flow graph
+_BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+                 ast.Assert, ast.comprehension)
+
+
+@dataclass
+class FunctionInfo:
+    name: str
+    qualname: str
+    lineno: int
+    end_lineno: int
+    args: list
+    complexity: int
+    calls: list
+    docstring: str = None
+
+
+@dataclass
+class ClassInfo:
+    name: str
+    lineno: int
+    end_lineno: int
+    bases: list
+    methods: list
+    docstring: str = None
+
+
+@dataclass
+class CodeIndex:
+    code_hash: str
+    functions: list = field(default_factory=list)
+    classes: list = field(default_factory=list)
+    imports: list = field(default_factory=list)
+    total_lines: int = 0
+    code_lines: int = 0
+    comment_lines: int = 0
+    blank_lines: int = 0
+    call_edges: list = field(default_factory=list)
+
+    def find_function(self, name: str):
+        """Look a function up by qualified or bare name"""
+        for func in self.functions:
+            if func.qualname == name:
+                return func
+        for func in self.functions:
+            if func.name == name:
+                return func
+        return None
+
+    def callers_of(self, name: str) -> list:
+        return sorted({caller for caller, callee in self.call_edges if callee == name})
+
+    def callees_of(self, name: str) -> list:
+        func = self.find_function(name)
+        return sorted(set(func.calls)) if func else []
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def _call_name(node: ast.Call):
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def _complexity(node) -> int:
+    """McCabe cyclomatic complexity of a function body (nested functions excluded)"""
+    complexity = 1
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(child, _BRANCH_NODES):
+            complexity += 1
+            if isinstance(child, ast.comprehension):
+                complexity += len(child.ifs)
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+        elif isinstance(child, ast.match_case):
+            complexity += 1
+        stack.extend(ast.iter_child_nodes(child))
+    return complexity
+
+
+def _calls(node) -> list:
+    calls = []
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(child, ast.Call):
+            name = _call_name(child)
+            if name:
+                calls.append(name)
+        stack.extend(ast.iter_child_nodes(child))
+    return calls
+
+
+def _count_lines(code: str, index: CodeIndex):
+    lines = code.splitlines()
+    index.total_lines = len(lines)
+    index.blank_lines = sum(1 for line in lines if not line.strip())
+    code_rows = set()
+    comment_rows = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                comment_rows.add(token.start[0])
+            elif token.type not in (tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+                                    tokenize.DEDENT, tokenize.ENDMARKER):
+                code_rows.update(range(token.start[0], token.end[0] + 1))
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    index.comment_lines = len(comment_rows - code_rows)
+    index.code_lines = index.total_lines - index.blank_lines - index.comment_lines
+
+
+def _build(code: str, digest: str):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    index = CodeIndex(digest)
+    _count_lines(code, index)
+
+    def visit(body, prefix: str = ''):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + node.name
+                calls = _calls(node)
+                index.functions.append(FunctionInfo(
+                    node.name, qualname, node.lineno, node.end_lineno,
+                    [arg.arg for arg in node.args.args], _complexity(node), calls,
+                    ast.get_docstring(node)
+                ))
+                index.call_edges.extend((qualname, callee) for callee in calls)
+                visit(node.body, qualname + '.')
+            elif isinstance(node, ast.ClassDef):
+                index.classes.append(ClassInfo(
+                    prefix + node.name, node.lineno, node.end_lineno,
+                    [ast.unparse(base) for base in node.bases],
+                    [n.name for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))],
+                    ast.get_docstring(node)
+                ))
+                visit(node.body, prefix + node.name + '.')
+            elif isinstance(node, ast.Import):
+                index.imports.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                module = '.' * node.level + (node.module or '')
+                index.imports.extend(f"{module}.{alias.name}" for alias in node.names)
+            else:
+                if not prefix:
+                    index.call_edges.extend(('<module>', callee) for callee in _calls(node))
+                for attr in ('body', 'orelse', 'finalbody', 'handlers'):
+                    visit(getattr(node, attr, []) or [], prefix)
+
+    visit(tree.body)
+    index.call_edges = list(dict.fromkeys(index.call_edges))
+    return index
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def build_index(code: str):
+    """Return the structural index for Python code, or None if it doesn't parse"""
+    digest = code_hash(code)
+    with _index_lock:
+        if digest in _index_cache:
+            _index_cache.move_to_end(digest)
+            return _index_cache[digest]
+    index = _build(code, digest)
+    with _index_lock:
+        _index_cache[digest] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def summarize(index: CodeIndex, max_items: int = 40) -> str:
+    """Compact plain-text structural summary for use in prompts"""
+    lines = [
+        f"Lines: {index.total_lines} total, {index.code_lines} code, "
+        f"{index.comment_lines} comment, {index.blank_lines} blank"
+    ]
+    if index.imports:
+        lines.append("Imports: " + ", ".join(index.imports[:max_items]))
+    for cls in index.classes[:max_items]:
+        bases = f"({', '.join(cls.bases)})" if cls.bases else ""
+        lines.append(f"class {cls.name}{bases} L{cls.lineno}-{cls.end_lineno}: methods {', '.join(cls.methods)}")
+    for func in index.functions[:max_items]:
+        calls = sorted(set(func.calls))[:8]
+        lines.append(
+            f"def {func.qualname}({', '.join(func.args)}) L{func.lineno}-{func.end_lineno} "
+            f"complexity={func.complexity}" + (f" calls: {', '.join(calls)}" if calls else "")
+        )
+    hidden = max(0, len(index.classes) - max_items) + max(0, len(index.functions) - max_items)
+    if hidden:
+        lines.append(f"... {hidden} more definitions")
+    return "\n".join(lines)
+
+
+def compact_source(code: str) -> str:
+    """Strip comments and blank lines to shrink a prompt without changing behaviour"""
+    try:
+        tokens = [t for t in tokenize.generate_tokens(io.StringIO(code).readline)
+                  if t.type != tokenize.COMMENT]
+        stripped = tokenize.untokenize(tokens)
+    except (tokenize.TokenError, SyntaxError, ValueError):
+        stripped = code
+    return "\n".join(line.rstrip() for line in stripped.splitlines() if line.strip())
+
+
+def _format_names(names: list) -> str:
+    return "\n".join(f"- `{name}`" for name in names) if names else "_None found._"
+
+
+# Each pattern must match the whole question: a keyword inside a longer question ("how many functions call X",
+# "how can I reduce the complexity of f") is a question for the LLM
+_NAME = r"`?([A-Za-z_][\w.]*?)(?:\(\))?`?"
+_CODE = r"(?: (?:in|of) (?:the|this) (?:code|file|module|script))?"
+_COUNT_RE = re.compile(
+    rf"how many (functions|methods|classes|imports|lines)(?: of code)?"
+    rf"(?: (?:are there|does (?:it|the code|this code|the file|this file) have))?{_CODE}",
+    re.IGNORECASE
+)
+_CALLERS_RE = re.compile(
+    rf"(?:(?:which|what) (?:functions?|methods?) calls? {_NAME}|who calls {_NAME}"
+    rf"|(?:(?:show|list)(?: me)? )?(?:the |all )?callers of {_NAME}|where is {_NAME} called(?: from)?){_CODE}",
+    re.IGNORECASE
+)
+_CALLEES_RE = re.compile(rf"what (?:functions? |methods? )?does {_NAME} call", re.IGNORECASE)
+_LIST_RE = re.compile(rf"(?:list|show)(?: me)?(?: all)?(?: the)? (functions|methods|classes|imports){_CODE}",
+                      re.IGNORECASE)
+_COMPLEXITY_RE = re.compile(
+    rf"(?:(?:what|which) (?:is|are) |what's |(?:show|list)(?: me)? )?(?:the )?"
+    rf"(?:most complex (?:functions?|methods?)|cyclomatic complexit(?:y|ies)(?: of (?:all |the )?functions)?"
+    rf"|(?:cyclomatic )?complexity of {_NAME}){_CODE}",
+    re.IGNORECASE
+)
+
+
+def answer_structural_question(query: str, index: CodeIndex):
+    """Answer simple structural questions from the index; returns None when the LLM is needed"""
+    if index is None or not query:
+        return None
+    q = query.strip().rstrip('?.! ').strip()
+
+    match = _COUNT_RE.fullmatch(q)
+    if match:
+        kind = match.group(1).lower()
+        if kind == 'lines':
+            return (f"📏 The code has **{index.total_lines}** lines: {index.code_lines} code, "
+                    f"{index.comment_lines} comment and {index.blank_lines} blank.")
+        if kind == 'functions':
+            top_level = [f for f in index.functions if '.' not in f.qualname]
+            return (f"🔢 There are **{len(index.functions)}** functions in total "
+                    f"({len(top_level)} at module level).")
+        if kind == 'methods':
+            methods = sum(len(c.methods) for c in index.classes)
+            return f"🔢 There are **{methods}** methods across {len(index.classes)} classes."
+        count = len(index.classes) if kind == 'classes' else len(index.imports)
+        return f"🔢 There are **{count}** {kind}."
+
+    match = _CALLERS_RE.fullmatch(q)
+    if match:
+        name = next(g for g in match.groups() if g)
+        bare = name.split('.')[-1]
+        # Unknown names are likely not identifiers at all
+        if index.find_function(name) is None and not any(callee == bare for _, callee in index.call_edges):
+            return None
+        return f"📞 Callers of `{name}`:\n{_format_names(index.callers_of(bare))}"
+
+    match = _CALLEES_RE.fullmatch(q)
+    if match:
+        name = match.group(1)
+        if index.find_function(name) is None:
+            return None
+        return f"📞 `{name}` calls:\n{_format_names(index.callees_of(name))}"
+
+    match = _LIST_RE.fullmatch(q)
+    if match:
+        kind = match.group(1).lower()
+        if kind == 'functions':
+            names = [f"{f.qualname}()" for f in index.functions]
+        elif kind == 'methods':
+            names = [f"{c.name}.{m}()" for c in index.classes for m in c.methods]
+        elif kind == 'classes':
+            names = [c.name for c in index.classes]
+        else:
+            names = index.imports
+        return f"📋 {kind.capitalize()}:\n{_format_names(names)}"
+
+    match = _COMPLEXITY_RE.fullmatch(q)
+    if match and index.functions:
+        if match.group(1):
+            func = index.find_function(match.group(1))
+            if func is None:
+                return None
+            return f"🧮 `{func.qualname}` has a cyclomatic complexity of **{func.complexity}**."
+        ranked = sorted(index.functions, key=lambda f: f.complexity, reverse=True)[:5]
+        return "🧮 Most complex functions:\n" + "\n".join(
+            f"- `{f.qualname}` (lines {f.lineno}-{f.end_lineno}): complexity **{f.complexity}**"
+            for f in ranked
+        )
+    return None
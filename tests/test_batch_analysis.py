@@ -0,0 +1,21 @@
+import batch_analysis
+from batch_analysis import build_rollup, FileResult
+
+
+def test_rollup_counts_omitted_and_failed_files_separately(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(batch_analysis, 'get_llm_response',
+                        lambda template, **kwargs: prompts.append(kwargs['file_summaries']) or "rollup")
+    monkeypatch.setattr(batch_analysis, 'ROLLUP_MAX_CHARS', 3 * (batch_analysis.ROLLUP_CHARS_PER_FILE + 20))
+    results = [FileResult(f"ok{i}.py", analysis="x" * 5000) for i in range(5)]
+    results += [FileResult(f"bad{i}.py", error="timed out") for i in range(4)]
+
+    assert build_rollup(results) == "rollup"
+    summaries = prompts[0]
+    assert summaries.count("### ok") == 3
+    assert "... 2 more files omitted" in summaries
+    assert "4 files could not be analyzed: bad0.py, bad1.py, bad2.py, bad3.py" in summaries
+
+
+def test_no_rollup_without_analyses():
+    assert build_rollup([FileResult("bad.py", error="boom")]) is None
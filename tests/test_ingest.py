@@ -0,0 +1,27 @@
+import io
+
+import pytest
+
+from ingest import read_upload, IngestError
+
+
+class Upload(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile, which reports its size up front"""
+
+    def __init__(self, data: bytes, size: int = None):
+        super().__init__(data)
+        self.size = len(data) if size is None else size
+
+    def read(self, *args):
+        if self.size > 1024:
+            raise AssertionError("an oversized upload was read")
+        return super().read(*args)
+
+
+def test_reported_size_over_the_cap_is_rejected_before_reading():
+    with pytest.raises(IngestError, match="larger than"):
+        read_upload(Upload(b"x = 1\n", size=4096), 'big.py', max_bytes=1024)
+
+
+def test_upload_within_the_cap_is_read():
+    assert read_upload(Upload(b"x = 1\n"), 'small.py', max_bytes=1024).code == "x = 1\n"
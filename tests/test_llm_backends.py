@@ -0,0 +1,17 @@
+import pytest
+
+from llm_backends import Backend, OpenAICompatibleBackend
+
+
+def test_an_incomplete_backend_fails_when_created():
+    class NoHealthCheck(Backend):
+        def chain(self, prompt_template, model_name, temperature, timeout):
+            return None
+
+    with pytest.raises(TypeError):
+        NoHealthCheck('partial', 'http://127.0.0.1:1')
+
+
+def test_a_complete_backend_can_be_created():
+    backend = OpenAICompatibleBackend('local', 'http://127.0.0.1:1/v1')
+    assert backend._health_request() == ('http://127.0.0.1:1/v1/models', {})
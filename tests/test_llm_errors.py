@@ -0,0 +1,73 @@
+import pytest
+
+import analysis_core
+import app
+import metrics
+from log_analytics import add_record, day_report
+
+
+def failing_stream():
+    yield "partial"
+    raise RuntimeError("connection reset")
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    """Records the app would log, with the UI calls stubbed out"""
+    records = []
+    monkeypatch.setattr(metrics, 'submit_log', records.append)
+    monkeypatch.setattr(app, 'log_user_action', lambda action, details=None: records.append(
+        {'action': action, 'details': details or {}}
+    ))
+    monkeypatch.setattr(app.st, 'error', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, '_require_backend', lambda: None)
+    return records
+
+
+def failed_requests(records) -> dict:
+    days = {}
+    for record in records:
+        add_record(days, {'timestamp': '2026-01-01T12:00:00', **record})
+    return day_report('2026-01-01', days['2026-01-01'])
+
+
+def test_a_failed_stream_marks_its_span(logged):
+    with pytest.raises(RuntimeError):
+        list(analysis_core.stream_llm_response(failing_stream, prompt_tokens=10))
+    spans = [record for record in logged if record.get('span') == 'llm_stream']
+    assert spans[0]['metadata']['error'] == 'RuntimeError'
+    assert spans[0]['metadata']['chunks'] == 1
+
+    row = failed_requests(logged)
+    assert row['llm_error_rate'] == 1.0
+    assert row['latency_p50_ms'] is None
+
+
+def test_a_completed_stream_has_no_error(logged):
+    assert list(analysis_core.stream_llm_response(lambda: iter(["a", "b"]), prompt_tokens=10)) == ["a", "b"]
+    assert 'error' not in logged[0]['metadata']
+
+
+def test_a_failed_streamed_analysis_is_a_failed_request(logged):
+    assert list(app._report_stream_errors(failing_stream(), "code_analysis")) == ["partial"]
+    assert logged == [{'action': 'error', 'details': {
+        'error_type': 'RuntimeError', 'error_message': 'connection reset', 'action': 'code_analysis'
+    }}]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_a_failed_general_question_is_a_failed_request(logged, monkeypatch, stream):
+    def get_llm_response(*args, stream=False, **kwargs):
+        if stream:
+            return failing_stream()
+        raise RuntimeError("upstream error")
+    monkeypatch.setattr(app.core, 'get_llm_response', get_llm_response)
+
+    response = app.get_llm_response(app.GENERAL_QUESTION_PROMPT, stream=stream, query="What is a closure?")
+    if stream:
+        response = list(response)
+    assert response == (["partial"] if stream else None)
+    logged.append({'action': 'chat_message'})
+    row = failed_requests(logged)
+    assert row['failed_requests'] == 1
+    assert row['error_rate'] == 1.0
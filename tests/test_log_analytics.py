@@ -0,0 +1,27 @@
+from log_analytics import add_record, day_report
+
+
+def record(**fields):
+    return {'timestamp': '2026-01-01T12:00:00', **fields}
+
+
+def test_error_rate_counts_failed_requests_only():
+    days = {}
+    add_record(days, record(action='submit_code'))
+    add_record(days, record(action='chat_message'))
+    add_record(days, record(action='error', details={'action': 'code_analysis'}))
+    for _ in range(5):
+        add_record(days, record(level='ERROR', event_type='retry'))
+    add_record(days, record(event_type='span', span='api_ask', metadata={'outcome': 'timeouts'}))
+    row = day_report('2026-01-01', days['2026-01-01'])
+    assert row['errors'] == 7
+    assert row['failed_requests'] == 2
+    assert row['error_rate'] == round(2 / 3, 4)
+
+
+def test_error_rate_never_exceeds_one():
+    days = {}
+    add_record(days, record(action='submit_code'))
+    add_record(days, record(action='error', details={'action': 'code_analysis'}))
+    add_record(days, record(action='error', details={'action': 'sectioned_analysis'}))
+    assert day_report('2026-01-01', days['2026-01-01'])['error_rate'] == 1.0
@@ -0,0 +1,27 @@
+import map_reduce
+from chunking import estimate_tokens
+from map_reduce import invoke_all, map_analysis, needs_map_reduce
+
+
+def test_invoke_all_keeps_input_order():
+    def invoke(prompt_template, kwargs, priority):
+        return prompt_template.format(**kwargs), 'model-a'
+
+    results = invoke_all("note {n}", [{'n': n} for n in range(20)], invoke, concurrency=4)
+    assert results == [(f"note {n}", 'model-a') for n in range(20)]
+
+
+def test_prompts_fit_the_smallest_configured_window(monkeypatch):
+    monkeypatch.setattr(map_reduce.router, 'max_prompt_tokens', lambda: 2048)
+    code = "\n\n".join(f"def f{i}(x):\n    return x * {i}  # padding for a realistic line\n" for i in range(2000))
+    prompts = []
+
+    def invoke(prompt_template, kwargs, priority):
+        prompts.append(prompt_template.format(**kwargs))
+        return "short note", 'local'
+
+    assert needs_map_reduce(code)
+    notes = map_analysis(code, invoke)['notes']
+    assert len(prompts) > 1
+    assert max(estimate_tokens(prompt) for prompt in prompts) <= 2048
+    assert estimate_tokens(notes) <= 2048
@@ -0,0 +1,27 @@
+from response_cache import ResponseCache
+
+
+def test_disk_entries_are_counted_incrementally(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'), max_disk_entries=3)
+    cache.set('a', 'one')
+    cache.set('a', 'one again')
+    cache.set('b', 'two')
+    assert cache.stats()['disk_entries'] == 2
+
+    for key in 'cde':
+        cache.set(key, key)
+    stats = cache.stats()
+    assert stats['disk_entries'] == 3
+    assert stats['disk_evictions'] == 2
+    assert ResponseCache(cache.path).stats()['disk_entries'] == 3
+
+    cache.clear()
+    assert cache.stats()['disk_entries'] == 0
+
+
+def test_expired_entries_leave_the_count(tmp_path):
+    path = str(tmp_path / 'responses.sqlite3')
+    ResponseCache(path).set('a', 'one')
+    cache = ResponseCache(path, ttl_seconds=-1)
+    assert cache.get('a') is None
+    assert cache.stats()['disk_entries'] == 0
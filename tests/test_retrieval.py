@@ -0,0 +1,22 @@
+from chunking import estimate_tokens
+from retrieval import relevant_snippets
+
+
+def big_function(name: str, lines: int) -> str:
+    body = "\n".join(f"    {name}_value_{i} = compute_{name}({i})" for i in range(lines))
+    return f"def {name}():\n{body}\n    return None\n"
+
+
+def test_a_huge_first_hit_is_truncated_to_the_budget():
+    code = big_function('parse_header', 2000) + "\n\n" + big_function('helper', 5)
+    snippets = relevant_snippets(code, "how does parse_header work", max_tokens=500)
+    assert "def parse_header" in snippets
+    assert "# ... truncated" in snippets
+    assert estimate_tokens(snippets) <= 500 + 50  # plus the per-snippet header line
+
+
+def test_small_hits_are_kept_whole():
+    code = big_function('parse_header', 5) + "\n\n" + big_function('helper', 5)
+    snippets = relevant_snippets(code, "parse_header helper", max_tokens=3000)
+    assert "truncated" not in snippets
+    assert "def parse_header" in snippets and "def helper" in snippets
@@ -0,0 +1,31 @@
+import pytest
+
+import analysis_core
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite3'))
+    monkeypatch.setattr(analysis_core, 'get_response_cache', lambda: cache)
+    monkeypatch.setattr(analysis_core, 'require_backend', lambda: None)
+
+    def get_llm_response(prompt_template, served=None, title=None, **kwargs):
+        served['model'] = 'model-a'
+        return f"### {title}"
+    monkeypatch.setattr(analysis_core, 'get_llm_response', get_llm_response)
+    monkeypatch.setattr(analysis_core, 'routed_model', lambda task, tokens: 'model-a')
+    return cache
+
+
+def test_fresh_sections_are_not_cached(cache):
+    results = list(analysis_core.iter_analysis_sections("def f():\n    return 1\n", use_cache=False))
+    assert all(result.text for result in results)
+    assert cache.stats()['disk_entries'] == 0
+
+
+def test_sections_are_cached_by_default(cache):
+    code = "def f():\n    return 1\n"
+    list(analysis_core.iter_analysis_sections(code))
+    assert cache.stats()['disk_entries'] == len(analysis_core.ANALYSIS_SECTIONS)
+    assert all(result.cached for result in analysis_core.iter_analysis_sections(code))
@@ -0,0 +1,30 @@
+from session_store import SessionStore
+
+
+def test_stats_track_row_counts(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.sqlite3'))
+    store.create('a')
+    store.create('a')
+    store.create('b')
+    for i in range(3):
+        store.append_message('a', 'user', f"message {i}")
+    store.append_message('b', 'user', "hello")
+    store.clear('a')
+    stats = store.stats()
+    assert stats['stored_sessions'] == 2
+    assert stats['stored_messages'] == 1
+
+    reopened = SessionStore(store.path).stats()
+    assert reopened['stored_sessions'] == 2
+    assert reopened['stored_messages'] == 1
+
+
+def test_expired_sessions_leave_the_counts(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    store = SessionStore(path)
+    store.create('a')
+    store.append_message('a', 'user', "hello")
+    stats = SessionStore(path, ttl_seconds=-1).stats()
+    assert stats['stored_sessions'] == 0
+    assert stats['stored_messages'] == 0
+    assert stats['expired'] == 1
@@ -0,0 +1,59 @@
+import pytest
+
+from static_analysis import build_index, answer_structural_question
+
+
+CODE = '''
+import os
+
+
+def parse(text):
+    if not text:
+        return None
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+    return helper(text)
+
+
+def helper(text):
+    return os.path.basename(text)
+
+
+def main():
+    print(parse("x"))
+'''
+
+
+@pytest.fixture(scope='module')
+def index():
+    return build_index(CODE)
+
+
+@pytest.mark.parametrize('question', [
+    "How many functions call parse?",
+    "how many lines does parse have",
+    "How can I reduce the cyclomatic complexity of parse?",
+    "What function calls are made in main?",
+    "Which functions call something_undefined?",
+    "What does nothing_here call?",
+    "What is the complexity of the code?",
+    "Can you list the functions that could be faster?",
+    "Show me how to make the most complex function simpler",
+])
+def test_open_questions_go_to_the_llm(index, question):
+    assert answer_structural_question(question, index) is None
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("How many functions are there?", "**3** functions"),
+    ("how many lines of code", "lines:"),
+    ("Who calls helper?", "Callers of `helper`"),
+    ("Which functions call `parse`?", "- `main`"),
+    ("What does parse call?", "`parse` calls"),
+    ("List all the functions in this file.", "Functions:"),
+    ("What is the cyclomatic complexity of parse?", "`parse` has a cyclomatic complexity"),
+    ("Which are the most complex functions?", "Most complex functions"),
+])
+def test_structural_questions_are_answered_locally(index, question, expected):
+    assert expected in answer_structural_question(question, index)